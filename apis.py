@@ -9,14 +9,109 @@ It allows DBA's to:
         - discount
         - inventory
 
+Every operation comes in two layers:
+    - a non-interactive function (add_*, find_*, change_*, remove_*, increment_inventory) that
+      takes its values as arguments, returns its result and leaves commit/rollback to the caller
+    - the interactive function used by main.py (enter_*, search_*, update_*, delete_*, ...)
+      that prompts with input() and prints the result
+
+Member, staff and store lookups by ID or email are served from the shared lookup cache
+(cache.py); every function here that changes those rows tells the cache first.
+
+The logic of the non-interactive writes lives in operations.py, shared with async_apis.py;
+the functions here run it on the caller's cursor.
+
 '''
 
+import os
+
 import mysql.connector
 
+from cache import LOOKUP_CACHE, as_key
+import operations
+from operations import run
+from queries import (
+    STORE_BY_ID, MEMBER_BY_ID, MEMBER_BY_EMAIL, STAFF_BY_ID, STAFF_BY_EMAIL,
+    STORE_SEARCH, MEMBER_SEARCH, STAFF_SEARCH, store_filter_query, keyset_query
+)
+from pricing import PRICE_CACHE, DISCOUNT_FACTOR, FINAL_PRICES, transaction_totals
+from export import export_report
+from reports import REPORTS, print_report, print_bundle, run_report_bundle
+from rewards import print_preview, print_summary, run_rewards
+from streaming import print_query
+
 # ------ Start of information processing ------
 
+# ------ Paginated search ------
+
+# Rows per page of the search_*_page functions (MUSKIECO_PAGE_SIZE); at most queries.MAX_PAGE_SIZE
+SEARCH_PAGE_SIZE = int(os.environ.get("MUSKIECO_PAGE_SIZE", 20))
+
+
+def _keyset_page(cursor, search, text, match, after, page_size):
+    '''
+    Runs one page of a keyset paginated search (see queries.keyset_query)
+
+    Returns:
+        Tuple (rows, next_after); next_after is None on the last page
+    '''
+    query, params = keyset_query(*search, text, match, after, page_size)
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    return rows, (rows[-1][0] if len(rows) == params[-1] else None)
+
+
+def _browse(fetch_page, formatter, empty_message):
+    '''
+    Prints search results page by page, asking before fetching the next one
+
+    Parameters:
+        fetch_page - Function taking the after key and returning (rows, next_after)
+        formatter - Function turning a row into a printable line
+        empty_message - Printed when nothing matches
+    '''
+    after = None
+    shown = 0
+    while True:
+        rows, after = fetch_page(after)
+        for row in rows:
+            print(formatter(row))
+        shown += len(rows)
+        if shown == 0:
+            print(empty_message)
+        if after is None:
+            return
+        if input("Enter for the next page, q to stop: ").strip().lower() == "q":
+            return
+
+
+def _search_text(text):
+    '''
+    Splits interactive search input into (text, match); a leading * matches anywhere
+    '''
+    if text.startswith("*"):
+        return text[1:], "contains"
+    return text, "prefix"
+
+
 # ------ Store info ------
 
+def add_store(cursor, store_addr, phone):
+    '''
+    Inserts a store and its address (no commit)
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        store_addr - Store address
+        phone - Store phone number
+        
+    Returns:
+        The new (StoreID, StoreAddr, Phone) row
+    '''
+    
+    return run(cursor, operations.add_store(store_addr, phone))
+
+
 def enter_store(cursor):
     '''
     Inserts a new store into the database with address and phone number
@@ -35,31 +130,13 @@ def enter_store(cursor):
         # START TRANSACTION — begins the block of ops
         cursor.execute("START TRANSACTION")
 
-        # Insert into StoreAddress
-        cursor.execute(
-            "INSERT INTO StoreAddress (StoreAddr, Phone) VALUES (%s, %s)",
-            (store_addr, phone)
-        )
-
-        # Insert into Store
-        cursor.execute(
-            "INSERT INTO Store (StoreAddr) VALUES (%s)",
-            (store_addr,)
-        )
+        result = add_store(cursor, store_addr, phone)
 
         # COMMIT — both operations succeeded, so we save the changes permanently
         cursor.execute("COMMIT")
         print("Store added successfully.")
 
         # Show the inserted record
-        cursor.execute("""
-            SELECT Store.StoreID, Store.StoreAddr, StoreAddress.Phone
-            FROM Store
-            JOIN StoreAddress ON Store.StoreAddr = StoreAddress.StoreAddr
-            WHERE Store.StoreAddr = %s
-            ORDER BY StoreID DESC LIMIT 1
-        """, (store_addr,))
-        result = cursor.fetchone()
         print("New Store Record:", result)
 
     except mysql.connector.Error as e:
@@ -69,12 +146,69 @@ def enter_store(cursor):
         print(f"MySQL Error: {e}")
 
 
+def find_store(cursor, store_id):
+    '''
+    Looks up one store by StoreID (through the lookup cache)
+    
+    Returns:
+        The (StoreID, StoreAddr, Phone) row, or None if there is no match
+    '''
+    
+    store_id = as_key(store_id)
+    if store_id is None:
+        return None
+
+    def load():
+        cursor.execute(STORE_BY_ID, (store_id,))
+        return cursor.fetchone()
+    return LOOKUP_CACHE.lookup("store", load, key=store_id)
+
+
+def find_stores(cursor, store_id=None, store_addr=None):
+    '''
+    Returns the stores matching a StoreID and/or address (all stores when both are empty)
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        store_id - Optional StoreID
+        store_addr - Optional exact store address
+        
+    Returns:
+        List of (StoreID, StoreAddr, Phone) rows
+    '''
+    
+    if store_id and not store_addr:
+        row = find_store(cursor, store_id)
+        return [row] if row else []
+    cursor.execute(*store_filter_query(store_id, store_addr))
+    return cursor.fetchall()
+
+
+def search_stores_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    '''
+    Returns one page of stores whose address starts with (or contains) text, ordered by StoreID
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        text - Address prefix, or part of it with match="contains"; empty lists every store
+        after - StoreID of the last row of the previous page (None for the first page)
+        page_size - Rows per page
+        match - "prefix" or "contains"
+        
+    Returns:
+        Tuple (rows, next_after); pass next_after back in for the next page (None on the last one)
+    '''
+    
+    return _keyset_page(cursor, STORE_SEARCH, text, match, after, page_size)
 
 
 def search_store(cursor):
     '''
     Searches for store(s) by StoreID or Store Address
     
+    A StoreID is looked up directly; an address (or its beginning, or *part of it) or no input
+    at all lists the matching stores a page at a time
+    
     Parameters:
         cursor - Active MySQL cursor
         
@@ -85,23 +219,44 @@ def search_store(cursor):
     store_id = input("Enter Store ID (or press Enter to skip): ").strip()
     store_addr = input("Enter Store Address (or press Enter to skip): ").strip()
 
-    query = """SELECT Store.StoreID, Store.StoreAddr, StoreAddress.Phone 
-               FROM Store JOIN StoreAddress ON Store.StoreAddr = StoreAddress.StoreAddr WHERE 1=1"""
-    params = []
-    if store_id:
-        query += " AND Store.StoreID = %s"
-        params.append(store_id)
-    if store_addr:
-        query += " AND Store.StoreAddr = %s"
-        params.append(store_addr)
-
-    cursor.execute(query, tuple(params))
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"StoreID: {row[0]}, Address: {row[1]}, Phone: {row[2]}")
-    else:
-        print("No store found.")
+    if not store_id:
+        text, match = _search_text(store_addr)
+        _browse(lambda after: search_stores_page(cursor, text, after, match=match),
+                lambda row: f"StoreID: {row[0]}, Address: {row[1]}, Phone: {row[2]}",
+                "No store found.")
+        return
+
+    if not store_addr:
+        row = find_store(cursor, store_id)
+        print(f"StoreID: {row[0]}, Address: {row[1]}, Phone: {row[2]}" if row else "No store found.")
+        return
+
+    query, params = store_filter_query(store_id, store_addr)
+    print_query(cursor, query, params,
+        formatter=lambda row: f"StoreID: {row[0]}, Address: {row[1]}, Phone: {row[2]}",
+        empty_message="No store found.")
+
+
+def change_store(cursor, store_id, new_addr=None, new_phone=None):
+    '''
+    Changes the address and/or phone number of a store (no commit)
+    
+    A new address gets its own StoreAddress row (keeping the old phone unless a new one is
+    given); the old address row is removed once no store uses it
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        store_id - StoreID to change
+        new_addr - New address, or None/empty to keep the current one
+        new_phone - New phone number, or None/empty to keep the current one
+        
+    Returns:
+        Tuple (status, row). status is one of "not_found", "address_exists", "unchanged",
+        "address_updated", "address_updated_old_removed", "phone_updated"; row is the
+        updated (StoreID, StoreAddr, Phone) or None
+    '''
+    
+    return run(cursor, operations.change_store(store_id, new_addr, new_phone))
 
 
 def update_store(cursor):
@@ -117,64 +272,59 @@ def update_store(cursor):
     
     store_id = input("Enter the Store ID to update: ").strip()
 
-    cursor.execute("SELECT StoreAddr FROM Store WHERE StoreID = %s", (store_id,))
-    result = cursor.fetchone()
+    result = find_store(cursor, store_id)
 
     if not result:
         print("No store found with that ID.")
         return
 
-    current_addr = result[0]
+    current_addr = result[1]
     print(f"Current address: {current_addr}")
 
     new_addr = input("Enter new store address (or press Enter to keep current): ").strip()
     new_phone = input("Enter new phone number (or press Enter to keep current): ").strip()
 
     try:
-        address_changed = new_addr and new_addr != current_addr
-        phone_changed = bool(new_phone)
-
-        if address_changed:
-            cursor.execute("SELECT 1 FROM StoreAddress WHERE StoreAddr = %s", (new_addr,))
-            if cursor.fetchone():
-                print("That address already exists. Please update the phone separately if needed.")
-                return
-
-            if not phone_changed:
-                cursor.execute("SELECT Phone FROM StoreAddress WHERE StoreAddr = %s", (current_addr,))
-                phone_row = cursor.fetchone()
-                new_phone = phone_row[0] if phone_row else "000-000-0000"
-
-            cursor.execute("INSERT INTO StoreAddress (StoreAddr, Phone) VALUES (%s, %s)", (new_addr, new_phone))
-            cursor.execute("UPDATE Store SET StoreAddr = %s WHERE StoreID = %s", (new_addr, store_id))
-            print("Store address updated.")
-
-            cursor.execute("SELECT COUNT(*) FROM Store WHERE StoreAddr = %s", (current_addr,))
-            if cursor.fetchone()[0] == 0:
-                cursor.execute("DELETE FROM StoreAddress WHERE StoreAddr = %s", (current_addr,))
-                print("Old address deleted (no longer used).")
+        status, updated = change_store(cursor, store_id, new_addr, new_phone)
 
-        elif phone_changed:
-            cursor.execute("UPDATE StoreAddress SET Phone = %s WHERE StoreAddr = %s", (new_phone, current_addr))
-            print("Phone number updated.")
-        else:
+        if status == "not_found":
+            print("No store found with that ID.")
+            return
+        if status == "address_exists":
+            print("That address already exists. Please update the phone separately if needed.")
+            return
+        if status == "unchanged":
             print("No changes made.")
             return
 
+        if status.startswith("address_updated"):
+            print("Store address updated.")
+        if status == "address_updated_old_removed":
+            print("Old address deleted (no longer used).")
+        if status == "phone_updated":
+            print("Phone number updated.")
+
         # show the updated row
-        cursor.execute("""
-            SELECT Store.StoreID, Store.StoreAddr, StoreAddress.Phone
-            FROM Store
-            JOIN StoreAddress ON Store.StoreAddr = StoreAddress.StoreAddr
-            WHERE Store.StoreID = %s
-        """, (store_id,))
-        updated = cursor.fetchone()
         print("Updated Store Record:", updated)
 
     except mysql.connector.Error as e:
         print(f"Update failed: {e}")
 
 
+def remove_store(cursor, store_id):
+    '''
+    Deletes a store and its address (no commit)
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        store_id - StoreID to delete
+        
+    Returns:
+        True if the store existed, else False
+    '''
+    
+    return run(cursor, operations.remove_store(store_id))
+
 
 def delete_store(cursor):
     '''
@@ -191,24 +341,30 @@ def delete_store(cursor):
     store_id = input("Enter Store ID to delete: ").strip()
 
     try:
-        cursor.execute("SELECT StoreAddr FROM Store WHERE StoreID = %s", (store_id,))
-        result = cursor.fetchone()
-
-        if not result:
+        if remove_store(cursor, store_id):
+            print("Store and its address deleted successfully.")
+        else:
             print("No store found with that ID.")
-            return
-
-        store_addr = result[0]
-
-        cursor.execute("DELETE FROM Store WHERE StoreID = %s", (store_id,))
-        cursor.execute("DELETE FROM StoreAddress WHERE StoreAddr = %s", (store_addr,))
-        print("Store and its address deleted successfully.")
     except mysql.connector.Error as e:
         print(f"Error deleting store: {e}")
 
 
 # ------ Member info ------
 
+def add_member(cursor, customer_id, email, home_addr, active, reward_points, staff_id):
+    '''
+    Inserts a member into CustomerEmail and MemberInfo (no commit)
+    
+    The customer name is taken from the part of the email before the @
+    
+    Returns:
+        The new member row (CustomerID, Email, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints)
+    '''
+    
+    run(cursor, operations.add_member(customer_id, email, home_addr, active, reward_points, staff_id))
+    return find_member(cursor, customer_id=customer_id)
+
+
 def enter_member(cursor):
     '''
     This function inserts a new member with contact and account details
@@ -229,28 +385,63 @@ def enter_member(cursor):
     staff_id = int(input("Staff ID sending notice: "))
 
     try:
-        cursor.execute("INSERT INTO CustomerEmail (Email, CustomerName, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints) VALUES (%s, %s, %s, %s, %s, %s)",
-                       (email, email.split("@")[0], home_addr, active, staff_id, reward_points))
-        cursor.execute("INSERT INTO MemberInfo (CustomerID, Email) VALUES (%s, %s)", (customer_id, email))
+        record = add_member(cursor, customer_id, email, home_addr, active, reward_points, staff_id)
         print("Member entered successfully.")
 
         # Show the new member record
-        cursor.execute("""
-            SELECT CustomerID, Email, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints
-            FROM CustomerEmail JOIN MemberInfo USING(Email)
-            WHERE CustomerID = %s
-        """, (customer_id,))
-        print("New Member Record:", cursor.fetchone())
+        print("New Member Record:", record)
 
     except mysql.connector.Error as e:
         print("Error entering member:", e)
 
 
+def find_member(cursor, customer_id=None, email=None):
+    '''
+    Looks up a member by CustomerID or Email (through the lookup cache)
+    
+    Returns:
+        The member row, or None if there is no match
+    '''
+    
+    if customer_id is not None:
+        customer_id = int(customer_id)
+        query, params = MEMBER_BY_ID, (customer_id,)
+    else:
+        query, params = MEMBER_BY_EMAIL, (email,)
+
+    def load():
+        cursor.execute(query, params)
+        return cursor.fetchone()
+    return LOOKUP_CACHE.lookup("member", load, key=customer_id, alias=email)
+
+
+def search_members_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    '''
+    Returns one page of members whose name, email or home address starts with (or contains)
+    text, ordered by CustomerID
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        text - Search text; empty lists every member
+        after - CustomerID of the last row of the previous page (None for the first page)
+        page_size - Rows per page
+        match - "prefix" or "contains"
+        
+    Returns:
+        Tuple (rows, next_after) with rows shaped like find_member's
+    '''
+    
+    return _keyset_page(cursor, MEMBER_SEARCH, text, match, after, page_size)
+
 
 def search_member(cursor):
     '''
     This function searches for a member using CustomerID or Email
     
+    Anything that is not a CustomerID or an exact email is searched for as the beginning
+    (or, with a leading *, any part) of a name, email or address, a page at a time;
+    empty input browses every member
+    
     Parameters:
         cursor - Active MySQL cursor
     
@@ -258,17 +449,31 @@ def search_member(cursor):
         None
         
     '''
-    query = """SELECT CustomerID, Email, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints 
-               FROM CustomerEmail JOIN MemberInfo USING(Email)"""
-    param = input("Enter CustomerID or Email: ").strip()
+    param = input("Enter CustomerID or Email (or the start of a name/email/address, *text to match anywhere, Enter to browse): ").strip()
     if param.isdigit():
-        cursor.execute(query + " WHERE CustomerID = %s", (int(param),))
+        result = find_member(cursor, customer_id=int(param))
     else:
-        cursor.execute(query + " WHERE Email = %s", (param,))
-    result = cursor.fetchone()
+        result = find_member(cursor, email=param) if param and not param.startswith("*") else None
+        if result is None:
+            text, match = _search_text(param)
+            _browse(lambda after: search_members_page(cursor, text, after, match=match),
+                    lambda row: f"Member Info: {row}", "No member found.")
+            return
     print("Member Info:", result if result else "No member found.")
 
 
+def change_member(cursor, customer_id, home_addr, active, reward_points, staff_id):
+    '''
+    Updates a member's address, status, reward points and notifying staff member (no commit)
+    
+    Returns:
+        The updated member row, or None if no member has that CustomerID
+    '''
+    
+    email = run(cursor, operations.change_member(customer_id, home_addr, active, reward_points, staff_id))
+    return find_member(cursor, email=email) if email else None
+
+
 def update_member(cursor):
     '''
     This function updates member details using address, status, rewards, and staffID
@@ -281,32 +486,36 @@ def update_member(cursor):
     '''
     customer_id = int(input("CustomerID to update: "))
 
-    cursor.execute("SELECT Email FROM MemberInfo WHERE CustomerID = %s", (customer_id,))
-    result = cursor.fetchone()
+    result = find_member(cursor, customer_id=customer_id)
 
     if not result:
         print("No member found with that CustomerID.")
         return
 
-    email = result[0]
     home_addr = input("New Home Address: ")
     active = input("Active? (yes/no): ").lower() == "yes"
     reward_points = int(input("New Rewards Points: "))
     staff_id = int(input("New Staff ID sending notice: "))
 
     try:
-        cursor.execute("""UPDATE CustomerEmail 
-                          SET HomeAddr = %s, ActivateStatus = %s, StaffIDSendsNotice = %s, RewardPoints = %s
-                          WHERE Email = %s""", (home_addr, active, staff_id, reward_points, email))
-        cursor.execute("""SELECT CustomerID, Email, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints
-                          FROM CustomerEmail JOIN MemberInfo USING(Email)
-                          WHERE Email = %s""", (email,))
-        print("Updated Member Record:", cursor.fetchone())
+        updated = change_member(cursor, customer_id, home_addr, active, reward_points, staff_id)
+        print("Updated Member Record:", updated)
 
     except mysql.connector.Error as e:
         print(f"Update failed: {e}")
 
 
+def remove_member(cursor, customer_id=None, email=None):
+    '''
+    Deletes a member by CustomerID (MemberInfo only) or Email (MemberInfo and CustomerEmail), no commit
+    
+    Returns:
+        Number of MemberInfo rows deleted
+    '''
+    
+    return run(cursor, operations.remove_member(customer_id, email))
+
+
 def delete_member(cursor):
     '''
     Deletes a member record based on CustomerID or Email
@@ -320,10 +529,9 @@ def delete_member(cursor):
     param = input("Enter CustomerID or Email to delete: ").strip()
     try:
         if param.isdigit():
-            cursor.execute("DELETE FROM MemberInfo WHERE CustomerID = %s", (int(param),))
+            remove_member(cursor, customer_id=int(param))
         else:
-            cursor.execute("DELETE FROM MemberInfo WHERE Email = %s", (param,))
-            cursor.execute("DELETE FROM CustomerEmail WHERE Email = %s", (param,))
+            remove_member(cursor, email=param)
         print("Member deleted.")
     except mysql.connector.Error as e:
         print("Delete failed:", e)
@@ -331,6 +539,17 @@ def delete_member(cursor):
 
 # ------ Staff info ------
 
+def add_staff(cursor, staff_id, name, age, home_addr, job_title, email, employed_on, signups):
+    '''
+    Inserts a staff member into StaffEmails and StaffInfo (no commit)
+    
+    Returns:
+        None
+    '''
+    
+    run(cursor, operations.add_staff(staff_id, name, age, home_addr, job_title, email, employed_on, signups))
+
+
 def enter_staff(cursor):
     '''
     Inserts a new staff member's details into the StaffEmails and StaffInfo tables
@@ -356,16 +575,51 @@ def enter_staff(cursor):
     signups = int(input("# of Sign-Ups: "))
 
     try:
-        cursor.execute("""INSERT INTO StaffEmails (StaffIDHasStore, StaffName, Age, HomeAddr, 
-                          JobTitle, Email, TimeOfEmployment, NumberOfSignUps) 
-                          VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
-                       (staff_id, name, age, addr, job, email, date, signups))
-        cursor.execute("INSERT INTO StaffInfo (StaffID, Email) VALUES (%s, %s)", (staff_id, email))
+        add_staff(cursor, staff_id, name, age, addr, job, email, date, signups)
         print("Staff entered.")
     except mysql.connector.Error as e:
         print("Insert failed:", e)
 
 
+def find_staff(cursor, staff_id=None, email=None):
+    '''
+    Looks up a staff member by StaffID or Email (through the lookup cache)
+    
+    Returns:
+        The staff row, or None if there is no match
+    '''
+    
+    if staff_id is not None:
+        staff_id = int(staff_id)
+        query, params = STAFF_BY_ID, (staff_id,)
+    else:
+        query, params = STAFF_BY_EMAIL, (email,)
+
+    def load():
+        cursor.execute(query, params)
+        return cursor.fetchone()
+    return LOOKUP_CACHE.lookup("staff", load, key=staff_id, alias=email)
+
+
+def search_staff_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    '''
+    Returns one page of staff whose name, email or home address starts with (or contains)
+    text, ordered by StaffID
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        text - Search text; empty lists all staff
+        after - StaffID of the last row of the previous page (None for the first page)
+        page_size - Rows per page
+        match - "prefix" or "contains"
+        
+    Returns:
+        Tuple (rows, next_after) with rows shaped like find_staff's
+    '''
+    
+    return _keyset_page(cursor, STAFF_SEARCH, text, match, after, page_size)
+
+
 def search_staff(cursor):
     '''
     Searches for a staff member by StaffID or Email
@@ -373,20 +627,35 @@ def search_staff(cursor):
     Joins StaffEmails and StaffInfo on Email to retrieve staff details
     Displays the staff information if found, otherwise indicates no match
     
+    Other input is searched for as the beginning (or, with a leading *, any part) of a name,
+    email or address, a page at a time; empty input browses all staff
+    
     '''
-    param = input("Enter StaffID or Email: ").strip()
-    query = """SELECT StaffID, StaffIDHasStore, StaffName, Age, HomeAddr, 
-               JobTitle, Email, TimeOfEmployment, NumberOfSignUps 
-               FROM StaffEmails JOIN StaffInfo USING(Email)"""
+    param = input("Enter StaffID or Email (or the start of a name/email/address, *text to match anywhere, Enter to browse): ").strip()
 
     if param.isdigit():
-        cursor.execute(query + " WHERE StaffID = %s", (int(param),))
+        result = find_staff(cursor, staff_id=int(param))
     else:
-        cursor.execute(query + " WHERE Email = %s", (param,))
-    result = cursor.fetchone()
+        result = find_staff(cursor, email=param) if param and not param.startswith("*") else None
+        if result is None:
+            text, match = _search_text(param)
+            _browse(lambda after: search_staff_page(cursor, text, after, match=match),
+                    lambda row: f"Staff info: {row}", "No match.")
+            return
     print("Staff info:", result if result else "No match.")
 
 
+def change_staff(cursor, email, staff_id, name, age, home_addr, job_title, employed_on, signups):
+    '''
+    Updates the StaffEmails row of the staff member with the given email (no commit)
+    
+    Returns:
+        Number of rows updated
+    '''
+    
+    return run(cursor, operations.change_staff(email, staff_id, name, age, home_addr, job_title, employed_on, signups))
+
+
 def update_staff(cursor):
     '''
     Updates the details of an existing staff member in the StaffEmails table
@@ -408,16 +677,23 @@ def update_staff(cursor):
     signups = int(input("New # of Sign-Ups: "))
 
     try:
-        cursor.execute("""UPDATE StaffEmails 
-                          SET StaffIDHasStore=%s, StaffName=%s, Age=%s, HomeAddr=%s, 
-                          JobTitle=%s, TimeOfEmployment=%s, NumberOfSignUps=%s 
-                          WHERE Email=%s""",
-                       (staff_id, name, age, addr, job, date, signups, email))
+        change_staff(cursor, email, staff_id, name, age, addr, job, date, signups)
         print("Staff updated.")
     except mysql.connector.Error as e:
         print("Update failed:", e)
 
 
+def remove_staff(cursor, staff_id=None, email=None):
+    '''
+    Deletes a staff member by StaffID (StaffInfo only) or Email (StaffInfo and StaffEmails), no commit
+    
+    Returns:
+        Number of StaffInfo rows deleted
+    '''
+    
+    return run(cursor, operations.remove_staff(staff_id, email))
+
+
 def delete_staff(cursor):
     '''
     Deletes a staff member from StaffInfo and optionally StaffEmails
@@ -432,10 +708,9 @@ def delete_staff(cursor):
     param = input("Enter StaffID or Email to delete: ").strip()
     try:
         if param.isdigit():
-            cursor.execute("DELETE FROM StaffInfo WHERE StaffID = %s", (int(param),))
+            remove_staff(cursor, staff_id=int(param))
         else:
-            cursor.execute("DELETE FROM StaffInfo WHERE Email = %s", (param,))
-            cursor.execute("DELETE FROM StaffEmails WHERE Email = %s", (param,))
+            remove_staff(cursor, email=param)
         print("Staff deleted.")
     except mysql.connector.Error as e:
         print("Delete failed:", e)
@@ -443,6 +718,18 @@ def delete_staff(cursor):
 
 # ------ Discount info ------
 
+# Discount writers drop the cached price list; the interactive versions commit first
+# so the next reload cannot see the old discount
+
+def add_discount(cursor, product_id, description, valid_date):
+    '''
+    Inserts a discount into DiscountInfo (no commit)
+    '''
+    
+    run(cursor, operations.add_discount(product_id, description, valid_date))
+    PRICE_CACHE.invalidate()
+
+
 def enter_discount(cursor):
     '''
     Inserts a new discount into the DiscountInfo table
@@ -459,13 +746,22 @@ def enter_discount(cursor):
     valid_date = input("Valid Until (YYYY-MM-DD): ")
 
     try:
-        cursor.execute("INSERT INTO DiscountInfo (DiscountDesc, ValidDate, ProductID) VALUES (%s, %s, %s)",
-                       (desc, valid_date, product_id))
+        add_discount(cursor, product_id, desc, valid_date)
+        cursor.execute("COMMIT")
+        PRICE_CACHE.invalidate()
         print("Discount added.")
     except mysql.connector.Error as e:
         print("Insert failed:", e)
 
 
+def find_discount(cursor, product_id):
+    '''
+    Returns the first DiscountInfo row for a product, or None
+    '''
+    
+    return run(cursor, operations.find_discount(product_id))
+
+
 def search_discount(cursor):
     '''
     Searches for a discount by ProductID
@@ -475,11 +771,23 @@ def search_discount(cursor):
     '''
     
     product_id = int(input("Enter Product ID: "))
-    cursor.execute("SELECT * FROM DiscountInfo WHERE ProductID = %s", (product_id,))
-    result = cursor.fetchone()
+    result = find_discount(cursor, product_id)
     print("Discount Info:", result if result else "No discount found.")
 
 
+def change_discount(cursor, product_id, description, valid_date):
+    '''
+    Updates the description and valid date of a product's discounts (no commit)
+    
+    Returns:
+        Number of rows updated
+    '''
+    
+    updated = run(cursor, operations.change_discount(product_id, description, valid_date))
+    PRICE_CACHE.invalidate()
+    return updated
+
+
 def update_discount(cursor):
     '''
     Updates the description and valid date of a discount for a given ProductID
@@ -496,13 +804,27 @@ def update_discount(cursor):
     valid_date = input("New Valid Date (YYYY-MM-DD): ")
 
     try:
-        cursor.execute("UPDATE DiscountInfo SET DiscountDesc = %s, ValidDate = %s WHERE ProductID = %s",
-                       (desc, valid_date, product_id))
+        change_discount(cursor, product_id, desc, valid_date)
+        cursor.execute("COMMIT")
+        PRICE_CACHE.invalidate()
         print("Discount updated.")
     except mysql.connector.Error as e:
         print("Update failed:", e)
 
 
+def remove_discount(cursor, product_id):
+    '''
+    Deletes the discounts of a product (no commit)
+    
+    Returns:
+        Number of rows deleted
+    '''
+    
+    deleted = run(cursor, operations.remove_discount(product_id))
+    PRICE_CACHE.invalidate()
+    return deleted
+
+
 def delete_discount(cursor):
     '''
     Deletes a discount record for a specific Product ID from the DiscountInfo table
@@ -515,7 +837,9 @@ def delete_discount(cursor):
     
     product_id = int(input("Enter Product ID to delete discount for: "))
     try:
-        cursor.execute("DELETE FROM DiscountInfo WHERE ProductID = %s", (product_id,))
+        remove_discount(cursor, product_id)
+        cursor.execute("COMMIT")
+        PRICE_CACHE.invalidate()
         print("Discount deleted.")
     except mysql.connector.Error as e:
         print("Delete failed:", e)
@@ -523,6 +847,62 @@ def delete_discount(cursor):
 
 # ------ Inventory Records ------
 
+# Refuse single-row updates that would take InstockQuantity below zero
+NON_NEGATIVE_STOCK = False
+
+
+def increment_inventory(cursor, product_id, store_id, quantity, non_negative=NON_NEGATIVE_STOCK):
+    '''
+    Atomically adds quantity to the stock of a product at a store, inside the caller's transaction
+    
+    The increment happens inside MySQL (InstockQuantity = InstockQuantity + delta), so
+    concurrent updates to the same product/store can never overwrite each other
+    
+    - If the product-store exists, it increments the quantity
+    - If not, creates a new record in the ProductQuantity table
+    - With non_negative, a decrement that would leave less than 0 in stock is refused
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        product_id - Product ID
+        store_id - Store ID
+        quantity - Amount to add (negative to remove)
+        non_negative - Refuse updates that would make the stock negative
+        
+    Returns:
+        Tuple (status, new quantity) where status is "inserted", "updated" or "refused";
+        new quantity is None when refused (nothing was changed)
+    '''
+    
+    return run(cursor, operations.increment_inventory(product_id, store_id, quantity, non_negative))
+
+
+def apply_inventory_delta(cursor, product_id, store_id, quantity, non_negative=NON_NEGATIVE_STOCK):
+    '''
+    Runs increment_inventory in its own transaction and commits it
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        product_id - Product ID
+        store_id - Store ID
+        quantity - Amount to add (negative to remove)
+        non_negative - Refuse updates that would make the stock negative
+        
+    Returns:
+        Tuple (status, new quantity), see increment_inventory
+    '''
+    
+    cursor.execute("START TRANSACTION")
+    try:
+        status, new_qty = increment_inventory(cursor, product_id, store_id, quantity, non_negative)
+        cursor.execute("COMMIT" if status != "refused" else "ROLLBACK")
+        return status, new_qty
+
+    except mysql.connector.Error:
+        cursor.execute("ROLLBACK")
+        raise
+
+
 def update_inventory(cursor):
     '''
     Updates the inventory quantity for a given Product ID and Store ID
@@ -539,109 +919,113 @@ def update_inventory(cursor):
     store_id = int(input("Enter Store ID: "))
     quantity = int(input("Enter quantity to add or return: "))
 
-    cursor.execute("SELECT InstockQuantity FROM ProductQuantity WHERE ProductID = %s AND StoreID = %s",
-                   (product_id, store_id))
-    result = cursor.fetchone()
-    if result:
-        new_qty = result[0] + quantity
-        cursor.execute("UPDATE ProductQuantity SET InstockQuantity = %s WHERE ProductID = %s AND StoreID = %s",
-                       (new_qty, product_id, store_id))
-        print("Inventory updated.")
-    else:
-        cursor.execute("INSERT INTO ProductQuantity (ProductID, StoreID, InstockQuantity) VALUES (%s, %s, %s)",
-                       (product_id, store_id, quantity))
+    try:
+        status, new_qty = apply_inventory_delta(cursor, product_id, store_id, quantity)
+    except mysql.connector.Error as e:
+        print(f"Inventory update failed: {e}")
+        return
+
+    if status == "inserted":
         print("New inventory record added.")
+    elif status == "updated":
+        print(f"Inventory updated. In stock: {new_qty}")
+    else:
+        print("Not enough stock for that change; inventory left unchanged.")
 
 
 # ------ Maintaining Transactions ------
 def view_customer_rewards(cursor):
-    cursor.execute("""
-        SELECT CE.CustomerName, CE.Email, CE.RewardPoints
-        FROM CustomerEmail CE
-        JOIN MemberInfo MI ON CE.Email = MI.Email
-        WHERE CE.RewardPoints > 0;
-    """)
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"Name: {row[0]}, Email: {row[1]}, Reward Points: {row[2]}")
-    else:
-        print("No customers with reward points.")
+    # Preview only; reset_customer_rewards issues the notices (see rewards.py)
+    print_preview(cursor, "member")
 
 
 def reset_customer_rewards(cursor):
-    confirm = input("Reset all reward points to 0? (yes/no): ").strip().lower()
+    '''
+    Issues reward notices to every member with points and takes exactly the paid points off
+    their balance, in short committed chunks (see rewards.run_rewards)
+    '''
+    confirm = input("Issue reward notices and reset the points paid? (yes/no): ").strip().lower()
     if confirm == "yes":
-        cursor.execute("UPDATE CustomerEmail SET RewardPoints = 0 WHERE RewardPoints > 0;")
-        print("Customer reward points reset.")
+        print_summary(run_rewards(cursor, "member"), "member")
     else:
         print("Cancelled.")
 
 
 def view_staff_signups(cursor):
-    cursor.execute("""
-        SELECT SE.StaffName, SE.Email, SE.NumberOfSignUps,
-               (SE.NumberOfSignUps * 5) AS RewardAmount
-        FROM StaffEmails SE
-        WHERE SE.NumberOfSignUps > 0;
-    """)
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"Staff: {row[0]}, Email: {row[1]}, Sign-ups: {row[2]}, Reward: ${row[3]:.2f}")
-    else:
-        print("No staff with signups recorded.")
+    # Preview only; reset_staff_signups issues the checks (see rewards.py)
+    print_preview(cursor, "staff")
 
 
 def reset_staff_signups(cursor):
-    confirm = input("Reset all staff signups to 0? (yes/no): ").strip().lower()
+    '''
+    Issues sign-up checks to every staff member with sign-ups and takes exactly the paid sign-ups
+    off their count, in short committed chunks (see rewards.run_rewards)
+    '''
+    confirm = input("Issue staff checks and reset the sign-ups paid? (yes/no): ").strip().lower()
     if confirm == "yes":
-        cursor.execute("UPDATE StaffEmails SET NumberOfSignUps = 0;")
-        print("Staff signup counts reset.")
+        print_summary(run_rewards(cursor, "staff"), "staff")
     else:
         print("Cancelled.")
 
 
 def view_product_prices(cursor):
-    cursor.execute("""
-        SELECT I.TransactionID, I.ProductID, MI.SellPrice
-        FROM Involves I
-        JOIN MerchandiseInfo MI ON I.ProductID = MI.ProductID;
-    """)
-
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"TransactionID: {row[0]}, ProductID: {row[1]}, Sell Price: ${row[2]:.2f}")
-    else:
-        print("No transaction data found.")
+    '''
+    Calculates the total price of one or more transactions
+    
+    Prompts for a comma-separated list of TransactionIDs and prints each transaction's
+    subtotal, discount and final total (computed in MySQL, one query per batch of IDs)
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        
+    Returns:
+        None
+    '''
+    
+    raw = input("Enter TransactionID(s), separated by commas: ").strip()
+    try:
+        transaction_ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        print("TransactionIDs must be numbers.")
+        return
+    if not transaction_ids:
+        print("No TransactionID entered.")
+        return
+
+    totals = transaction_totals(cursor, transaction_ids)
+    for transaction_id in transaction_ids:
+        if transaction_id in totals:
+            subtotal, discount, total = totals[transaction_id]
+            print(f"TransactionID: {transaction_id}, Subtotal: ${subtotal:.2f}, "
+                  f"Discount: ${discount:.2f}, Total: ${total:.2f}")
+        else:
+            print(f"TransactionID: {transaction_id}, no line items found.")
 
 
 def view_final_prices(cursor):
-    cursor.execute("""
-        SELECT I.TransactionID, I.ProductID, MI.SellPrice AS FinalPrice
-        FROM Involves I
-        JOIN MerchandiseInfo MI ON I.ProductID = MI.ProductID
-        WHERE I.ProductID NOT IN (SELECT ProductID FROM DiscountInfo)
-        UNION ALL
-        SELECT I.TransactionID, I.ProductID, MI.SellPrice * 0.9 AS FinalPrice
-        FROM Involves I
-        JOIN MerchandiseInfo MI ON I.ProductID = MI.ProductID
-        JOIN DiscountInfo D ON I.ProductID = D.ProductID;
-    """)
-    results = cursor.fetchall()
-    if results:
-        for row in results:
-            print(f"TransactionID: {row[0]}, ProductID: {row[1]}, Final Price: ${row[2]:.2f}")
-    else:
-        print("No final pricing data found.")
+    # One pass over Involves; products with several valid discount rows are discounted once
+    print_query(cursor, FINAL_PRICES, (DISCOUNT_FACTOR,),
+        formatter=lambda row: f"TransactionID: {row[0]}, ProductID: {row[1]}, Final Price: ${row[2]:.2f}",
+        empty_message="No final pricing data found.")
 
 
 
 
 
 # ------ Reports Info ------
-def generate_report(cursor):
+
+# Menu choice -> report name in reports.REPORTS
+REPORT_MENU = {
+    "1": "daily_sales",
+    "2": "monthly_sales",
+    "3": "yearly_sales",
+    "4": "store_inventory",
+    "5": "product_stock",
+    "6": "customer_spend",
+}
+
+
+def generate_report(cursor, pool=None):
     '''
     Generates business reports on sales performance and inventory levels.
     
@@ -652,93 +1036,65 @@ def generate_report(cursor):
     4. Store stock report
     5. Stock by Product ID
     6. Customer spend in date range
+    7. All of 1-4 and 6 at once, run concurrently (needs pool)
+    
+    Options 1-3 read the incrementally refreshed DailySalesRollup table (see rollups.py) and can be
+    limited to a date range and a single store
+    
+    Rows are streamed in bounded batches as they arrive (see streaming.py) rather than
+    fetched all at once, either to the screen or to a CSV/Arrow/Parquet file (see export.py)
+    
+    Parameters:
+        cursor - Active MySQL cursor
+        pool - ConnectionPool used by option 7 to give each report its own connection
     
     Returns:
         None
     '''
 
     print("\n--- Reports ---")
-    print("1. Daily Sales")
-    print("2. Monthly Sales")
-    print("3. Yearly Sales")
-    print("4. Store Inventory Report")
-    print("5. Stock by Product ID")
-    print("6. Customer Spend in Date Range")
+    for number, name in REPORT_MENU.items():
+        print(f"{number}. {REPORTS[name].title}")
+    print("7. All Reports (run in parallel)")
     
-    choice = input("Choose a report to view (1–6): ").strip()
+    choice = input("Choose a report to view (1–7): ").strip()
+    if choice == "7":
+        if pool is None:
+            print("Running all reports needs a connection pool.")
+            return
+        # Sales reports exclude their end date, customer spend includes it: each gets its own range
+        start = input("Sales from date (YYYY-MM-DD, blank for all history): ").strip()
+        end = input("Sales up to but not including date (YYYY-MM-DD, blank for no limit): ").strip()
+        spend = {"start": input("Customer spend start date (YYYY-MM-DD): ").strip(),
+                 "end": input("Customer spend end date, included (YYYY-MM-DD): ").strip()}
+        print_bundle(run_report_bundle(pool, start=start, end=end, overrides={"customer_spend": spend}))
+        return
+    if choice not in REPORT_MENU:
+        print("Invalid choice.")
+        return
 
-    try:
-        if choice == "1":
-            cursor.execute("""
-                SELECT PurchaseDate, SUM(TotalPrice) AS TotalSales
-                FROM TransactionInfo
-                GROUP BY PurchaseDate
-                ORDER BY PurchaseDate;
-            """)
-            for row in cursor.fetchall():
-                print(f"Date: {row[0]}, Sales: ${row[1]:.2f}")
-
-        elif choice == "2":
-            cursor.execute("""
-                SELECT YEAR(PurchaseDate) AS Year, MONTH(PurchaseDate) AS Month, SUM(TotalPrice) AS TotalSales
-                FROM TransactionInfo
-                GROUP BY YEAR(PurchaseDate), MONTH(PurchaseDate)
-                ORDER BY Year, Month;
-            """)
-            for row in cursor.fetchall():
-                print(f"{row[0]}-{row[1]:02}: ${row[2]:.2f}")
-
-        elif choice == "3":
-            cursor.execute("""
-                SELECT YEAR(PurchaseDate) AS Year, SUM(TotalPrice) AS TotalSales
-                FROM TransactionInfo
-                GROUP BY YEAR(PurchaseDate)
-                ORDER BY Year;
-            """)
-            for row in cursor.fetchall():
-                print(f"{row[0]}: ${row[1]:.2f}")
-
-        elif choice == "4":
-            cursor.execute("""
-                SELECT S.StoreID, S.StoreAddr, PQ.ProductID, MI.ProductName, PQ.InstockQuantity
-                FROM Store S
-                INNER JOIN ProductQuantity PQ ON S.StoreID = PQ.StoreID
-                INNER JOIN MerchandiseInfo MI ON PQ.ProductID = MI.ProductID
-                ORDER BY S.StoreID, MI.ProductName;
-            """)
-            for row in cursor.fetchall():
-                print(f"StoreID: {row[0]}, Addr: {row[1]}, ProductID: {row[2]}, Name: {row[3]}, InStock: {row[4]}")
-
-        elif choice == "5":
-            product_id = input("Enter Product ID to check: ").strip()
-            cursor.execute("""
-                SELECT PQ.ProductID, MI.ProductName, S.StoreID, S.StoreAddr, PQ.InstockQuantity
-                FROM ProductQuantity PQ
-                INNER JOIN MerchandiseInfo MI ON PQ.ProductID = MI.ProductID
-                INNER JOIN Store S ON PQ.StoreID = S.StoreID
-                WHERE MI.ProductID = %s;
-            """, (product_id,))
-            for row in cursor.fetchall():
-                print(f"ProductID: {row[0]}, Name: {row[1]}, StoreID: {row[2]}, Addr: {row[3]}, InStock: {row[4]}")
-
-        elif choice == "6":
-            start = input("Start date (YYYY-MM-DD): ").strip()
-            end = input("End date (YYYY-MM-DD): ").strip()
-            cursor.execute("""
-                SELECT C.CustomerID, CE.CustomerName, SUM(T.TotalPrice) AS TotalSpent
-                FROM CustomerIDs C
-                INNER JOIN TransactionInfo T ON C.CustomerID = T.CustomerIDHasATransaction
-                INNER JOIN MemberInfo M ON C.CustomerID = M.CustomerID
-                INNER JOIN CustomerEmail CE ON M.Email = CE.Email
-                WHERE T.PurchaseDate BETWEEN %s AND %s
-                GROUP BY C.CustomerID, CE.CustomerName
-                ORDER BY TotalSpent DESC;
-            """, (start, end))
-            for row in cursor.fetchall():
-                print(f"CustomerID: {row[0]}, Name: {row[1]}, Total Spent: ${row[2]:.2f}")
+    values = {}
+    if REPORTS[REPORT_MENU[choice]].uses_rollup:
+        values["start"] = input("From date (YYYY-MM-DD, blank for all history): ").strip()
+        values["end"] = input("Up to but not including date (YYYY-MM-DD, blank for no limit): ").strip()
+        values["store_id"] = input("Store ID (blank for all stores): ").strip()
+    elif choice == "5":
+        values["product_id"] = input("Enter Product ID to check: ").strip()
+    elif choice == "6":
+        values["start"] = input("Start date (YYYY-MM-DD): ").strip()
+        values["end"] = input("End date, included (YYYY-MM-DD): ").strip()
+        values["archived"] = input("Include archived transactions? (y/N): ").strip().lower() == "y"
 
+    path = input("Export to file (.csv, .arrow or .parquet; blank to show on screen): ").strip()
+
+    try:
+        if path:
+            stats = export_report(cursor, REPORT_MENU[choice], path, **values)
+            print(f"Exported {stats.rows} rows to {path}.")
         else:
-            print("Invalid choice.")
+            print_report(cursor, REPORT_MENU[choice], **values)
 
+    except (ValueError, RuntimeError) as e:
+        print(e)
     except mysql.connector.Error as e:
         print("Database error:", e)
@@ -0,0 +1,310 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to move aging transactions out of TransactionInfo and Involves
+
+TransactionInfo and Involves only ever grow, and the billing listings and the customer spend
+report read them, so every month of history makes those reads and the buffer pool's job
+bigger. An archive run moves every transaction older than a horizon, with its Involves lines,
+into compressed archive tables, and keeps a per-customer, per-day spend aggregate of what it
+moved so reports can still count it.
+
+A run is a chunked job (see jobs.py): each chunk is one short transaction that
+    1. Locks the chunk's old transactions
+    2. Copies them to TransactionArchive and their lines to InvolvesArchive
+    3. Adds their totals to ArchivedCustomerSpend
+    4. Deletes the lines and then the transactions
+so a transaction is always either live with its lines or archived with its lines, never half
+moved. An interrupted run resumes where it stopped.
+
+Only transactions the sales rollups already cover (TransactionID at or below every rollup
+watermark and outside its gaps of late commits, see rollups.py) are moved, and the rollups are
+refreshed first, so the daily, monthly and yearly sales reports keep all history. rollups.py's
+verify and rebuild read the archive too.
+
+The customer spend report adds the archived spend when it is run with archived=True
+(reports.py --archived). The billing listings (final prices, transaction totals) cover live
+transactions only; an archived transaction keeps its TotalPrice in TransactionArchive.
+
+This file:
+    1. Creates the compressed archive tables and the archived spend aggregate
+    2. Previews and runs archive jobs, throttled like the other chunked jobs
+    3. Describes how much is live and how much is archived
+    4. Command line interface
+
+Usage:
+    python archive.py preview --days 730
+    python archive.py run --days 730 --chunk 1000 --pause 0.1
+    python archive.py run --before 2023-01-01
+    python archive.py status
+'''
+
+import argparse
+import sys
+from datetime import date, timedelta
+
+import mysql.connector
+
+from checkout import has_store_column
+from jobs import DEFAULT_CHUNK, add_throttle_options, key_range, run_chunked, throttle_from_args
+from rollups import DAILY_STORE, STORE_COLUMN, ensure_rollup_tables, refresh_sales_rollups
+
+# Transactions older than this many days are archived unless a run asks for another horizon
+DEFAULT_HORIZON_DAYS = 730
+
+ARCHIVE_JOB = "archive_transactions"
+
+# Columns moved from TransactionInfo, in archive column order (an original TransactionInfo has
+# no StoreID; see transaction_columns)
+TRANSACTION_COLUMNS = ["TransactionID", "PurchaseDate", "TotalPrice", "CustomerIDHasATransaction", STORE_COLUMN]
+
+# Archived rows are written once and rarely read, so they are stored compressed
+CREATE_TABLES = [
+    f"""
+    CREATE TABLE IF NOT EXISTS TransactionArchive (
+        TransactionID BIGINT PRIMARY KEY,
+        PurchaseDate DATE NOT NULL,
+        TotalPrice DECIMAL(12, 2) NOT NULL,
+        CustomerIDHasATransaction INT NOT NULL,
+        {STORE_COLUMN} INT NULL,
+        KEY (PurchaseDate)
+    ) ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS InvolvesArchive (
+        TransactionID BIGINT NOT NULL,
+        ProductID INT NOT NULL,
+        KEY (TransactionID, ProductID)
+    ) ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ArchivedCustomerSpend (
+        CustomerID INT NOT NULL,
+        SpendDate DATE NOT NULL,
+        TotalSpent DECIMAL(15, 2) NOT NULL,
+        TransactionCount INT NOT NULL,
+        PRIMARY KEY (CustomerID, SpendDate),
+        KEY (SpendDate)
+    )
+    """,
+]
+
+_tables_ready = False
+
+
+def ensure_archive_tables(cursor):
+    '''
+    Creates the archive tables if they do not exist yet (once per process)
+    '''
+    global _tables_ready
+    if _tables_ready:
+        return
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+    _tables_ready = True
+
+
+def archive_exists(cursor):
+    '''
+    Returns True if the current database has TransactionArchive (an archive run has been set up)
+    '''
+    cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'TransactionArchive'")
+    return cursor.fetchone()[0] > 0
+
+
+def transaction_columns(cursor, columns=TRANSACTION_COLUMNS):
+    '''
+    Returns the select list that reads columns from TransactionInfo: StoreID reads as NULL when
+    TransactionInfo has no such column (the original schema; see checkout.has_store_column)
+    '''
+    if has_store_column(cursor):
+        return list(columns)
+    return [f"NULL AS {column}" if column == STORE_COLUMN else column for column in columns]
+
+
+def archived_transactions_source(cursor, columns):
+    '''
+    Returns a derived table of columns over live and archived transactions (TransactionInfo
+    UNION ALL TransactionArchive), aliased T
+    '''
+    live = ", ".join(transaction_columns(cursor, columns))
+    return f"(SELECT {live} FROM TransactionInfo UNION ALL SELECT {', '.join(columns)} FROM TransactionArchive) T"
+
+
+def horizon(days=None, before=None):
+    '''
+    Returns the first date that is kept live: before, or today minus days
+
+    Raises:
+        ValueError - For a horizon that would archive today's transactions
+    '''
+    if before is not None:
+        cutoff = before if isinstance(before, date) else date.fromisoformat(str(before).strip())
+    else:
+        days = DEFAULT_HORIZON_DAYS if days is None else int(days)
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        cutoff = date.today() - timedelta(days=days)
+    if cutoff > date.today():
+        raise ValueError(f"Cannot archive transactions from {date.today()} or later")
+    return cutoff
+
+
+def rolled_up_through(cursor):
+    '''
+    Refreshes the sales rollups and returns the highest TransactionID every one of them covers
+    (0 when nothing is rolled up); IDs in a rollup gap below it are not covered yet
+    '''
+    ensure_rollup_tables(cursor)
+    # The per-store rollup is only kept up to date where it is in use
+    cursor.execute("SELECT COUNT(*) FROM RollupWatermark WHERE RollupName = %s", (DAILY_STORE,))
+    refresh_sales_rollups(cursor, per_store=cursor.fetchone()[0] > 0)
+    cursor.execute("SELECT COALESCE(MIN(LastTransactionID), 0) FROM RollupWatermark")
+    return cursor.fetchone()[0]
+
+
+def preview_archive(cursor, cutoff):
+    '''
+    Returns what a run with horizon cutoff would move right now, without changing anything
+
+    Returns:
+        Dictionary with transactions, lines, total (sum of TotalPrice), first and last purchase date
+    '''
+    cursor.execute("""
+        SELECT COUNT(*), COALESCE(SUM(TotalPrice), 0.00), MIN(PurchaseDate), MAX(PurchaseDate)
+        FROM TransactionInfo WHERE PurchaseDate < %s
+    """, (cutoff,))
+    transactions, total, first, last = cursor.fetchone()
+    cursor.execute("""
+        SELECT COUNT(*) FROM Involves I JOIN TransactionInfo T ON T.TransactionID = I.TransactionID
+        WHERE T.PurchaseDate < %s
+    """, (cutoff,))
+    lines = cursor.fetchone()[0]
+    return {"transactions": transactions, "lines": lines, "total": total, "first": first, "last": last}
+
+
+def archive_transactions(cursor, cutoff, chunk=DEFAULT_CHUNK, throttle=None, restart=False):
+    '''
+    Moves every rolled-up transaction bought before cutoff, with its Involves lines, into the
+    archive tables, one committed chunk of TransactionInfo rows at a time
+
+    Parameters:
+        cursor - Active MySQL cursor
+        cutoff - First purchase date kept live (see horizon)
+        chunk - TransactionInfo rows walked per chunk transaction
+        throttle - Optional jobs.Throttle applied between chunks
+        restart - Ignore an unfinished run and walk TransactionInfo from the start
+
+    Returns:
+        Dictionary with cutoff, transactions and lines moved, chunks, resumed and elapsed seconds
+    '''
+    ensure_archive_tables(cursor)
+    limit = rolled_up_through(cursor)
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    selected = ", ".join(transaction_columns(cursor))
+    lines = 0
+
+    def move(cursor, low, high):
+        nonlocal lines
+        condition, params = key_range("TransactionID", low, high)
+        cursor.execute(f"""
+            SELECT TransactionID FROM TransactionInfo
+            WHERE {condition} AND PurchaseDate < %s AND TransactionID <= %s
+              AND NOT EXISTS (SELECT 1 FROM RollupGap G WHERE TransactionID BETWEEN G.LowID AND G.HighID)
+            FOR UPDATE
+        """, (*params, cutoff, limit))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        chosen = f"TransactionID IN ({', '.join(['%s'] * len(ids))})"
+
+        cursor.execute(f"INSERT INTO TransactionArchive ({columns}) "
+                       f"SELECT {selected} FROM TransactionInfo WHERE {chosen}", ids)
+        cursor.execute(f"INSERT INTO InvolvesArchive (TransactionID, ProductID) "
+                       f"SELECT TransactionID, ProductID FROM Involves WHERE {chosen}", ids)
+        lines += cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO ArchivedCustomerSpend (CustomerID, SpendDate, TotalSpent, TransactionCount)
+            SELECT CustomerIDHasATransaction, DATE(PurchaseDate), SUM(TotalPrice), COUNT(*)
+            FROM TransactionInfo WHERE {chosen}
+            GROUP BY CustomerIDHasATransaction, DATE(PurchaseDate)
+            ON DUPLICATE KEY UPDATE TotalSpent = TotalSpent + VALUES(TotalSpent),
+                                    TransactionCount = TransactionCount + VALUES(TransactionCount)
+        """, ids)
+        # Lines before their transaction, so nothing is ever left pointing at a missing row
+        cursor.execute(f"DELETE FROM Involves WHERE {chosen}", ids)
+        cursor.execute(f"DELETE FROM TransactionInfo WHERE {chosen}", ids)
+        return len(ids)
+
+    job = run_chunked(cursor, ARCHIVE_JOB, "TransactionInfo", "TransactionID", move, chunk, throttle, restart)
+    return {"cutoff": cutoff, "transactions": job["rows"], "lines": lines, "chunks": job["chunks"],
+            "resumed": job["resumed"], "elapsed": job["elapsed"]}
+
+
+def archive_status(cursor):
+    '''
+    Returns (label, rows, first date, last date) for live and archived transactions and lines
+    '''
+    ensure_archive_tables(cursor)
+    status = []
+    for label, table in [("live", "TransactionInfo"), ("archived", "TransactionArchive")]:
+        cursor.execute(f"SELECT COUNT(*), MIN(PurchaseDate), MAX(PurchaseDate) FROM {table}")
+        status.append((f"{label} transactions", *cursor.fetchone()))
+    for label, table in [("live", "Involves"), ("archived", "InvolvesArchive")]:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        status.append((f"{label} lines", cursor.fetchone()[0], None, None))
+    return status
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Archive aging MuskieCo transactions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("preview", "Count what a run would move"), ("run", "Move old transactions")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--days", type=int, default=DEFAULT_HORIZON_DAYS,
+                             help="Archive transactions older than this many days (default %(default)s)")
+        command.add_argument("--before", help="Archive transactions bought before this date (overrides --days)")
+        if name == "run":
+            add_throttle_options(command)
+    commands.add_parser("status", help="Live and archived row counts and date ranges")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            if args.command == "status":
+                for label, rows, first, last in archive_status(cursor):
+                    dates = f", {first} to {last}" if first else ""
+                    print(f"{label}: {rows}{dates}")
+            elif args.command == "preview":
+                cutoff = horizon(args.days, args.before)
+                preview = preview_archive(cursor, cutoff)
+                print(f"Before {cutoff}: {preview['transactions']} transactions ({preview['first']} to "
+                      f"{preview['last']}), {preview['lines']} lines, ${preview['total']:.2f} in sales.")
+            else:
+                cutoff = horizon(args.days, args.before)
+                throttle, replica = throttle_from_args(args)
+                try:
+                    summary = archive_transactions(cursor, cutoff, args.chunk, throttle, args.restart)
+                finally:
+                    if replica is not None:
+                        replica.close()
+                resumed = " (resumed)" if summary["resumed"] else ""
+                print(f"Archived{resumed} {summary['transactions']} transactions and {summary['lines']} lines "
+                      f"bought before {cutoff} in {summary['chunks']} chunk(s), {summary['elapsed']:.1f}s.")
+    except ValueError as e:
+        print(e)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to offer the MuskieCo API operations to asyncio programs
+
+Every function here is the awaitable twin of the non-interactive function of the same name in
+apis.py (or pricing.py / reports.py). The writes, the discount lookup, increment_inventory and
+transaction_totals run the very same operation code as apis.py (operations.py, pricing.totals_of)
+and the lookups the same statements from queries.py, so they cannot drift apart; only the driver
+differs. Connections come from an aiomysql pool, so one event loop can keep many lookups and
+inventory updates in flight at once, one connection each.
+
+The lookup cache and the price cache are shared with the blocking code in the same process.
+
+This file:
+    1. AsyncPool: an aiomysql pool whose session() commits, rolls back and keeps the caches in step
+    2. Store, member, staff and discount operations (add_*, find_*, change_*, remove_*, search_*_page)
+    3. increment_inventory, transaction_totals and report_rows
+
+Sales reports read the rollup as it is (refreshing it is a blocking job, see rollups.py).
+
+Requires aiomysql (pip install aiomysql); the rest of the system does not.
+'''
+
+import contextlib
+import contextvars
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+from apis import NON_NEGATIVE_STOCK, SEARCH_PAGE_SIZE
+from cache import LOOKUP_CACHE, as_key
+from db_pool import connection_settings
+import operations
+from operations import arun
+from pricing import PRICE_CACHE, DISCOUNT_FACTOR, totals_of
+from queries import (
+    STORE_BY_ID, MEMBER_BY_ID, MEMBER_BY_EMAIL, STAFF_BY_ID, STAFF_BY_EMAIL,
+    STORE_SEARCH, MEMBER_SEARCH, STAFF_SEARCH, store_filter_query, keyset_query
+)
+from reports import get_report
+
+# Functions the current session runs once it has committed or rolled back
+_after_session = contextvars.ContextVar("muskieco_after_session", default=None)
+
+
+# ------ Pool ------
+
+class AsyncPool:
+    '''
+    An aiomysql pool handing out one connection per session
+
+    Create it with AsyncPool.create(...) or pool_from_env(); close it with await pool.close()
+    '''
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.pool_size = pool.maxsize
+
+    @classmethod
+    async def create(cls, pool_size=5, host="localhost", user=None, password=None, database=None, **connect_args):
+        '''
+        Opens an aiomysql pool
+
+        Parameters:
+            pool_size - Maximum number of open connections
+            host, user, password, database - Connection settings
+            connect_args - Passed to aiomysql.create_pool
+
+        Returns:
+            AsyncPool
+        '''
+        if aiomysql is None:
+            raise RuntimeError("The asyncio API needs aiomysql: pip install aiomysql")
+        pool = await aiomysql.create_pool(minsize=1, maxsize=pool_size, host=host, user=user,
+                                          password=password, db=database, autocommit=False, **connect_args)
+        return cls(pool)
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        '''
+        Async context manager for one API call: yields a cursor on a pooled connection
+
+        Commits when the block finishes, rolls back if it raises
+        '''
+        async with self._pool.acquire() as connection:
+            LOOKUP_CACHE.begin_session()
+            callbacks = []
+            token = _after_session.set(callbacks)
+            cursor = await connection.cursor()
+            try:
+                yield cursor
+                await connection.commit()
+            except BaseException:
+                try:
+                    await connection.rollback()
+                except aiomysql.MySQLError:
+                    pass
+                raise
+            finally:
+                LOOKUP_CACHE.end_writes()
+                for callback in callbacks:
+                    callback()
+                _after_session.reset(token)
+                await cursor.close()
+
+    async def close(self):
+        self._pool.close()
+        await self._pool.wait_closed()
+
+
+async def pool_from_env(prompt=False, **overrides):
+    '''
+    Builds an AsyncPool from the MUSKIECO_* environment variables (see db_pool.connection_settings)
+
+    Parameters:
+        prompt - Ask on the terminal for missing credentials
+        overrides - Extra AsyncPool.create arguments
+
+    Returns:
+        AsyncPool
+    '''
+    settings = connection_settings(prompt)
+    settings.update(overrides)
+    return await AsyncPool.create(**settings)
+
+
+def _when_session_ends(callback):
+    callbacks = _after_session.get()
+    if callbacks is not None:
+        callbacks.append(callback)
+
+
+async def _one(cursor, query, params=()):
+    await cursor.execute(query, params)
+    return await cursor.fetchone()
+
+
+async def _all(cursor, query, params=()):
+    await cursor.execute(query, params)
+    return list(await cursor.fetchall())
+
+
+async def _keyset_page(cursor, search, text, match, after, page_size):
+    query, params = keyset_query(*search, text, match, after, page_size)
+    rows = await _all(cursor, query, params)
+    return rows, (rows[-1][0] if len(rows) == params[-1] else None)
+
+
+# ------ Store ------
+
+async def add_store(cursor, store_addr, phone):
+    return await arun(cursor, operations.add_store(store_addr, phone))
+
+
+async def find_store(cursor, store_id):
+    store_id = as_key(store_id)
+    if store_id is None:
+        return None
+    return await LOOKUP_CACHE.alookup("store", lambda: _one(cursor, STORE_BY_ID, (store_id,)), key=store_id)
+
+
+async def find_stores(cursor, store_id=None, store_addr=None):
+    if store_id and not store_addr:
+        row = await find_store(cursor, store_id)
+        return [row] if row else []
+    return await _all(cursor, *store_filter_query(store_id, store_addr))
+
+
+async def search_stores_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    return await _keyset_page(cursor, STORE_SEARCH, text, match, after, page_size)
+
+
+async def change_store(cursor, store_id, new_addr=None, new_phone=None):
+    '''
+    See apis.change_store
+
+    Returns:
+        Tuple (status, row)
+    '''
+    return await arun(cursor, operations.change_store(store_id, new_addr, new_phone))
+
+
+async def remove_store(cursor, store_id):
+    return await arun(cursor, operations.remove_store(store_id))
+
+
+# ------ Member ------
+
+async def add_member(cursor, customer_id, email, home_addr, active, reward_points, staff_id):
+    await arun(cursor, operations.add_member(customer_id, email, home_addr, active, reward_points, staff_id))
+    return await find_member(cursor, customer_id=customer_id)
+
+
+async def find_member(cursor, customer_id=None, email=None):
+    if customer_id is not None:
+        customer_id = int(customer_id)
+        query, params = MEMBER_BY_ID, (customer_id,)
+    else:
+        query, params = MEMBER_BY_EMAIL, (email,)
+    return await LOOKUP_CACHE.alookup("member", lambda: _one(cursor, query, params), key=customer_id, alias=email)
+
+
+async def search_members_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    return await _keyset_page(cursor, MEMBER_SEARCH, text, match, after, page_size)
+
+
+async def change_member(cursor, customer_id, home_addr, active, reward_points, staff_id):
+    email = await arun(cursor, operations.change_member(customer_id, home_addr, active, reward_points, staff_id))
+    return await find_member(cursor, email=email) if email else None
+
+
+async def remove_member(cursor, customer_id=None, email=None):
+    return await arun(cursor, operations.remove_member(customer_id, email))
+
+
+# ------ Staff ------
+
+async def add_staff(cursor, staff_id, name, age, home_addr, job_title, email, employed_on, signups):
+    await arun(cursor, operations.add_staff(staff_id, name, age, home_addr, job_title, email, employed_on, signups))
+
+
+async def find_staff(cursor, staff_id=None, email=None):
+    if staff_id is not None:
+        staff_id = int(staff_id)
+        query, params = STAFF_BY_ID, (staff_id,)
+    else:
+        query, params = STAFF_BY_EMAIL, (email,)
+    return await LOOKUP_CACHE.alookup("staff", lambda: _one(cursor, query, params), key=staff_id, alias=email)
+
+
+async def search_staff_page(cursor, text=None, after=None, page_size=SEARCH_PAGE_SIZE, match="prefix"):
+    return await _keyset_page(cursor, STAFF_SEARCH, text, match, after, page_size)
+
+
+async def change_staff(cursor, email, staff_id, name, age, home_addr, job_title, employed_on, signups):
+    return await arun(cursor, operations.change_staff(email, staff_id, name, age, home_addr, job_title, employed_on, signups))
+
+
+async def remove_staff(cursor, staff_id=None, email=None):
+    return await arun(cursor, operations.remove_staff(staff_id, email))
+
+
+# ------ Discount ------
+
+# Discount writers drop the cached price list now and again once the session has ended,
+# so a reload in between cannot keep the old discount
+
+def _prices_changed():
+    PRICE_CACHE.invalidate()
+    _when_session_ends(PRICE_CACHE.invalidate)
+
+
+async def add_discount(cursor, product_id, description, valid_date):
+    await arun(cursor, operations.add_discount(product_id, description, valid_date))
+    _prices_changed()
+
+
+async def find_discount(cursor, product_id):
+    return await arun(cursor, operations.find_discount(product_id))
+
+
+async def change_discount(cursor, product_id, description, valid_date):
+    updated = await arun(cursor, operations.change_discount(product_id, description, valid_date))
+    _prices_changed()
+    return updated
+
+
+async def remove_discount(cursor, product_id):
+    deleted = await arun(cursor, operations.remove_discount(product_id))
+    _prices_changed()
+    return deleted
+
+
+# ------ Inventory, billing and reports ------
+
+async def increment_inventory(cursor, product_id, store_id, quantity, non_negative=NON_NEGATIVE_STOCK):
+    '''
+    See apis.increment_inventory
+
+    Returns:
+        Tuple (status, new quantity)
+    '''
+    return await arun(cursor, operations.increment_inventory(product_id, store_id, quantity, non_negative))
+
+
+async def transaction_totals(cursor, transaction_ids, factor=DISCOUNT_FACTOR):
+    '''
+    See pricing.transaction_totals
+
+    Returns:
+        Dictionary of TransactionID -> (subtotal, discount, total)
+    '''
+    return await arun(cursor, totals_of(transaction_ids, factor))
+
+
+async def report_rows(cursor, name, **values):
+    '''
+    Runs a report (see reports.py) and returns its rows
+
+    Returns:
+        Dictionary with columns and rows
+    '''
+    report = get_report(name)
+    query, params = report.prepare(values)
+    return {"columns": report.columns, "rows": await _all(cursor, query, params)}
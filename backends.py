@@ -0,0 +1,713 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to run the MuskieCo report and billing queries on an embedded engine
+(DuckDB or SQLite) instead of the production MySQL server
+
+A snapshot copies the MuskieCo tables (and the sales rollups) out of MySQL in one consistent
+read into a local DuckDB or SQLite file. EmbeddedPool then hands out sessions on that file with
+the same interface as db_pool.ConnectionPool, so reports.py, export.py, the API lookups and the
+benchmark suite run on it unchanged: heavy aggregations run locally (vectorized, in DuckDB's
+case) and put no load on the server the counters use.
+
+The embedded cursors accept the repo's MySQL SQL:
+    1. %s placeholders, START TRANSACTION, INSERT IGNORE, ON DUPLICATE KEY UPDATE, FOR UPDATE,
+       AUTO_INCREMENT and inline KEY definitions; SET statements are ignored
+    2. The MySQL date functions the reports call (YEAR, MONTH, DAYOFMONTH, WEEKDAY, SUBDATE,
+       MAKEDATE, CURDATE, NOW) are defined on the engine with MySQL's meaning
+    3. Engine errors are raised as mysql.connector.DatabaseError, so callers handle them as before
+SQLite computes with DECIMAL columns in binary floating point, so they are stored as REAL
+there (an integral price would otherwise be kept, and summed, as an integer). Its cursors hand
+every floating point result back as a Decimal rounded to the 15 significant digits a float
+holds, with at least MONEY_SCALE places (the MuskieCo tables have no FLOAT columns, and all
+their DECIMAL columns have two places), so sums and totals come back as MySQL returns them:
+345.80, not 345.8. DuckDB's decimals are exact. Multi-table writes (UPDATE ... JOIN) and
+LAST_INSERT_ID are not translated, so reward runs and checkouts need MySQL. The rollup
+watermarks are copied with the rollups, so a report on a snapshot only rolls up the
+transactions the MySQL rollups had not reached yet.
+
+The same engine is the local stand-in for tests and benchmarks: "python datagen.py --snapshot
+fixture.duckdb" generates a fixture straight into a file, no MySQL needed.
+
+This file:
+    1. EmbeddedPool / EmbeddedCursor: sessions on a DuckDB or SQLite file speaking the repo's SQL
+    2. take_snapshot: consistent copy of the MuskieCo tables from MySQL into a snapshot file
+    3. open_pool: a MySQL pool, or an EmbeddedPool when a snapshot file is given
+    4. Command line interface to take a snapshot and describe one
+
+Usage:
+    python backends.py snapshot muskieco.duckdb
+    python backends.py snapshot muskieco.sqlite --tables TransactionInfo Involves MerchandiseInfo DiscountInfo
+    python backends.py info muskieco.duckdb
+    python reports.py --all --snapshot muskieco.duckdb
+
+DuckDB needs pip install duckdb (and pyarrow for fast snapshots); SQLite needs nothing extra.
+'''
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+from mysql.connector import FieldType, errorcode
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+from cache import LOOKUP_CACHE
+from export import (DATE_TYPES, DECIMAL_TYPES, EXPORT_BATCH_SIZE, FLOAT_TYPES, INTEGER_TYPES, TIMESTAMP_TYPES,
+                    arrow_batch, arrow_schema, column_scale, pyarrow)
+from streaming import stream_batches
+
+# File extension -> engine
+ENGINES = {
+    ".duckdb": "duckdb",
+    ".ddb": "duckdb",
+    ".sqlite": "sqlite",
+    ".sqlite3": "sqlite",
+    ".db": "sqlite",
+}
+
+# Decimal places of the MuskieCo money columns; SQLite money results get at least these (see _money)
+MONEY_SCALE = 2
+_CENT = Decimal(1).scaleb(-MONEY_SCALE)
+
+# Tables copied by a snapshot: everything the reports, billing and API lookups read
+SNAPSHOT_TABLES = [
+    "StoreAddress", "Store", "StaffEmails", "StaffInfo", "CustomerIDs", "CustomerEmail", "MemberInfo",
+    "MerchandiseInfo", "ProductQuantity", "DiscountInfo", "TransactionInfo", "Involves",
+    "DailySalesRollup", "DailyStoreSalesRollup", "RollupWatermark", "ArchivedCustomerSpend", "FixtureInfo",
+]
+
+CREATE_SNAPSHOT_INFO = """
+    CREATE TABLE IF NOT EXISTS SnapshotInfo (
+        TakenAt VARCHAR(32) NOT NULL,
+        Source VARCHAR(255) NOT NULL,
+        RowCounts TEXT NOT NULL
+    )
+"""
+
+
+def engine_of(path, engine=None):
+    '''
+    Returns the embedded engine for path: engine if given, otherwise guessed from the extension
+    '''
+    if engine is None:
+        engine = ENGINES.get(os.path.splitext(path)[1].lower())
+        if engine is None:
+            raise ValueError(f"Cannot tell the engine of {path}; use one of {', '.join(ENGINES)} or pass an engine")
+    if engine not in ("duckdb", "sqlite"):
+        raise ValueError(f"Unknown engine {engine!r}; choose duckdb or sqlite")
+    if engine == "duckdb" and duckdb is None:
+        raise RuntimeError("The duckdb engine needs duckdb: pip install duckdb")
+    return engine
+
+
+# ------ Dialect ------
+
+def as_date(value):
+    '''
+    Returns value as a date; SQLite returns computed dates (MAX(PurchaseDate), ...) as ISO text
+    '''
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _on_day(function):
+    def call(value, *args):
+        day = as_date(value)
+        return None if day is None or None in args else function(day, *args)
+    return call
+
+
+# MySQL date functions for SQLite, which stores dates as ISO text
+SQLITE_FUNCTIONS = {
+    "YEAR": (1, _on_day(lambda day: day.year)),
+    "MONTH": (1, _on_day(lambda day: day.month)),
+    "DAYOFMONTH": (1, _on_day(lambda day: day.day)),
+    "WEEKDAY": (1, _on_day(lambda day: day.weekday())),
+    "SUBDATE": (2, _on_day(lambda day, days: (day - timedelta(days=days)).isoformat())),
+    "MAKEDATE": (2, lambda year, day: None if year is None or day is None
+                 else (date(int(year), 1, 1) + timedelta(days=day - 1)).isoformat()),
+}
+
+# The same functions for DuckDB, as macros; WEEKDAY and DATE exist there with another meaning,
+# so statements call them under the mysql_ names (see DUCKDB_RENAMES)
+DUCKDB_MACROS = [
+    "CREATE OR REPLACE TEMP MACRO mysql_weekday(d) AS isodow(CAST(d AS DATE)) - 1",
+    "CREATE OR REPLACE TEMP MACRO mysql_date(d) AS CAST(d AS DATE)",
+    "CREATE OR REPLACE TEMP MACRO subdate(d, n) AS CAST(d AS DATE) - CAST(n AS INTEGER)",
+    "CREATE OR REPLACE TEMP MACRO makedate(y, n) AS make_date(CAST(y AS INTEGER), 1, 1) + CAST(n - 1 AS INTEGER)",
+    "CREATE OR REPLACE TEMP MACRO curdate() AS current_date",
+]
+DUCKDB_RENAMES = [
+    (re.compile(r"\bWEEKDAY\(", re.IGNORECASE), "mysql_weekday("),
+    (re.compile(r"\bDATE\(", re.IGNORECASE), "mysql_date("),
+]
+
+FOREIGN_KEY = re.compile(r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)(\s+ON DELETE CASCADE)?",
+                         re.IGNORECASE)
+
+# Secondary keys declared inside CREATE TABLE (not PRIMARY KEY)
+INLINE_KEY = re.compile(r",\s*(UNIQUE\s+)?KEY\s+(\w+\s*)?\([^)]*\)", re.IGNORECASE)
+
+_translated = {}
+
+
+def translate(statement, engine):
+    '''
+    Rewrites a MySQL statement of this repo for an embedded engine
+
+    Returns:
+        The engine's SQL, or None for a statement with no embedded meaning (SET ...)
+    '''
+    key = (statement, engine)
+    if key in _translated:
+        return _translated[key]
+
+    sql = statement.strip()
+    if re.match(r"SET\s", sql, re.IGNORECASE):
+        sql = None
+    elif re.match(r"START\s+TRANSACTION", sql, re.IGNORECASE):
+        sql = "BEGIN"
+    else:
+        sql = sql.replace("%s", "?")
+        sql = re.sub(r"^INSERT\s+IGNORE\b", "INSERT OR IGNORE", sql, flags=re.IGNORECASE)
+        # Embedded snapshots are read-mostly copies: keys come from the source, constraints are not re-checked
+        sql = FOREIGN_KEY.sub("", sql)
+        sql = INLINE_KEY.sub("", sql)
+        # Upserts: the row that failed to insert is "excluded" where MySQL calls it VALUES()
+        sql = re.sub(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", "ON CONFLICT DO UPDATE SET", sql, flags=re.IGNORECASE)
+        sql = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", sql, flags=re.IGNORECASE)
+        # One writer at a time on an embedded file, so row locks have nothing to add
+        sql = re.sub(r"\s+FOR\s+UPDATE\s*$", "", sql, flags=re.IGNORECASE)
+        if engine == "sqlite":
+            sql = re.sub(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", "INTEGER PRIMARY KEY", sql, flags=re.IGNORECASE)
+            # REAL affinity (the FLOAT), read back through the DECIMAL converter (the first word)
+            sql = re.sub(r"\bDECIMAL\s*\(", "DECIMAL FLOAT(", sql, flags=re.IGNORECASE)
+        else:
+            for pattern, name in DUCKDB_RENAMES:
+                sql = pattern.sub(name, sql)
+        sql = re.sub(r"\s+AUTO_INCREMENT\b", "", sql, flags=re.IGNORECASE)
+    _translated[key] = sql
+    return sql
+
+
+def _decimal_scale(duckdb_type):
+    match = re.fullmatch(r"DECIMAL\(\d+,\s*(\d+)\)", duckdb_type.upper())
+    return int(match.group(1)) if match else None
+
+
+def _field_type(duckdb_type):
+    name = duckdb_type.upper()
+    if name.startswith("DECIMAL"):
+        return FieldType.NEWDECIMAL
+    if name in ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT"):
+        return FieldType.LONGLONG
+    if name in ("FLOAT", "DOUBLE"):
+        return FieldType.DOUBLE
+    if name == "DATE":
+        return FieldType.DATE
+    if name.startswith("TIMESTAMP"):
+        return FieldType.DATETIME
+    return FieldType.VAR_STRING
+
+
+# SQLite hands back the declared types of snapshot columns as Python values, like MySQL does;
+# computed values have no declared type (see _exact)
+for _name, _converter in [("DATE", lambda raw: date.fromisoformat(raw.decode())),
+                          ("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode())),
+                          ("DATETIME", lambda raw: datetime.fromisoformat(raw.decode())),
+                          ("DECIMAL", lambda raw: _money(Decimal(raw.decode())))]:
+    sqlite3.register_converter(_name, _converter)
+
+
+def _sqlite_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _money(value):
+    '''
+    Returns a float or Decimal from SQLite as a Decimal with at least MONEY_SCALE places; digits
+    past them are kept, never rounded away
+    '''
+    exact = Decimal(f"{value:.15g}") if type(value) is float else value
+    return exact.quantize(_CENT) if exact.as_tuple().exponent > -MONEY_SCALE else exact
+
+
+def _exact(row):
+    '''
+    Returns a SQLite row with its floats as Decimals: SQLite stores DECIMAL as REAL, so money it
+    computes (SUM, price * factor) comes back as binary floats like 146.33999999999997 or 345.8
+    '''
+    if row is None or not any(type(value) is float for value in row):
+        return row
+    return tuple(_money(value) if type(value) is float else value for value in row)
+
+
+# ------ Sessions ------
+
+class EmbeddedCursor:
+    '''
+    Cursor on an embedded connection that accepts the repo's MySQL statements (see translate)
+
+    Parameters:
+        connection - sqlite3 or duckdb connection
+        engine - "sqlite" or "duckdb"
+    '''
+
+    def __init__(self, connection, engine):
+        self.connection = connection
+        self.engine = engine
+        # A DuckDB cursor() is a second connection, so DuckDB statements run on the session's own
+        self._cursor = connection.cursor() if engine == "sqlite" else connection
+        self._errors = (sqlite3.Error,) if engine == "sqlite" else (duckdb.Error,)
+        self._duckdb_transaction = False
+        self.rowcount = -1
+
+    @property
+    def in_transaction(self):
+        if self.engine == "sqlite":
+            return self.connection.in_transaction
+        return self._duckdb_transaction
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _params(self, params):
+        params = tuple(params or ())
+        if self.engine == "sqlite":
+            return tuple(_sqlite_value(value) for value in params)
+        # MySQL reads a float parameter as an exact decimal literal, so DECIMAL math stays DECIMAL
+        return tuple(Decimal(repr(value)) if isinstance(value, float) else value for value in params)
+
+    def _run(self, run, statement):
+        try:
+            run()
+        except self._errors as e:
+            raise mysql.connector.DatabaseError(msg=f"{self.engine}: {e}") from e
+        if self.engine == "sqlite":
+            self.rowcount = self._cursor.rowcount
+        elif re.match(r"(INSERT|UPDATE|DELETE)\b", statement, re.IGNORECASE):
+            # DuckDB answers a write with one row holding the number of rows changed
+            row = self._cursor.fetchone()
+            self.rowcount = row[0] if row else -1
+        else:
+            self.rowcount = -1
+
+    def execute(self, statement, params=None):
+        sql = translate(statement, self.engine)
+        if sql is None:
+            self.rowcount = 0
+            return
+        # MySQL ignores COMMIT outside a transaction and commits before starting another one
+        command = sql.upper()
+        if command in ("COMMIT", "ROLLBACK", "BEGIN"):
+            if self.in_transaction:
+                self._run(lambda: self._cursor.execute("COMMIT" if command == "BEGIN" else command), command)
+            if command == "BEGIN":
+                self._run(lambda: self._cursor.execute("BEGIN"), command)
+            self._duckdb_transaction = command == "BEGIN"
+            self.rowcount = 0
+            return
+        self._run(lambda: self._cursor.execute(sql, self._params(params)), sql)
+
+    def executemany(self, statement, seq_params):
+        sql = translate(statement, self.engine)
+        if sql is None:
+            return
+        rows = [self._params(params) for params in seq_params]
+        self._run(lambda: self._cursor.executemany(sql, rows), "executemany")
+
+    @property
+    def description(self):
+        description = self._cursor.description
+        if description is None or self.engine != "duckdb":
+            return description
+        # Report DuckDB column types as the MySQL FieldTypes export.py understands, with the
+        # scale of DECIMAL(p, s) columns in the DB-API scale slot
+        return [(column[0], _field_type(str(column[1]))) + tuple(column[2:5]) + (_decimal_scale(str(column[1])),)
+                + tuple(column[6:]) for column in description]
+
+    @property
+    def lastrowid(self):
+        return getattr(self._cursor, "lastrowid", None)
+
+    def fetchone(self):
+        if self.engine == "sqlite":
+            return _exact(self._cursor.fetchone())
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        if self.engine == "sqlite":
+            return [_exact(row) for row in self._cursor.fetchmany(size)]
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        if self.engine == "sqlite":
+            return [_exact(row) for row in self._cursor.fetchall()]
+        return self._cursor.fetchall()
+
+    def close(self):
+        if self.engine == "sqlite":
+            self._cursor.close()
+
+
+class EmbeddedPool:
+    '''
+    Sessions on a DuckDB or SQLite file, with the interface of db_pool.ConnectionPool
+
+    Parameters:
+        path - Database file (created if missing)
+        engine - "duckdb" or "sqlite" (guessed from the extension when None)
+        pool_size - Sessions the callers may run at once (used to size worker threads)
+        read_only - Open a DuckDB file read-only, so several processes can report from it
+    '''
+
+    # Embedded statements are never server-side prepared; kept for callers that read it
+    prepare = False
+
+    def __init__(self, path, engine=None, pool_size=4, read_only=False):
+        self.path = path
+        self.engine = engine_of(path, engine)
+        self.pool_size = pool_size
+        self._commit_hooks = []
+        self._rollback_hooks = []
+        self._lock = threading.Lock()
+        self._database = None
+        if self.engine == "duckdb":
+            self._database = duckdb.connect(path, read_only=read_only)
+            self.version = f"DuckDB {duckdb.__version__}"
+        else:
+            self.version = f"SQLite {sqlite3.sqlite_version}"
+
+    def _connect(self):
+        if self.engine == "duckdb":
+            if self._database is None:
+                raise mysql.connector.InterfaceError("Embedded pool is closed")
+            with self._lock:
+                connection = self._database.cursor()
+            # Temporary macros live with the connection, so read-only files get them too
+            for macro in DUCKDB_MACROS:
+                connection.execute(macro)
+            return connection
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        for name, (arity, function) in SQLITE_FUNCTIONS.items():
+            connection.create_function(name, arity, function, deterministic=True)
+        connection.create_function("CURDATE", 0, lambda: date.today().isoformat())
+        connection.create_function("NOW", 0, lambda: datetime.now().isoformat(sep=" ", timespec="seconds"))
+        return connection
+
+    def on_commit(self, hook):
+        self._commit_hooks.append(hook)
+
+    def on_rollback(self, hook):
+        self._rollback_hooks.append(hook)
+
+    def _finish(self, connection, action):
+        try:
+            if self.engine == "sqlite":
+                if connection.in_transaction:
+                    getattr(connection, action)()
+            else:
+                connection.execute(action.upper())
+        except (sqlite3.Error, *((duckdb.Error,) if duckdb else ())):
+            # DuckDB has no open transaction to end (it autocommits outside BEGIN)
+            pass
+
+    @contextmanager
+    def session(self):
+        '''
+        Context manager for one call: yields an EmbeddedCursor on its own connection
+
+        Commits when the block finishes, rolls back if it raises
+        '''
+        connection = self._connect()
+        cursor = EmbeddedCursor(connection, self.engine)
+        try:
+            yield cursor
+            self._finish(connection, "commit")
+            for hook in self._commit_hooks:
+                hook()
+        except BaseException:
+            self._finish(connection, "rollback")
+            for hook in self._rollback_hooks:
+                hook()
+            raise
+        finally:
+            cursor.close()
+            connection.close()
+
+    def close(self):
+        if self._database is not None:
+            self._database.close()
+            self._database = None
+
+
+def open_pool(snapshot=None, prompt=True, **overrides):
+    '''
+    Returns the pool a command runs on: MySQL (see db_pool.pool_from_env), or an EmbeddedPool
+    on the snapshot file when one is given
+
+    Parameters:
+        snapshot - Snapshot file, or None for MySQL
+        prompt - Ask on the terminal for MySQL credentials that are not set in the environment
+        overrides - Extra ConnectionPool arguments (pool_size is also used by EmbeddedPool)
+    '''
+    if snapshot is None:
+        from db_pool import pool_from_env
+        return pool_from_env(prompt, **overrides)
+    if not os.path.exists(snapshot):
+        raise ValueError(f"No snapshot at {snapshot}; take one with: python backends.py snapshot {snapshot}")
+    pool = EmbeddedPool(snapshot, pool_size=overrides.get("pool_size", 4))
+    LOOKUP_CACHE.attach(pool)
+    return pool
+
+
+# ------ Snapshots ------
+
+def column_type(column, values):
+    '''
+    Returns the embedded column type for a MySQL result column
+
+    Parameters:
+        column - Entry of cursor.description
+        values - Sample values of the column (decimal scales missing from column are read from them)
+    '''
+    type_code = column[1]
+    if type_code in INTEGER_TYPES:
+        return "BIGINT"
+    if type_code in FLOAT_TYPES:
+        return "DOUBLE"
+    if type_code in DECIMAL_TYPES:
+        return f"DECIMAL(38, {column_scale(column, values)})"
+    if type_code in DATE_TYPES:
+        return "DATE"
+    if type_code in TIMESTAMP_TYPES:
+        return "TIMESTAMP"
+    return "VARCHAR"
+
+
+def _primary_key(source, table):
+    source.execute("""
+        SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+        ORDER BY ORDINAL_POSITION
+    """, (table,))
+    return [row[0] for row in source.fetchall()]
+
+
+def _decimal_scales(source, table):
+    source.execute("""
+        SELECT COLUMN_NAME, NUMERIC_SCALE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND DATA_TYPE = 'decimal'
+    """, (table,))
+    return {name.lower(): int(scale) for name, scale in source.fetchall()}
+
+
+def _copy_table(source, target, table, batch_size):
+    # Kept on the copy: the rollup refresh upserts on it and it makes key lookups fast
+    key = _primary_key(source, table)
+    # mysql.connector leaves the scale out of the description; the table's definition has it, so
+    # a DECIMAL column whose first chunk is all NULL still gets its real scale
+    scales = _decimal_scales(source, table)
+    source.execute(f"SELECT * FROM {table}")
+    description = [column if column[0].lower() not in scales
+                   else tuple(column[:5]) + (scales[column[0].lower()],) + tuple(column[6:])
+                   for column in source.description]
+    columns = [column[0] for column in description]
+    batches = stream_batches(source, batch_size)
+    first = next(batches, [])
+
+    definitions = ", ".join(f"{name} {column_type(column, [row[index] for row in first])}"
+                            for index, (name, column) in enumerate(zip(columns, description)))
+    if key:
+        definitions += f", PRIMARY KEY ({', '.join(key)})"
+    target.execute(f"DROP TABLE IF EXISTS {table}")
+    target.execute(f"CREATE TABLE {table} ({definitions})")
+
+    # DuckDB loads Arrow batches in bulk; row-by-row inserts are slow there
+    use_arrow = target.engine == "duckdb" and pyarrow is not None
+    schema = arrow_schema(description, columns, first) if use_arrow else None
+    insert = f"INSERT INTO {table} VALUES ({', '.join(['%s'] * len(columns))})"
+    rows = 0
+    target.execute("START TRANSACTION")
+    for batch in _with_first(first, batches):
+        if use_arrow:
+            target.connection.register("snapshot_batch", pyarrow.Table.from_batches([arrow_batch(schema, batch)]))
+            target.connection.execute(f"INSERT INTO {table} SELECT * FROM snapshot_batch")
+            target.connection.unregister("snapshot_batch")
+        else:
+            target.executemany(insert, batch)
+        rows += len(batch)
+    target.execute("COMMIT")
+    return rows
+
+
+def _with_first(first, batches):
+    if first:
+        yield first
+    yield from batches
+
+
+def create_indexes(target, tables):
+    '''
+    Creates the indexes of schema.py's migrations on those of tables that exist in an embedded file
+    '''
+    from schema import MIGRATIONS
+
+    for _, _, indexes in MIGRATIONS:
+        for index in indexes:
+            if index.table in tables:
+                target.execute(f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table} ({', '.join(index.columns)})")
+
+
+def take_snapshot(cursor, path, engine=None, tables=None, refresh=True, batch_size=EXPORT_BATCH_SIZE, progress=print):
+    '''
+    Copies MuskieCo tables from MySQL into a DuckDB or SQLite file
+
+    All tables are read in one consistent-snapshot transaction, so the copy shows the database
+    at one instant. The file is written under a temporary name and renamed when complete.
+
+    Parameters:
+        cursor - Active MySQL cursor (unbuffered, as handed out by ConnectionPool.session)
+        path - Snapshot file (replaced if it exists)
+        engine - "duckdb" or "sqlite" (guessed from the extension when None)
+        tables - Tables to copy (SNAPSHOT_TABLES when None; missing ones are skipped)
+        refresh - Bring the sales rollups up to date first, so the snapshot's rollup reports are current
+        batch_size - Rows held in memory at once
+        progress - Function called with a line per table (None for silence)
+
+    Returns:
+        Dictionary of table -> rows copied
+    '''
+    engine = engine_of(path, engine)
+    if refresh:
+        from rollups import refresh_sales_rollups
+        refresh_sales_rollups(cursor)
+        refresh_sales_rollups(cursor, per_store=True)
+
+    partial = path + ".part"
+    if os.path.exists(partial):
+        os.remove(partial)
+    target_pool = EmbeddedPool(partial, engine)
+    counts = {}
+    try:
+        cursor.execute("SELECT VERSION()")
+        source = f"MySQL {cursor.fetchone()[0]}"
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+        with target_pool.session() as target:
+            for table in tables or SNAPSHOT_TABLES:
+                started = time.perf_counter()
+                try:
+                    counts[table] = _copy_table(cursor, target, table, batch_size)
+                except mysql.connector.Error as e:
+                    if e.errno != errorcode.ER_NO_SUCH_TABLE:
+                        raise
+                    if progress:
+                        progress(f"{table}: not in the source database, skipped")
+                    continue
+                if progress:
+                    progress(f"{table}: {counts[table]} rows in {time.perf_counter() - started:.1f}s")
+            if engine == "sqlite":
+                create_indexes(target, counts)
+            target.execute(CREATE_SNAPSHOT_INFO)
+            target.execute("INSERT INTO SnapshotInfo (TakenAt, Source, RowCounts) VALUES (%s, %s, %s)",
+                           (datetime.now().isoformat(sep=" ", timespec="seconds"), source,
+                            ", ".join(f"{table}={rows}" for table, rows in counts.items())))
+        cursor.execute("COMMIT")
+    except BaseException:
+        target_pool.close()
+        os.remove(partial)
+        raise
+    target_pool.close()
+    os.replace(partial, path)
+    return counts
+
+
+def snapshot_info(pool):
+    '''
+    Returns the SnapshotInfo of an EmbeddedPool's file as a dictionary, or None if it has none
+    '''
+    try:
+        with pool.session() as cursor:
+            cursor.execute("SELECT TakenAt, Source, RowCounts FROM SnapshotInfo")
+            row = cursor.fetchone()
+    except mysql.connector.Error:
+        return None
+    if row is None:
+        return None
+    return {"taken_at": row[0], "source": row[1], "rows": row[2]}
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Copy the MuskieCo tables into an embedded DuckDB or SQLite snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="Take a snapshot of the MySQL database")
+    snapshot.add_argument("path", help="Snapshot file (.duckdb or .sqlite)")
+    snapshot.add_argument("--engine", choices=["duckdb", "sqlite"], help="Engine (guessed from the extension)")
+    snapshot.add_argument("--tables", nargs="+", help="Tables to copy (default all the reports read)")
+    snapshot.add_argument("--no-refresh", action="store_true", help="Copy the sales rollups without refreshing them")
+    snapshot.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    info = commands.add_parser("info", help="Describe a snapshot")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "info":
+            pool = open_pool(args.path)
+            try:
+                described = snapshot_info(pool)
+            finally:
+                pool.close()
+            if described is None:
+                print(f"{args.path} is not a snapshot taken by backends.py")
+                return 1
+            print(f"Taken at {described['taken_at']} from {described['source']} ({pool.version})")
+            for count in described["rows"].split(", "):
+                print(f"  {count}")
+            return 0
+
+        pool = pool_from_env(pool_size=1)
+        try:
+            started = time.perf_counter()
+            with pool.session() as cursor:
+                counts = take_snapshot(cursor, args.path, args.engine, args.tables, not args.no_refresh,
+                                       args.batch_size)
+            print(f"Snapshot of {len(counts)} tables, {sum(counts.values())} rows, written to {args.path} "
+                  f"in {time.perf_counter() - started:.1f}s")
+        finally:
+            pool.close()
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
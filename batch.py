@@ -0,0 +1,291 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to run MuskieCo operations non-interactively from a JSONL command file
+
+Each input line is one operation:
+    {"op": "enter_store", "args": {"store_addr": "12 Main St", "phone": "555-0100"}, "id": "optional"}
+
+Operations are grouped into transactions of group_size on one pooled connection. Every
+operation runs under a SAVEPOINT, so a failing one is rolled back on its own and the rest of
+the group still commits. A group that hits a deadlock or loses its connection is retried as a whole.
+One JSON result line is written per operation once its group has committed.
+
+Usage:
+    python batch.py nightly.jsonl --group-size 500 --output results.jsonl
+    cat ops.jsonl | python batch.py -
+'''
+
+import argparse
+import json
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+
+import apis
+from checkout import checkout
+from db_pool import RETRYABLE_ERRORS
+from export import export_report
+from pricing import PRICE_CACHE, transaction_totals
+from reports import get_report, stream_report
+from rollups import refresh_sales_rollups
+
+DEFAULT_GROUP_SIZE = 100
+MAX_RETRIES = 3
+
+
+# ------ Operations ------
+
+def _report(cursor, name, **values):
+    report = get_report(name)
+    # Rollup reports read the rollup as it is; refresh it with a separate refresh_rollups operation
+    rows = list(stream_report(cursor, name, refresh=False, **values))
+    return {"columns": report.columns, "rows": rows}
+
+
+def _export_report(cursor, name, path, format=None, **values):
+    # Like _report, reads the rollup as it is
+    stats = export_report(cursor, name, path, format, refresh=False, **values)
+    return {"path": path, "rows": stats.rows}
+
+
+def _transaction_totals(cursor, transaction_ids):
+    totals = transaction_totals(cursor, transaction_ids)
+    return [{"transaction_id": tid, "subtotal": subtotal, "discount": discount, "total": total}
+            for tid, (subtotal, discount, total) in totals.items()]
+
+
+def _inventory(cursor, product_id, store_id, quantity, non_negative=apis.NON_NEGATIVE_STOCK):
+    status, new_qty = apis.increment_inventory(cursor, product_id, store_id, quantity, non_negative)
+    return {"status": status, "quantity": new_qty}
+
+
+def _page(function):
+    def operation(cursor, text=None, after=None, page_size=apis.SEARCH_PAGE_SIZE, match="prefix"):
+        rows, next_after = function(cursor, text, after, page_size, match)
+        return {"rows": rows, "next_after": next_after}
+    return operation
+
+
+def _store_update(cursor, store_id, new_addr=None, new_phone=None):
+    status, row = apis.change_store(cursor, store_id, new_addr, new_phone)
+    return {"status": status, "store": row}
+
+
+# Operation name -> function(cursor, **args); names match the interactive functions in apis.py
+OPERATIONS = {
+    "enter_store": apis.add_store,
+    "search_store": apis.find_stores,
+    "search_store_page": _page(apis.search_stores_page),
+    "update_store": _store_update,
+    "delete_store": apis.remove_store,
+    "enter_member": apis.add_member,
+    "search_member": apis.find_member,
+    "search_member_page": _page(apis.search_members_page),
+    "update_member": apis.change_member,
+    "delete_member": apis.remove_member,
+    "enter_staff": apis.add_staff,
+    "search_staff": apis.find_staff,
+    "search_staff_page": _page(apis.search_staff_page),
+    "update_staff": apis.change_staff,
+    "delete_staff": apis.remove_staff,
+    "enter_discount": apis.add_discount,
+    "search_discount": apis.find_discount,
+    "update_discount": apis.change_discount,
+    "delete_discount": apis.remove_discount,
+    "update_inventory": _inventory,
+    "transaction_totals": _transaction_totals,
+    "report": _report,
+    "export_report": _export_report,
+}
+
+# Operations that manage their own transactions; they run alone, between groups
+STANDALONE_OPERATIONS = {
+    "refresh_rollups": lambda cursor, per_store=False: {"chunks": refresh_sales_rollups(cursor, per_store)},
+    "checkout": checkout,
+}
+
+# Operations whose commit must drop the cached price list
+PRICE_WRITES = {"enter_discount", "update_discount", "delete_discount"}
+
+
+def _jsonable(value):
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+# ------ Runner ------
+
+def parse_commands(lines):
+    '''
+    Parses JSONL command lines
+
+    Parameters:
+        lines - Iterable of text lines
+
+    Returns:
+        Generator of dictionaries with line, id, op, args and (for unparsable lines) error
+    '''
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            op = record["op"]
+            args = record.get("args", {})
+            if not isinstance(args, dict):
+                raise ValueError("args must be an object")
+            yield {"line": line_no, "id": record.get("id"), "op": op, "args": args}
+        except (ValueError, KeyError, TypeError) as e:
+            yield {"line": line_no, "id": None, "op": None, "args": {}, "error": f"Bad command: {e}"}
+
+
+def _result(command, ok, value=None, error=None):
+    result = {"line": command["line"], "op": command["op"], "ok": ok}
+    if command.get("id") is not None:
+        result["id"] = command["id"]
+    if ok:
+        result["result"] = _jsonable(value)
+    else:
+        result["error"] = error
+    return result
+
+
+def _error_text(error):
+    if isinstance(error, (mysql.connector.Error, TypeError, ValueError)):
+        return str(error)
+    # A KeyError or AttributeError alone says little ("'name'")
+    return f"{type(error).__name__}: {error}"
+
+
+def _run_group(pool, group, max_retries):
+    for attempt in range(1, max_retries + 1):
+        results = []
+        try:
+            with pool.session() as cursor:
+                cursor.execute("START TRANSACTION")
+                for command in group:
+                    if "error" in command:
+                        results.append(_result(command, False, error=command["error"]))
+                        continue
+                    function = OPERATIONS.get(command["op"])
+                    if function is None:
+                        results.append(_result(command, False, error=f"Unknown operation {command['op']!r}"))
+                        continue
+
+                    cursor.execute("SAVEPOINT batch_op")
+                    try:
+                        value = function(cursor, **command["args"])
+                        cursor.execute("RELEASE SAVEPOINT batch_op")
+                        results.append(_result(command, True, value))
+                    except mysql.connector.Error as e:
+                        if e.errno in RETRYABLE_ERRORS:
+                            raise
+                        cursor.execute("ROLLBACK TO SAVEPOINT batch_op")
+                        results.append(_result(command, False, error=str(e)))
+                    except Exception as e:
+                        # Bad arguments (and anything else an operation raises) fail that operation alone
+                        cursor.execute("ROLLBACK TO SAVEPOINT batch_op")
+                        results.append(_result(command, False, error=_error_text(e)))
+            if any(command["op"] in PRICE_WRITES for command in group):
+                PRICE_CACHE.invalidate()
+            return results
+
+        except mysql.connector.Error as e:
+            if e.errno in RETRYABLE_ERRORS and attempt < max_retries:
+                time.sleep(0.2 * 2 ** (attempt - 1))
+                continue
+            return [_result(command, False, error=f"Group rolled back: {e}") for command in group]
+
+
+def _run_standalone(pool, command):
+    try:
+        with pool.session() as cursor:
+            value = STANDALONE_OPERATIONS[command["op"]](cursor, **command["args"])
+        return _result(command, True, value)
+    except Exception as e:
+        return _result(command, False, error=_error_text(e))
+
+
+def run_batch(pool, commands, group_size=DEFAULT_GROUP_SIZE, max_retries=MAX_RETRIES):
+    '''
+    Runs commands in transactions of group_size operations
+
+    Parameters:
+        pool - ConnectionPool
+        commands - Iterable of parsed commands (see parse_commands)
+        group_size - Operations per transaction
+        max_retries - Attempts per group for deadlocks, lock timeouts and lost connections
+
+    Returns:
+        Generator of result dictionaries, in input order
+    '''
+    if group_size < 1:
+        raise ValueError("group_size must be at least 1")
+
+    group = []
+    for command in commands:
+        if command["op"] in STANDALONE_OPERATIONS:
+            if group:
+                yield from _run_group(pool, group, max_retries)
+                group = []
+            yield _run_standalone(pool, command)
+            continue
+        group.append(command)
+        if len(group) == group_size:
+            yield from _run_group(pool, group, max_retries)
+            group = []
+    if group:
+        yield from _run_group(pool, group, max_retries)
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Run MuskieCo operations from a JSONL command file")
+    parser.add_argument("path", help="Command file, or - for stdin")
+    parser.add_argument("--group-size", type=int, default=DEFAULT_GROUP_SIZE,
+                        help="Operations per transaction")
+    parser.add_argument("--output", help="Write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(prompt=args.path != "-", pool_size=1)
+    source = sys.stdin if args.path == "-" else open(args.path)
+    output = open(args.output, "w") if args.output else sys.stdout
+    counts = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+    try:
+        for result in run_batch(pool, parse_commands(source), args.group_size):
+            counts["ok" if result["ok"] else "failed"] += 1
+            output.write(json.dumps(result) + "\n")
+    finally:
+        pool.close()
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    total = counts["ok"] + counts["failed"]
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"{total} operations ({counts['ok']} ok, {counts['failed']} failed) in {elapsed:.2f}s, "
+          f"{rate:.0f} ops/s", file=sys.stderr)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,964 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to hold stress tests and benchmarks that run against a live MuskieCo database
+
+Connection settings come from the MUSKIECO_* environment variables (see db_pool.pool_from_env).
+
+Usage:
+    python benchmarks.py inventory-stress --threads 16 --updates 200
+    python benchmarks.py transaction-totals --counts 1 10 100 1000
+    python benchmarks.py sales-range --rows 1000000 --days 30
+    python benchmarks.py async-throughput --clients 1 10 100 --requests 2000
+    python benchmarks.py prepared-statements --iterations 5000
+    python benchmarks.py checkout-throughput --clients 1 8 32 --checkouts 5000
+    python benchmarks.py daemon-latency --op search_member --args '{"customer_id": 1042}'
+    python benchmarks.py suite -o before.json
+    python benchmarks.py compare before.json after.json
+    python benchmarks.py attribution
+    python benchmarks.py --snapshot muskieco.duckdb suite --no-writes -o duckdb.json
+
+The suite expects a database filled by datagen.py; its results files record the fixture (scale
+and seed), the server version and the settings, so two files can be compared. With --snapshot the
+suite runs on an embedded DuckDB or SQLite file instead; the stress tests and checkouts need MySQL.
+Snapshot tables have no auto-increment keys, so run the suite on them with --no-writes (files
+generated by "datagen.py --snapshot x.sqlite" do have them).
+'''
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from apis import (add_discount, add_member, add_staff, add_store, apply_inventory_delta, change_discount,
+                  change_member, change_staff, change_store, find_discount, find_member, find_staff, find_store,
+                  find_stores, increment_inventory, remove_discount, remove_member, remove_staff, remove_store,
+                  search_members_page, search_staff_page, search_stores_page)
+from cache import LOOKUP_CACHE
+from checkout import DEFAULT_MAX_BATCH, GroupCommitter, OutOfStock, checkout
+from datagen import fixture_info
+from instrumentation import InstrumentedCursor, QueryStats
+from backends import EmbeddedPool, as_date, open_pool
+from pricing import transaction_totals
+from queries import STOCK_OF
+from reports import REPORTS, stream_report
+from rollups import refresh_sales_rollups, sales_query
+
+
+# ------ Inventory ------
+
+def inventory_stress(pool, product_id, store_id, threads=16, updates=200, non_negative=False):
+    '''
+    Hammers one ProductQuantity row from many threads and checks that no update was lost
+
+    Every thread applies updates increments of +1 through apply_inventory_delta on its own
+    pooled connection. With non_negative, every other update is a -1 through the stock guard,
+    and the final count must match the number of increments minus the decrements that were accepted.
+
+    Parameters:
+        pool - ConnectionPool with at least threads connections
+        product_id, store_id - Row to hammer (created if missing)
+        threads - Number of concurrent workers
+        updates - Updates per worker
+        non_negative - Mix in guarded decrements
+
+    Returns:
+        Dictionary with expected and actual final quantity and elapsed seconds
+    '''
+    with pool.session() as cursor:
+        apply_inventory_delta(cursor, product_id, store_id, 0)
+        cursor.execute("SELECT InstockQuantity FROM ProductQuantity WHERE ProductID = %s AND StoreID = %s",
+                       (product_id, store_id))
+        initial = cursor.fetchone()[0]
+
+    accepted = [0] * threads
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        try:
+            barrier.wait()
+            for n in range(updates):
+                delta = -1 if non_negative and n % 2 else 1
+                with pool.session() as cursor:
+                    status, _ = apply_inventory_delta(cursor, product_id, store_id, delta,
+                                                      non_negative=non_negative)
+                if status != "refused":
+                    accepted[index] += delta
+        except Exception as e:
+            errors.append(e)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    with pool.session() as cursor:
+        cursor.execute("SELECT InstockQuantity FROM ProductQuantity WHERE ProductID = %s AND StoreID = %s",
+                       (product_id, store_id))
+        final = cursor.fetchone()[0]
+
+    return {
+        "initial": initial,
+        "expected": initial + sum(accepted),
+        "final": final,
+        "errors": errors,
+        "elapsed": elapsed,
+        "updates": threads * updates,
+    }
+
+
+def cmd_inventory_stress(pool, args):
+    result = inventory_stress(pool, args.product_id, args.store_id, args.threads, args.updates,
+                              args.non_negative)
+    rate = result["updates"] / result["elapsed"] if result["elapsed"] > 0 else 0.0
+    print(f"{result['updates']} updates from {args.threads} threads in {result['elapsed']:.2f}s "
+          f"({rate:.0f} updates/s)")
+    print(f"Initial: {result['initial']}, expected: {result['expected']}, final: {result['final']}")
+    for e in result["errors"][:5]:
+        print(f"Worker error: {e}")
+    if result["errors"] or result["final"] != result["expected"]:
+        print("FAIL: lost or failed updates")
+        return 1
+    if args.non_negative and result["final"] < 0:
+        print("FAIL: stock went negative")
+        return 1
+    print("OK")
+    return 0
+
+
+# ------ Billing ------
+
+def _timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def transaction_totals_latency(pool, counts=(1, 10, 100, 1000), repeat=20):
+    '''
+    Measures transaction_totals latency for growing numbers of TransactionIDs
+
+    Parameters:
+        pool - ConnectionPool
+        counts - Numbers of IDs per call
+        repeat - Calls per count; the median is reported
+
+    Returns:
+        List of (id count, median seconds per call)
+    '''
+    with pool.session() as cursor:
+        cursor.execute("SELECT DISTINCT TransactionID FROM Involves ORDER BY TransactionID DESC LIMIT %s",
+                       (max(counts),))
+        sample = [row[0] for row in cursor.fetchall()]
+    if not sample:
+        raise RuntimeError("Involves is empty; load some transactions first")
+
+    results = []
+    with pool.session() as cursor:
+        for count in counts:
+            ids = (sample * (count // len(sample) + 1))[:count]
+            results.append((count, _timed(lambda: transaction_totals(cursor, ids), repeat)))
+    return results
+
+
+def cmd_transaction_totals(pool, args):
+    print(f"{'IDs':>6} {'ms/call':>10} {'ms/ID':>10}")
+    for count, seconds in transaction_totals_latency(pool, args.counts, args.repeat):
+        print(f"{count:>6} {seconds * 1000:>10.2f} {seconds * 1000 / count:>10.3f}")
+    return 0
+
+
+# ------ Sales reports ------
+
+SALES_BENCH_TABLE = "BenchTransactionInfo"
+
+
+def load_sales_table(cursor, rows, years=5, stores=20, batch=10000, seed=7):
+    '''
+    Creates and fills a synthetic TransactionInfo lookalike, unless it already holds rows rows
+
+    Purchase dates are spread evenly over the last years years
+
+    Returns:
+        Number of rows inserted
+    '''
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SALES_BENCH_TABLE} (
+            TransactionID INT AUTO_INCREMENT PRIMARY KEY,
+            PurchaseDate DATE NOT NULL,
+            TotalPrice DECIMAL(10, 2) NOT NULL,
+            StoreID INT NOT NULL,
+            KEY (PurchaseDate)
+        )
+    """)
+    cursor.execute(f"SELECT COUNT(*) FROM {SALES_BENCH_TABLE}")
+    existing = cursor.fetchone()[0]
+    if existing >= rows:
+        return 0
+
+    rng = random.Random(seed)
+    today = date.today()
+    span = 365 * years
+    inserted = 0
+    while existing + inserted < rows:
+        count = min(batch, rows - existing - inserted)
+        values = [(today - timedelta(days=rng.randrange(span)), round(rng.uniform(1, 500), 2),
+                   rng.randrange(1, stores + 1)) for _ in range(count)]
+        cursor.executemany(f"INSERT INTO {SALES_BENCH_TABLE} (PurchaseDate, TotalPrice, StoreID) "
+                           "VALUES (%s, %s, %s)", values)
+        cursor.execute("COMMIT")
+        inserted += count
+    cursor.execute(f"ANALYZE TABLE {SALES_BENCH_TABLE}")
+    cursor.fetchall()
+    return inserted
+
+
+def _rows_read(cursor):
+    cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    return sum(int(value) for _, value in cursor.fetchall())
+
+
+def sales_range_scan(pool, rows=1000000, days=30, repeat=5):
+    '''
+    Compares rows read and latency of the sales query over all history, over the last days days
+    with the date column wrapped in a function, and over the same days as a half-open range
+
+    Rows read is the growth of the session's Handler_read counters while the query runs
+
+    Returns:
+        List of (label, rows read, median seconds)
+    '''
+    with pool.session() as cursor:
+        load_sales_table(cursor, rows)
+
+    range_query, range_params = sales_query("day", days=days, source="transactions", table=SALES_BENCH_TABLE)
+    cases = [
+        ("all history, by month", f"""
+            SELECT YEAR(PurchaseDate), MONTH(PurchaseDate), SUM(TotalPrice)
+            FROM {SALES_BENCH_TABLE} GROUP BY YEAR(PurchaseDate), MONTH(PurchaseDate)
+        """, ()),
+        (f"last {days} days, DATEDIFF on column", f"""
+            SELECT PurchaseDate, SUM(TotalPrice) FROM {SALES_BENCH_TABLE}
+            WHERE DATEDIFF(CURDATE(), PurchaseDate) < %s GROUP BY PurchaseDate ORDER BY PurchaseDate
+        """, (days,)),
+        (f"last {days} days, half-open range", range_query, range_params),
+    ]
+
+    results = []
+    with pool.session() as cursor:
+        for label, query, params in cases:
+            before = _rows_read(cursor)
+            cursor.execute(query, params)
+            cursor.fetchall()
+            read = _rows_read(cursor) - before
+
+            def run():
+                cursor.execute(query, params)
+                cursor.fetchall()
+            results.append((label, read, _timed(run, repeat)))
+    return results
+
+
+def cmd_sales_range(pool, args):
+    print(f"{'rows read':>12} {'ms':>10}  query")
+    for label, read, seconds in sales_range_scan(pool, args.rows, args.days, args.repeat):
+        print(f"{read:>12} {seconds * 1000:>10.1f}  {label}")
+    return 0
+
+
+# ------ Concurrency ------
+
+def _latency_summary(latencies, elapsed):
+    latencies.sort()
+    return {
+        "ops": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def threaded_lookups(pool, customer_ids, clients, requests):
+    '''
+    Runs requests member lookups spread over clients threads, one pooled connection each
+
+    Returns:
+        Dictionary with ops per second and p50/p95 latency in seconds
+    '''
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        mine = []
+        for n in range(index, requests, clients):
+            started = time.perf_counter()
+            with pool.session() as cursor:
+                find_member(cursor, customer_id=customer_ids[n % len(customer_ids)])
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return _latency_summary(latencies, time.perf_counter() - started)
+
+
+async def _async_lookups(customer_ids, clients, requests):
+    import async_apis
+
+    pool = await async_apis.pool_from_env(pool_size=clients)
+    latencies = []
+
+    async def client(index):
+        for n in range(index, requests, clients):
+            started = time.perf_counter()
+            async with pool.session() as cursor:
+                await async_apis.find_member(cursor, customer_id=customer_ids[n % len(customer_ids)])
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(clients)))
+        return _latency_summary(latencies, time.perf_counter() - started)
+    finally:
+        await pool.close()
+
+
+def async_throughput(pool, clients=(1, 10, 100), requests=2000):
+    '''
+    Compares member lookups by ID from threads on the blocking pool with the same number of
+    asyncio tasks on an aiomysql pool (async_apis.py)
+
+    The lookup cache is switched off while it runs, so every lookup reaches MySQL
+
+    Parameters:
+        pool - ConnectionPool with at least max(clients) connections
+        clients - Numbers of concurrent clients to try
+        requests - Lookups per run
+
+    Returns:
+        List of (clients, threaded result, asyncio result), see threaded_lookups
+    '''
+    with pool.session() as cursor:
+        cursor.execute("SELECT CustomerID FROM MemberInfo ORDER BY RAND() LIMIT 1000")
+        customer_ids = [row[0] for row in cursor.fetchall()]
+    if not customer_ids:
+        raise RuntimeError("MemberInfo is empty; load some members first")
+
+    max_entries = LOOKUP_CACHE.max_entries
+    LOOKUP_CACHE.max_entries = 0
+    try:
+        return [(count, threaded_lookups(pool, customer_ids, count, requests),
+                 asyncio.run(_async_lookups(customer_ids, count, requests)))
+                for count in clients]
+    finally:
+        LOOKUP_CACHE.max_entries = max_entries
+
+
+def cmd_async_throughput(pool, args):
+    print(f"{'clients':>8} {'driver':>8} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for count, threaded, asynchronous in async_throughput(pool, args.clients, args.requests):
+        for driver, result in (("threads", threaded), ("asyncio", asynchronous)):
+            print(f"{count:>8} {driver:>8} {result['ops']:>10.0f} "
+                  f"{result['p50'] * 1000:>8.2f} {result['p95'] * 1000:>8.2f}")
+    return 0
+
+
+# ------ Prepared statements ------
+
+def prepared_statement_latency(pool, iterations=5000):
+    '''
+    Times the hot point lookups and inventory updates with plain text statements and with
+    server-side prepared statements (see prepared.py), on one connection each way
+
+    The inventory update adds 0, so stock is left as it was; the lookup cache is switched off
+
+    Parameters:
+        pool - ConnectionPool
+        iterations - Calls per case and mode
+
+    Returns:
+        List of (case, plain median seconds, prepared median seconds)
+    '''
+    with pool.session() as cursor:
+        cursor.execute("SELECT CustomerID FROM MemberInfo LIMIT 1")
+        member = cursor.fetchone()
+        cursor.execute("SELECT ProductID, StoreID FROM ProductQuantity LIMIT 1")
+        stock = cursor.fetchone()
+        cursor.execute("SELECT StoreID FROM Store LIMIT 1")
+        store = cursor.fetchone()
+    if not (member and stock and store):
+        raise RuntimeError("MemberInfo, ProductQuantity and Store need at least one row each")
+
+    def stock_of(cursor):
+        cursor.execute(STOCK_OF, stock)
+        cursor.fetchone()
+
+    cases = [
+        ("find_member by id", lambda cursor: find_member(cursor, customer_id=member[0])),
+        ("find_store by id", lambda cursor: find_store(cursor, store[0])),
+        ("stock lookup", stock_of),
+        ("increment_inventory", lambda cursor: increment_inventory(cursor, stock[0], stock[1], 0)),
+    ]
+
+    prepare, max_entries = pool.prepare, LOOKUP_CACHE.max_entries
+    LOOKUP_CACHE.max_entries = 0
+    results = []
+    try:
+        for label, call in cases:
+            medians = []
+            for mode in (False, True):
+                pool.prepare = mode
+                with pool.session() as cursor:
+                    call(cursor)
+                    medians.append(_timed(lambda: call(cursor), iterations))
+            results.append((label, *medians))
+    finally:
+        pool.prepare, LOOKUP_CACHE.max_entries = prepare, max_entries
+    return results
+
+
+def cmd_prepared_statements(pool, args):
+    print(f"{'case':<22} {'plain us':>10} {'prepared us':>12} {'speedup':>8}")
+    for label, plain, prepared in prepared_statement_latency(pool, args.iterations):
+        speedup = plain / prepared if prepared > 0 else 0.0
+        print(f"{label:<22} {plain * 1e6:>10.1f} {prepared * 1e6:>12.1f} {speedup:>7.2f}x")
+    return 0
+
+
+# ------ Checkout ------
+
+def _checkout_sample(cursor, limit=50000):
+    cursor.execute("SELECT StoreID, ProductID FROM ProductQuantity WHERE InstockQuantity > 10 LIMIT %s", (limit,))
+    stocked = {}
+    for store_id, product_id in cursor.fetchall():
+        stocked.setdefault(store_id, []).append(product_id)
+    cursor.execute("SELECT CustomerID FROM CustomerIDs LIMIT %s", (limit,))
+    customers = [row[0] for row in cursor.fetchall()]
+    if not stocked or not customers:
+        raise RuntimeError("ProductQuantity and CustomerIDs need rows; generate data first (python datagen.py)")
+    return stocked, customers
+
+
+def checkout_throughput(pool, clients=(1, 8, 32), checkouts=2000, group=False, workers=4, max_batch=DEFAULT_MAX_BATCH,
+                        seed=1):
+    '''
+    Runs checkouts of 1 to 4 random stocked products at random stores from clients threads,
+    committing each one on its own or through a GroupCommitter
+
+    This records real sales (stock goes down, reward points go up); run it on generated data.
+
+    Parameters:
+        pool - ConnectionPool with at least max(clients) connections (workers with group)
+        clients - Numbers of concurrent clients to try
+        checkouts - Checkouts per run
+        group - Use group commit instead of one commit per checkout
+        workers - GroupCommitter worker connections
+        max_batch - Most checkouts per group commit
+        seed - Seed for picking stores, products and customers
+
+    Returns:
+        List of (clients, result) where result has ops per second, p50/p95 latency in seconds,
+        refused (out of stock) and batches (group commits, 0 without group)
+    '''
+    with pool.session() as cursor:
+        stocked, customers = _checkout_sample(cursor)
+    stores = sorted(stocked)
+
+    results = []
+    for count in clients:
+        latencies, refused = [], [0]
+        lock = threading.Lock()
+        committer = GroupCommitter(pool, workers, max_batch) if group else None
+
+        def client(index):
+            rng = random.Random(seed * 1000 + index)
+            mine, short = [], 0
+            for _ in range(index, checkouts, count):
+                store_id = rng.choice(stores)
+                products = stocked[store_id]
+                items = [(rng.choice(products), rng.randint(1, 2)) for _ in range(rng.randint(1, 4))]
+                customer_id = rng.choice(customers)
+                started = time.perf_counter()
+                try:
+                    if committer is not None:
+                        committer.checkout(store_id, customer_id, items)
+                    else:
+                        with pool.session() as cursor:
+                            checkout(cursor, store_id, customer_id, items)
+                except OutOfStock:
+                    short += 1
+                mine.append(time.perf_counter() - started)
+            with lock:
+                latencies.extend(mine)
+                refused[0] += short
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        batches = 0
+        if committer is not None:
+            committer.close()
+            batches = committer.stats["batches"]
+        result = _latency_summary(latencies, elapsed)
+        result.update(refused=refused[0], batches=batches)
+        results.append((count, result))
+    return results
+
+
+def cmd_checkout_throughput(pool, args):
+    modes = [("single", False), ("group", True)] if args.mode == "both" else [(args.mode, args.mode == "group")]
+    print(f"{'clients':>8} {'commit':>8} {'ops/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'refused':>8} {'batches':>8}")
+    for label, group in modes:
+        for count, result in checkout_throughput(pool, args.clients, args.checkouts, group, args.workers,
+                                                 args.max_batch):
+            print(f"{count:>8} {label:>8} {result['ops']:>10.0f} {result['p50'] * 1000:>8.2f} "
+                  f"{result['p95'] * 1000:>8.2f} {result['refused']:>8} {result['batches']:>8}")
+    return 0
+
+
+# ------ Daemon ------
+
+def _timed_process(arguments, input_text=None):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, *arguments], input=input_text, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    # Both print one result line per operation, even for an operation that failed
+    if not completed.stdout.strip():
+        raise RuntimeError(f"{' '.join(arguments)} failed: {completed.stderr.strip()[-500:]}")
+    return elapsed
+
+
+def _timed_call(call):
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def daemon_latency(op, args, calls=20):
+    '''
+    Times one operation run three ways: a new batch.py process per call (interpreter, import,
+    login, cold caches), a new client.py process per call against the running daemon, and calls
+    on one open client.py connection
+
+    Parameters:
+        op, args - The batch.py operation and its arguments
+        calls - Calls per way
+
+    Returns:
+        List of (label, {calls, median_ms, p95_ms, mean_ms})
+    '''
+    from client import Client, OperationFailed
+
+    line = json.dumps({"op": op, "args": args})
+    client_arguments = ["client.py", op, *(f"{name}={json.dumps(value)}" for name, value in args.items())]
+    with Client() as client:
+        try:
+            client.call(op, **args)
+        except OperationFailed as e:
+            raise RuntimeError(f"{op} failed on the daemon: {e}") from e
+        connected = [_timed_call(lambda: client.send_line(line)) for _ in range(calls)]
+    return [
+        ("batch.py process", _percentiles([_timed_process(["batch.py", "-"], line + "\n") for _ in range(calls)])),
+        ("client.py process", _percentiles([_timed_process(client_arguments) for _ in range(calls)])),
+        ("open client", _percentiles(connected)),
+    ]
+
+
+def cmd_daemon_latency(pool, args):
+    try:
+        results = daemon_latency(args.op, json.loads(args.args), args.calls)
+    except OSError as e:
+        print(f"No daemon to measure ({e.strerror}); start one with: python daemon.py")
+        return 1
+    print(f"{'way':<20} {'median ms':>10} {'p95 ms':>8}")
+    for label, timings in results:
+        print(f"{label:<20} {timings['median_ms']:>10.2f} {timings['p95_ms']:>8.2f}")
+    return 0
+
+
+# ------ API suite ------
+
+# Keys of the rows the write cycles add and remove again; far above anything datagen.py makes
+SUITE_KEY_BASE = 900_000_000
+
+
+def _percentiles(timings):
+    timings = sorted(timings)
+    return {
+        "calls": len(timings),
+        "median_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+    }
+
+
+def _suite_sample(cursor, rng, size):
+    '''
+    Picks the keys the read cases look up (seeded, so two runs on the same fixture use the same keys)
+    '''
+    def column(query):
+        cursor.execute(query)
+        values = [row for row in cursor.fetchall()]
+        if not values:
+            raise RuntimeError(f"No rows for: {query.strip()}; generate data first (python datagen.py)")
+        return values
+
+    sample = {
+        "stores": column("SELECT StoreID, StoreAddr FROM Store ORDER BY StoreID"),
+        "members": column("SELECT CustomerID, Email FROM MemberInfo ORDER BY CustomerID"),
+        "staff": column("SELECT StaffID, Email FROM StaffInfo ORDER BY StaffID"),
+        "stock": column("SELECT ProductID, StoreID FROM ProductQuantity ORDER BY ProductID, StoreID"),
+        "discounts": column("SELECT DISTINCT ProductID FROM DiscountInfo ORDER BY ProductID"),
+        "transactions": column("SELECT TransactionID FROM TransactionInfo ORDER BY TransactionID DESC LIMIT 100000"),
+    }
+    sample = {name: [rng.choice(rows) for _ in range(size)] for name, rows in sample.items()}
+    # A product without discounts, so the discount cycle leaves DiscountInfo as it was
+    cursor.execute("""
+        SELECT MIN(MI.ProductID) FROM MerchandiseInfo MI
+        WHERE NOT EXISTS (SELECT 1 FROM DiscountInfo D WHERE D.ProductID = MI.ProductID)
+    """)
+    sample["undiscounted"] = cursor.fetchone()[0]
+    return sample
+
+
+def _read_cases(sample):
+    '''
+    Returns (name, call(cursor, i)) for every read API; i picks the i-th sampled key
+    '''
+    def pick(name, i):
+        rows = sample[name]
+        return rows[i % len(rows)]
+
+    def totals(cursor, i, count):
+        ids = [pick("transactions", i + n)[0] for n in range(count)]
+        transaction_totals(cursor, ids)
+
+    return [
+        ("find_store", lambda cursor, i: find_store(cursor, pick("stores", i)[0])),
+        ("find_stores by address", lambda cursor, i: find_stores(cursor, store_addr=pick("stores", i)[1])),
+        ("search_stores_page", lambda cursor, i: search_stores_page(cursor, pick("stores", i)[1][:2])),
+        ("find_member by id", lambda cursor, i: find_member(cursor, customer_id=pick("members", i)[0])),
+        ("find_member by email", lambda cursor, i: find_member(cursor, email=pick("members", i)[1])),
+        ("search_members_page", lambda cursor, i: search_members_page(cursor, pick("members", i)[1][:7])),
+        ("find_staff by id", lambda cursor, i: find_staff(cursor, staff_id=pick("staff", i)[0])),
+        ("find_staff by email", lambda cursor, i: find_staff(cursor, email=pick("staff", i)[1])),
+        ("search_staff_page", lambda cursor, i: search_staff_page(cursor, pick("staff", i)[1][:6])),
+        ("find_discount", lambda cursor, i: find_discount(cursor, pick("discounts", i)[0])),
+        ("transaction_totals x1", lambda cursor, i: totals(cursor, i, 1)),
+        ("transaction_totals x100", lambda cursor, i: totals(cursor, i, 100)),
+        # Adds 0, so stock is left as it was
+        ("increment_inventory", lambda cursor, i: increment_inventory(cursor, *pick("stock", i), 0)),
+    ]
+
+
+def _write_cycles(sample):
+    '''
+    Returns (name, [(step name, call(cursor, i)), ...]) for the add/change/remove APIs; the steps
+    of one cycle undo each other, so a suite run leaves the data as it found it
+    '''
+    stores = {}
+    product_id = sample["undiscounted"]
+
+    def key(i):
+        return SUITE_KEY_BASE + i
+
+    def add_bench_store(cursor, i):
+        stores[i] = add_store(cursor, f"{key(i)} Benchmark Rd", "555-0000")[0]
+
+    cycles = [
+        ("store", [
+            ("add_store", add_bench_store),
+            ("change_store", lambda cursor, i: change_store(cursor, stores[i], new_phone="555-0001")),
+            ("remove_store", lambda cursor, i: remove_store(cursor, stores.pop(i))),
+        ]),
+        ("member", [
+            ("add_member", lambda cursor, i: add_member(cursor, key(i), f"bench{key(i)}@bench.example",
+                                                        "1 Benchmark Rd", "active", 0, None)),
+            ("change_member", lambda cursor, i: change_member(cursor, key(i), "2 Benchmark Rd", "inactive", 5, None)),
+            ("remove_member", lambda cursor, i: remove_member(cursor, email=f"bench{key(i)}@bench.example")),
+        ]),
+        ("staff", [
+            ("add_staff", lambda cursor, i: add_staff(cursor, key(i), "Bench Staff", 30, "1 Benchmark Rd", "Cashier",
+                                                      f"staff{key(i)}@bench.example", date.today(), 0)),
+            ("change_staff", lambda cursor, i: change_staff(cursor, f"staff{key(i)}@bench.example", key(i),
+                                                            "Bench Staff", 31, "2 Benchmark Rd", "Stock Clerk",
+                                                            date.today(), 1)),
+            ("remove_staff", lambda cursor, i: remove_staff(cursor, email=f"staff{key(i)}@bench.example")),
+        ]),
+    ]
+    if product_id is not None:
+        cycles.append(("discount", [
+            ("add_discount", lambda cursor, i: add_discount(cursor, product_id, "Benchmark", date.today())),
+            ("change_discount", lambda cursor, i: change_discount(cursor, product_id, "Benchmark 2", date.today())),
+            ("remove_discount", lambda cursor, i: remove_discount(cursor, product_id)),
+        ]))
+    return cycles
+
+
+def api_suite(pool, iterations=200, report_repeat=3, reports=None, seed=1, days=90, writes=True):
+    '''
+    Times every API function and report on the current database, one pooled session per call
+    (like the menu), with the lookup cache switched off
+
+    Parameters:
+        pool - ConnectionPool
+        iterations - Calls per read case and add/change/remove cycles per write case
+        report_repeat - Runs per report (all rows are fetched)
+        reports - Report names to run (every report of reports.py when None)
+        seed - Seed for picking the sampled keys
+        days - The sales and spend reports cover the last days days
+        writes - Time the add/change/remove cycles too (they need auto-increment keys)
+
+    Returns:
+        Dictionary case -> {calls, median_ms, p95_ms, mean_ms}
+    '''
+    rng = random.Random(seed)
+    with pool.session() as cursor:
+        sample = _suite_sample(cursor, rng, iterations)
+        cursor.execute("SELECT MAX(PurchaseDate) FROM TransactionInfo")
+        end = as_date(cursor.fetchone()[0]) + timedelta(days=1)
+
+    def timed_call(call, i):
+        started = time.perf_counter()
+        with pool.session() as cursor:
+            call(cursor, i)
+            cursor.execute("COMMIT")
+        return time.perf_counter() - started
+
+    results = {}
+    max_entries = LOOKUP_CACHE.max_entries
+    LOOKUP_CACHE.max_entries = 0
+    try:
+        for name, call in _read_cases(sample):
+            timed_call(call, 0)
+            results[name] = _percentiles([timed_call(call, i) for i in range(iterations)])
+            print(f"  {name}: {results[name]['median_ms']:.2f} ms")
+
+        for cycle, steps in _write_cycles(sample) if writes else []:
+            timings = {step: [] for step, _ in steps}
+            for i in range(iterations):
+                for step, call in steps:
+                    timings[step].append(timed_call(call, i))
+            for step, values in timings.items():
+                results[step] = _percentiles(values)
+                print(f"  {step}: {results[step]['median_ms']:.2f} ms")
+
+        with pool.session() as cursor:
+            refresh_sales_rollups(cursor)
+            refresh_sales_rollups(cursor, per_store=True)
+        values = {"start": end - timedelta(days=days), "end": end, "product_id": sample["stock"][0][0]}
+        for name in reports or list(REPORTS):
+            def run_report(cursor, i, name=name):
+                for _ in stream_report(cursor, name, refresh=False, **values):
+                    pass
+            results[f"report {name}"] = _percentiles([timed_call(run_report, i) for i in range(report_repeat)])
+            print(f"  report {name}: {results[f'report {name}']['median_ms']:.2f} ms")
+    finally:
+        LOOKUP_CACHE.max_entries = max_entries
+    return results
+
+
+def suite_metadata(pool):
+    '''
+    Returns what a suite result was measured on: fixture, server, client and settings
+    '''
+    with pool.session() as cursor:
+        if isinstance(pool, EmbeddedPool):
+            version = pool.version
+        else:
+            cursor.execute("SELECT VERSION()")
+            version = cursor.fetchone()[0]
+        fixture = fixture_info(cursor)
+    return {
+        "fixture": fixture,
+        "server": version,
+        "python": platform.python_version(),
+        "prepared": pool.prepare,
+        "measured_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def cmd_suite(pool, args):
+    metadata = suite_metadata(pool)
+    print(f"Fixture: {metadata['fixture'] or 'not generated by datagen.py'}, server {metadata['server']}")
+    results = api_suite(pool, args.iterations, args.report_repeat, args.reports, args.seed, args.days,
+                        not args.no_writes)
+    scale = (metadata["fixture"] or {}).get("scale", "custom")
+    path = args.output or f"bench-{scale}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(path, "w") as f:
+        json.dump({"metadata": metadata, "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} cases to {path}")
+    return 0
+
+
+def statement_attribution(pool, writes=True):
+    '''
+    Runs every API case of the suite once and checks that instrumentation.py records its statements
+    under the API function itself, not under a helper it goes through (operations.run, the lookup
+    cache and its load closures)
+
+    Parameters:
+        pool - ConnectionPool
+        writes - Check the add/change/remove cycles too (they need auto-increment keys)
+
+    Returns:
+        List of (case, expected caller, callers recorded, ok)
+    '''
+    with pool.session() as cursor:
+        sample = _suite_sample(cursor, random.Random(1), 1)
+    cases = _read_cases(sample)
+    for _, steps in _write_cycles(sample) if writes else []:
+        cases.extend(steps)
+
+    functions = {name: globals()[name.split()[0]] for name, _ in cases}
+    # An API function may call another (add_member reads the member back with find_member)
+    known = {f"{function.__module__}.{function.__name__}" for function in functions.values()}
+    results = []
+    for name, call in cases:
+        expected = f"{functions[name].__module__}.{functions[name].__name__}"
+        stats = QueryStats(slow_threshold=float("inf"))
+        # A cached row would leave the lookups nothing to record
+        LOOKUP_CACHE.clear()
+        with pool.session() as cursor:
+            instrumented = InstrumentedCursor(cursor, stats)
+            call(instrumented, 0)
+            # Records the last statement, which is otherwise timed until the next one
+            instrumented.close()
+        callers = sorted(stats.by_caller)
+        results.append((name, expected, callers, expected in callers and set(callers) <= known))
+    return results
+
+
+def cmd_attribution(pool, args):
+    results = statement_attribution(pool, not args.no_writes)
+    for name, expected, callers, ok in results:
+        print(f"{name:<32} {'ok' if ok else 'WRONG'}: {', '.join(callers) or 'no statements'}"
+              + ("" if ok else f" (expected {expected})"))
+    return 0 if all(ok for *_, ok in results) else 1
+
+
+def cmd_compare(pool, args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    for label, run in (("baseline", baseline), ("candidate", candidate)):
+        metadata = run["metadata"]
+        print(f"{label}: {metadata['fixture']}, server {metadata['server']}, prepared {metadata['prepared']}")
+    if (baseline["metadata"]["fixture"] or {}).get("scale") != (candidate["metadata"]["fixture"] or {}).get("scale"):
+        print("Warning: the runs were measured on different fixtures")
+
+    print(f"{'case':<32} {'base ms':>10} {'new ms':>10} {'ratio':>8}")
+    for name, before in baseline["results"].items():
+        after = candidate["results"].get(name)
+        if after is None:
+            print(f"{name:<32} {before['median_ms']:>10.2f} {'-':>10}")
+            continue
+        ratio = after["median_ms"] / before["median_ms"] if before["median_ms"] > 0 else 0.0
+        print(f"{name:<32} {before['median_ms']:>10.2f} {after['median_ms']:>10.2f} {ratio:>7.2f}x")
+    for name in candidate["results"].keys() - baseline["results"].keys():
+        print(f"{name:<32} {'-':>10} {candidate['results'][name]['median_ms']:>10.2f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MuskieCo stress tests and benchmarks")
+    parser.add_argument("--snapshot", help="Run on a DuckDB or SQLite file (see backends.py) instead of MySQL")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stress = commands.add_parser("inventory-stress", help="Concurrent increments on one inventory row")
+    stress.add_argument("--product-id", type=int, default=1)
+    stress.add_argument("--store-id", type=int, default=1)
+    stress.add_argument("--threads", type=int, default=16)
+    stress.add_argument("--updates", type=int, default=200, help="Updates per thread")
+    stress.add_argument("--non-negative", action="store_true", help="Mix in guarded decrements")
+    stress.set_defaults(handler=cmd_inventory_stress, pool_size=lambda a: a.threads)
+
+    totals = commands.add_parser("transaction-totals", help="Latency of transaction_totals per ID count")
+    totals.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100, 1000])
+    totals.add_argument("--repeat", type=int, default=20)
+    totals.set_defaults(handler=cmd_transaction_totals, pool_size=lambda a: 1)
+
+    sales = commands.add_parser("sales-range", help="Rows read by the sales query with and without a date range")
+    sales.add_argument("--rows", type=int, default=1000000, help=f"Rows in {SALES_BENCH_TABLE}")
+    sales.add_argument("--days", type=int, default=30)
+    sales.add_argument("--repeat", type=int, default=5)
+    sales.set_defaults(handler=cmd_sales_range, pool_size=lambda a: 1)
+
+    concurrency = commands.add_parser("async-throughput", help="Member lookups from threads vs asyncio tasks")
+    concurrency.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    concurrency.add_argument("--requests", type=int, default=2000, help="Lookups per run")
+    concurrency.set_defaults(handler=cmd_async_throughput, pool_size=lambda a: max(a.clients))
+
+    prepared = commands.add_parser("prepared-statements", help="Plain vs prepared point lookups and updates")
+    prepared.add_argument("--iterations", type=int, default=5000, help="Calls per case and mode")
+    prepared.set_defaults(handler=cmd_prepared_statements, pool_size=lambda a: 1)
+
+    checkouts = commands.add_parser("checkout-throughput", help="Concurrent checkouts, one commit each vs group commit")
+    checkouts.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    checkouts.add_argument("--checkouts", type=int, default=2000, help="Checkouts per run")
+    checkouts.add_argument("--mode", choices=["single", "group", "both"], default="both")
+    checkouts.add_argument("--workers", type=int, default=4, help="Group commit connections")
+    checkouts.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Checkouts per group commit")
+    checkouts.set_defaults(handler=cmd_checkout_throughput, pool_size=lambda a: max(max(a.clients), a.workers))
+
+    daemon = commands.add_parser("daemon-latency", help="One operation per process vs through a running daemon")
+    daemon.add_argument("--op", default="search_store", help="batch.py operation")
+    daemon.add_argument("--args", default='{"store_id": 1}', help="Its arguments as a JSON object")
+    daemon.add_argument("--calls", type=int, default=20, help="Calls per way")
+    daemon.set_defaults(handler=cmd_daemon_latency, pool_size=lambda a: 0)
+
+    suite = commands.add_parser("suite", help="Time every API function and report, and write a results file")
+    suite.add_argument("--iterations", type=int, default=200, help="Calls per API case")
+    suite.add_argument("--report-repeat", type=int, default=3, help="Runs per report")
+    suite.add_argument("--reports", nargs="+", choices=list(REPORTS), help="Reports to run (default all)")
+    suite.add_argument("--days", type=int, default=90, help="Date range of the sales and spend reports")
+    suite.add_argument("--seed", type=int, default=1, help="Seed for the sampled keys")
+    suite.add_argument("--no-writes", action="store_true",
+                       help="Skip the add/change/remove cycles (for snapshots taken with backends.py)")
+    suite.add_argument("-o", "--output", help="Results file (default bench-<scale>-<time>.json)")
+    suite.set_defaults(handler=cmd_suite, pool_size=lambda a: 1)
+
+    attribution = commands.add_parser("attribution", help="Check that statements are recorded under their API function")
+    attribution.add_argument("--no-writes", action="store_true", help="Skip the add/change/remove cases")
+    attribution.set_defaults(handler=cmd_attribution, pool_size=lambda a: 1)
+
+    compare = commands.add_parser("compare", help="Compare two suite results files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(handler=cmd_compare, pool_size=lambda a: 0)
+
+    args = parser.parse_args(argv)
+    if not args.pool_size(args):
+        return args.handler(None, args)
+    pool = open_pool(args.snapshot, pool_size=args.pool_size(args))
+    try:
+        return args.handler(pool, args)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
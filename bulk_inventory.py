@@ -0,0 +1,339 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to apply large batches of inventory deltas (e.g. a truck delivery)
+
+Deltas are read from a CSV or JSONL file (or stdin) and applied with multi-row
+INSERT ... ON DUPLICATE KEY UPDATE statements, one short transaction per chunk.
+
+This file:
+    1. Parses (ProductID, StoreID, Quantity) deltas from CSV or JSONL
+    2. Applies them in chunks of batch_size rows, reporting progress and throughput per chunk
+    3. Retries a failed chunk on a fresh connection; every chunk is recorded in InventoryIngestLog
+       inside its own transaction, so a chunk that already committed is never applied twice
+
+Every run gets a new run ID unless one is given, so delivering the same deltas twice applies
+them twice. To resume a failed run without re-applying its committed chunks, rerun it with the
+run ID it printed (--run-id) and --skip.
+
+Usage:
+    python bulk_inventory.py deliveries.csv --batch-size 2000
+    cat deltas.jsonl | python bulk_inventory.py - --format jsonl
+    python bulk_inventory.py deliveries.csv --run-id 1f0c2d6e9a4b --skip 42000
+'''
+
+import argparse
+import csv
+import hashlib
+import json
+import sys
+import time
+import uuid
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from db_pool import RETRYABLE_ERRORS
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_RETRIES = 3
+
+# UTF-8 byte order mark, as read through a text stream
+BOM = "\ufeff"
+
+CREATE_INGEST_LOG = """
+    CREATE TABLE IF NOT EXISTS InventoryIngestLog (
+        BatchKey CHAR(64) PRIMARY KEY,
+        RowsApplied INT NOT NULL,
+        AppliedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Column names accepted for each field (compared case-insensitively)
+FIELD_ALIASES = {
+    "product_id": ("productid", "product_id", "product"),
+    "store_id": ("storeid", "store_id", "store"),
+    "quantity": ("quantity", "qty", "delta", "instockquantity"),
+}
+
+
+class BulkIngestError(Exception):
+    '''
+    Raised when a chunk cannot be applied; resume_from is the number of input rows already
+    committed and run_id the run ID to resume with
+    '''
+
+    def __init__(self, message, resume_from, run_id=None):
+        super().__init__(message)
+        self.resume_from = resume_from
+        self.run_id = run_id
+
+
+# ------ Parsing ------
+
+def _pick(record, field, line_no):
+    for key, value in record.items():
+        if key is not None and key.strip().lower() in FIELD_ALIASES[field]:
+            return int(value)
+    raise ValueError(f"Line {line_no}: missing {field}")
+
+
+def read_inventory_deltas(stream, fmt=None):
+    '''
+    Parses inventory deltas from a text stream
+
+    CSV input may have a header naming ProductID, StoreID and Quantity (any order), or
+    no header, in which case the columns are taken in that order. The header is the first row
+    that is not blank or a comment (#...); a UTF-8 byte order mark before it is dropped. JSONL
+    input holds one object per line with the same keys.
+
+    Parameters:
+        stream - Open text file or sys.stdin
+        fmt - "csv" or "jsonl"; guessed from the first character when None
+
+    Returns:
+        Generator of (product_id, store_id, quantity) tuples
+    '''
+    if fmt is None:
+        first = stream.read(1)
+        while first and (first.isspace() or first == BOM):
+            first = stream.read(1)
+        fmt = "jsonl" if first == "{" else "csv"
+        stream = _Prefixed(first, stream)
+
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield (_pick(record, "product_id", line_no), _pick(record, "store_id", line_no),
+                   _pick(record, "quantity", line_no))
+        return
+
+    reader = csv.reader(stream)
+    header = None
+    seen_data = False
+    for line_no, row in enumerate(reader, start=1):
+        if row and header is None and not seen_data:
+            # Spreadsheet exports start with a byte order mark
+            row[0] = row[0].lstrip(BOM)
+        if not row or not "".join(row).strip() or row[0].lstrip().startswith("#"):
+            continue
+        if header is None and not seen_data and not row[0].strip().lstrip("-").isdigit():
+            header = row
+            continue
+        seen_data = True
+        if header:
+            record = dict(zip(header, row))
+            yield (_pick(record, "product_id", line_no), _pick(record, "store_id", line_no),
+                   _pick(record, "quantity", line_no))
+        else:
+            yield int(row[0]), int(row[1]), int(row[2])
+
+
+class _Prefixed:
+    '''
+    Line iterator that puts back the character consumed while guessing the format
+    '''
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def __iter__(self):
+        first_line = self.prefix + self.stream.readline() if self.prefix else None
+        if first_line:
+            yield first_line
+        yield from self.stream
+
+
+# ------ Applying ------
+
+def _chunks(deltas, batch_size):
+    chunk = []
+    for delta in deltas:
+        chunk.append(delta)
+        if len(chunk) == batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _batch_key(run_id, index, chunk):
+    digest = hashlib.sha256(f"{run_id}:{index}:".encode())
+    for delta in chunk:
+        digest.update(f"{delta[0]},{delta[1]},{delta[2]};".encode())
+    return digest.hexdigest()
+
+
+def _apply_chunk(cursor, batch_key, chunk):
+    '''
+    Applies one chunk in its own transaction
+
+    Returns:
+        False if the chunk had already been committed by an earlier attempt or run, else True
+    '''
+    cursor.execute("START TRANSACTION")
+    try:
+        cursor.execute("INSERT INTO InventoryIngestLog (BatchKey, RowsApplied) VALUES (%s, %s)",
+                       (batch_key, len(chunk)))
+    except mysql.connector.Error as e:
+        cursor.execute("ROLLBACK")
+        if e.errno == errorcode.ER_DUP_ENTRY:
+            return False
+        raise
+
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(chunk))
+    params = [value for delta in chunk for value in delta]
+    cursor.execute(
+        "INSERT INTO ProductQuantity (ProductID, StoreID, InstockQuantity) VALUES " + placeholders +
+        " ON DUPLICATE KEY UPDATE InstockQuantity = InstockQuantity + VALUES(InstockQuantity)",
+        params
+    )
+    cursor.execute("COMMIT")
+    return True
+
+
+def bulk_update_inventory(pool, deltas, batch_size=DEFAULT_BATCH_SIZE, run_id=None,
+                          max_retries=MAX_RETRIES, skip=0, progress=print):
+    '''
+    Applies inventory deltas in chunked transactions
+
+    Each chunk checks out its own pooled connection, so a retry after a dropped connection
+    starts on a healthy one. Requires a unique key on ProductQuantity (ProductID, StoreID).
+
+    Parameters:
+        pool - ConnectionPool
+        deltas - Iterable of (product_id, store_id, quantity)
+        batch_size - Rows per INSERT statement and per transaction
+        run_id - Identifies this delivery; re-running with the same run_id skips committed chunks
+                 (a new one for every call when None, so repeat deliveries are applied again)
+        max_retries - Attempts per chunk for deadlocks, lock timeouts and lost connections
+        skip - Number of leading input rows to skip (resume_from of an earlier failed run)
+        progress - Function called with a progress line per chunk (None to stay quiet)
+
+    Returns:
+        Dictionary with run_id, rows, chunks, skipped_chunks and elapsed seconds
+    '''
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if run_id is None:
+        run_id = uuid.uuid4().hex[:12]
+
+    with pool.session() as cursor:
+        cursor.execute(CREATE_INGEST_LOG)
+
+    started = time.perf_counter()
+    summary = {"run_id": run_id, "rows": 0, "chunks": 0, "skipped_chunks": 0, "elapsed": 0.0}
+    committed = skip
+
+    deltas = iter(deltas)
+    for _ in range(skip):
+        next(deltas, None)
+
+    for index, chunk in enumerate(_chunks(deltas, batch_size), start=skip // batch_size):
+        batch_key = _batch_key(run_id, index, chunk)
+        chunk_started = time.perf_counter()
+        for attempt in range(1, max_retries + 1):
+            try:
+                with pool.session() as cursor:
+                    applied = _apply_chunk(cursor, batch_key, chunk)
+                break
+            except mysql.connector.Error as e:
+                if e.errno not in RETRYABLE_ERRORS or attempt == max_retries:
+                    raise BulkIngestError(f"Chunk {index} failed after {attempt} attempt(s): {e}",
+                                          committed, run_id) from e
+                time.sleep(0.2 * 2 ** (attempt - 1))
+
+        committed += len(chunk)
+        chunk_elapsed = time.perf_counter() - chunk_started
+        if applied:
+            summary["rows"] += len(chunk)
+            summary["chunks"] += 1
+        else:
+            summary["skipped_chunks"] += 1
+        if progress:
+            status = "applied" if applied else "already applied, skipped"
+            rate = len(chunk) / chunk_elapsed if chunk_elapsed > 0 else 0.0
+            progress(f"Chunk {index}: {len(chunk)} rows {status} ({committed} total, {rate:.0f} rows/s)")
+
+    summary["elapsed"] = time.perf_counter() - started
+    return summary
+
+
+def print_summary(summary):
+    rate = summary["rows"] / summary["elapsed"] if summary["elapsed"] > 0 else 0.0
+    print(f"Run {summary['run_id']}: applied {summary['rows']} deltas in {summary['chunks']} chunk(s) "
+          f"({summary['skipped_chunks']} skipped) in {summary['elapsed']:.2f}s, {rate:.0f} rows/s")
+
+
+def bulk_inventory_import(pool):
+    '''
+    Interactive bulk import used by the CLI menu
+
+    Parameters:
+        pool - ConnectionPool
+
+    Returns:
+        None
+    '''
+    path = input("Path to CSV/JSONL file of deltas: ").strip()
+    size = input(f"Batch size (press Enter for {DEFAULT_BATCH_SIZE}): ").strip()
+    batch_size = int(size) if size else DEFAULT_BATCH_SIZE
+    run_id = input("Run ID to resume (press Enter for a new delivery): ").strip() or None
+    try:
+        with open(path, newline="") as f:
+            summary = bulk_update_inventory(pool, read_inventory_deltas(f, _format_for(path)),
+                                            batch_size=batch_size, run_id=run_id)
+        print_summary(summary)
+    except OSError as e:
+        print(f"Could not read file: {e}")
+    except ValueError as e:
+        print(f"Invalid input: {e}")
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+    except BulkIngestError as e:
+        print(f"{e}\nRows already committed: {e.resume_from} (rerun with run ID {e.run_id} to resume, "
+              f"committed chunks are skipped)")
+
+
+def _format_for(path):
+    lowered = path.lower()
+    if lowered.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if lowered.endswith(".csv"):
+        return "csv"
+    return None
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Apply inventory deltas from a CSV/JSONL file or stdin")
+    parser.add_argument("path", help="Input file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (guessed by default)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--run-id", help="Run ID of an earlier run to resume, skipping its committed chunks "
+                                         "(default a new run)")
+    parser.add_argument("--skip", type=int, default=0, help="Skip this many leading input rows")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(prompt=args.path != "-")
+    try:
+        stream = sys.stdin if args.path == "-" else open(args.path, newline="")
+        with stream:
+            summary = bulk_update_inventory(pool, read_inventory_deltas(stream, args.format or _format_for(args.path)),
+                                            batch_size=args.batch_size, run_id=args.run_id, skip=args.skip)
+        print_summary(summary)
+    except BulkIngestError as e:
+        print(e, file=sys.stderr)
+        print(f"Resume with --run-id {e.run_id} --skip {e.resume_from}", file=sys.stderr)
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
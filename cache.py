@@ -0,0 +1,249 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to keep recently looked-up members, staff and stores in memory
+
+Lookups go through the cache first (read-through); a miss reads MySQL and stores the row.
+Every row is stored once under its ID, with its email as a second key for members and staff.
+
+This file:
+    1. Bounds the cache to max_entries rows, evicting the least recently used one
+    2. Expires rows after ttl seconds, which bounds staleness after changes made outside the APIs
+    3. Never serves a row changed through the APIs:
+        - every API write drops the rows it touches
+        - until the writing session commits or rolls back, lookups of that kind skip the cache,
+          so no other thread can cache the old row in between
+        - a lookup that started before a write is not stored (generation check)
+    4. Counts hits, misses, evictions and expirations
+
+Environment:
+    MUSKIECO_CACHE_SIZE - Most rows kept (default 10000, 0 disables the cache)
+    MUSKIECO_CACHE_TTL - Seconds a row is trusted (default 60)
+'''
+
+import collections
+import contextvars
+import os
+import threading
+import time
+
+# Kind -> (index of the ID in a row, index of the email in a row or None)
+KINDS = {
+    "member": (0, 1),
+    "staff": (0, 6),
+    "store": (0, None),
+}
+
+
+def as_key(value):
+    '''
+    Returns value as an integer ID, or None if it is not one
+    '''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class LookupCache:
+    '''
+    Thread-safe LRU/TTL cache of member, staff and store rows
+
+    Parameters:
+        max_entries - Most rows kept across all kinds (0 disables the cache)
+        ttl - Seconds a row is served before it is read again
+    '''
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (kind, id) -> (row, stored_at); ordered from least to most recently used
+        self._rows = collections.OrderedDict()
+        # (kind, email) -> id
+        self._aliases = {}
+        self._generation = collections.Counter()
+        # Kind -> number of sessions with uncommitted writes of that kind
+        self._dirty = collections.Counter()
+        # Kinds written by the current session; a context variable, so every thread and
+        # every asyncio task has its own
+        self._kinds = contextvars.ContextVar(f"lookup_cache_writes_{id(self)}", default=None)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "bypasses": 0}
+
+    # ------ Reads ------
+
+    def _get(self, kind, key, alias):
+        if key is None and alias is not None:
+            key = self._aliases.get((kind, alias))
+        if key is None:
+            return None
+        entry = self._rows.get((kind, key))
+        if entry is None:
+            return None
+        row, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self._drop(kind, key)
+            self.stats["expirations"] += 1
+            return None
+        self._rows.move_to_end((kind, key))
+        return row
+
+    def _put(self, kind, row):
+        id_index, alias_index = KINDS[kind]
+        key = row[id_index]
+        self._drop(kind, key)
+        self._rows[(kind, key)] = (row, time.monotonic())
+        if alias_index is not None:
+            self._aliases[(kind, row[alias_index])] = key
+        while len(self._rows) > self.max_entries:
+            (old_kind, old_key), _ = next(iter(self._rows.items()))
+            self._drop(old_kind, old_key)
+            self.stats["evictions"] += 1
+
+    def _drop(self, kind, key):
+        entry = self._rows.pop((kind, key), None)
+        alias_index = KINDS[kind][1]
+        if entry is not None and alias_index is not None:
+            self._aliases.pop((kind, entry[0][alias_index]), None)
+
+    def _begin(self, kind, key, alias):
+        '''
+        Returns (row, generation): the cached row, or None and the generation to store a loaded row under
+        '''
+        with self._lock:
+            if self._dirty[kind]:
+                self.stats["bypasses"] += 1
+                return None, None
+            row = self._get(kind, key, alias)
+            if row is not None:
+                self.stats["hits"] += 1
+                return row, None
+            self.stats["misses"] += 1
+            return None, self._generation[kind]
+
+    def _store(self, kind, row, generation):
+        if row is not None and generation is not None:
+            with self._lock:
+                if self._generation[kind] == generation and not self._dirty[kind]:
+                    self._put(kind, row)
+
+    def lookup(self, kind, load, key=None, alias=None):
+        '''
+        Returns a row from the cache, or loads and caches it
+
+        Parameters:
+            kind - "member", "staff" or "store"
+            load - Function with no arguments that reads the row from MySQL (None if missing)
+            key - The row's ID
+            alias - The row's email (when looking up by email)
+
+        Returns:
+            The row, or None if load found nothing (misses are not cached)
+        '''
+        if self.max_entries <= 0:
+            return load()
+        row, generation = self._begin(kind, key, alias)
+        if row is not None:
+            return row
+        row = load()
+        self._store(kind, row, generation)
+        return row
+
+    async def alookup(self, kind, load, key=None, alias=None):
+        '''
+        lookup for asyncio code: load is a coroutine function
+        '''
+        if self.max_entries <= 0:
+            return await load()
+        row, generation = self._begin(kind, key, alias)
+        if row is not None:
+            return row
+        row = await load()
+        self._store(kind, row, generation)
+        return row
+
+    # ------ Writes ------
+
+    def write(self, kind, key=None, alias=None):
+        '''
+        Called by an API function before it changes a row; drops the row and keeps the kind
+        out of the cache until the current session commits or rolls back (see end_writes)
+
+        Parameters:
+            kind - "member", "staff" or "store"
+            key - ID of the changed row, if known
+            alias - Email of the changed row, if known
+        '''
+        pending = self._pending()
+        with self._lock:
+            if kind not in pending:
+                pending.add(kind)
+                self._dirty[kind] += 1
+            self._generation[kind] += 1
+            if key is None and alias is not None:
+                key = self._aliases.get((kind, alias))
+            if key is not None:
+                self._drop(kind, key)
+
+    def write_all(self, kind):
+        '''
+        Like write, for statements that change any number of rows of a kind (drops them all)
+        '''
+        self.write(kind)
+        with self._lock:
+            for cached_kind, key in [k for k in self._rows if k[0] == kind]:
+                self._drop(cached_kind, key)
+
+    def end_writes(self):
+        '''
+        Ends the current session's pending writes; called when it commits or rolls back
+        '''
+        pending = self._pending()
+        if not pending:
+            return
+        with self._lock:
+            for kind in pending:
+                self._dirty[kind] -= 1
+                self._generation[kind] += 1
+        pending.clear()
+
+    def begin_session(self):
+        '''
+        Gives the current context its own set of pending writes (asyncio sessions call this,
+        so tasks started from the same parent do not share one)
+        '''
+        if not self._pending():
+            self._kinds.set(set())
+
+    def _pending(self):
+        kinds = self._kinds.get()
+        if kinds is None:
+            kinds = set()
+            self._kinds.set(kinds)
+        return kinds
+
+    def attach(self, pool):
+        '''
+        Ends pending writes whenever a session of pool commits or rolls back
+        '''
+        pool.on_commit(self.end_writes)
+        pool.on_rollback(self.end_writes)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._aliases.clear()
+            for kind in KINDS:
+                self._generation[kind] += 1
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups * 100 if lookups else 0.0
+        return (f"Lookup cache: {self.stats['hits']} hits, {self.stats['misses']} misses ({rate:.0f}% hit rate), "
+                f"{self.stats['evictions']} evictions, {self.stats['expirations']} expirations, "
+                f"{self.stats['bypasses']} bypassed during writes, {len(self._rows)} rows cached")
+
+
+# Shared by every session in this process
+LOOKUP_CACHE = LookupCache(int(os.environ.get("MUSKIECO_CACHE_SIZE", 10000)),
+                           float(os.environ.get("MUSKIECO_CACHE_TTL", 60)))
@@ -0,0 +1,482 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to record sales: a checkout writes the sale, its line items and the
+stock it takes in one short transaction
+
+A checkout:
+    1. Takes the sold quantities off ProductQuantity for the store with guarded updates
+       (InstockQuantity - n only where at least n are in stock), in ProductID order so two
+       checkouts never wait on each other's rows in opposite orders; if any line is short
+       nothing is kept and OutOfStock says what was missing
+    2. Prices the lines from the in-process price cache (pricing.py), applying valid discounts
+    3. Inserts the TransactionInfo row and all of its Involves rows (one row per unit sold,
+       as the billing queries count them) with one multi-row INSERT
+    4. Adds reward points to the customer's balance if the customer is a member
+
+TransactionIDs are handed out in blocks from the CheckoutSequence table, so checkouts do not
+queue on a counter row: only the first checkout after a block runs out touches it. Every
+reservation also moves the sequence past the largest TransactionID recorded, so rows inserted
+without it (datagen.py, a reload) are never collided with.
+
+TransactionInfo.StoreID is optional: the original schema has no such column, and then the
+selling store is not recorded (the per-store rollup in rollups.py needs it).
+
+Group commit: a GroupCommitter collects checkouts from many threads and records up to
+max_batch of them in one transaction (each under its own SAVEPOINT, so one that is short of
+stock is undone alone), paying for one commit per batch instead of one per sale.
+
+This file:
+    1. TransactionIds: block allocation of TransactionIDs
+    2. record_sale (no commit) and checkout (its own transaction)
+    3. GroupCommitter for many concurrent checkouts
+    4. Command line checkout
+
+Usage:
+    python checkout.py --store 3 --customer 1042 17:2 240:1
+'''
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+from decimal import Decimal
+
+import mysql.connector
+
+from cache import LOOKUP_CACHE, as_key
+from db_pool import RETRYABLE_ERRORS
+from pricing import DISCOUNT_FACTOR, PRICE_CACHE, apply_discount
+from queries import (ADD_REWARD_POINTS, GUARDED_STOCK_CHANGE, INSERT_TRANSACTION, INSERT_TRANSACTION_NO_STORE,
+                     STOCK_OF, involves_insert)
+
+# Reward points a member earns per dollar of the final total (rounded down)
+REWARD_POINTS_PER_DOLLAR = 1
+
+# Most units one sale may hold (one Involves row each)
+MAX_UNITS_PER_SALE = 1000
+
+# TransactionIDs reserved per trip to CheckoutSequence
+ID_BLOCK_SIZE = 1000
+
+# Seconds a block of TransactionIDs is used before its remaining IDs are skipped; bounds how
+# late an ID below already committed ones can still commit (see rollups.GAP_RETENTION_HOURS)
+ID_BLOCK_MAX_AGE = 600
+
+# Checkouts per group commit, and seconds a batch waits to fill up
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT = 0.002
+
+MAX_RETRIES = 3
+
+CREATE_SEQUENCE = """
+    CREATE TABLE IF NOT EXISTS CheckoutSequence (
+        Name VARCHAR(64) PRIMARY KEY,
+        NextID BIGINT NOT NULL
+    )
+"""
+
+CENT = Decimal("0.01")
+
+# Whether TransactionInfo has a StoreID column (None until checked, once per process)
+_has_store_column = None
+
+
+class OutOfStock(ValueError):
+    '''
+    Raised when a store does not have enough of some products; nothing of the sale is kept
+
+    Attributes:
+        store_id - The store
+        shortages - List of (ProductID, wanted, in stock or None if the store does not carry it)
+    '''
+
+    def __init__(self, store_id, shortages):
+        lines = ", ".join(f"{product_id} (wanted {wanted}, in stock {available or 0})"
+                          for product_id, wanted, available in shortages)
+        super().__init__(f"Store {store_id} is short of: {lines}")
+        self.store_id = store_id
+        self.shortages = shortages
+
+
+# ------ Transaction IDs ------
+
+class TransactionIds:
+    '''
+    Hands out TransactionIDs from blocks reserved in CheckoutSequence (thread-safe)
+
+    Each block starts after the largest TransactionID recorded so far, whether or not it came
+    from the sequence. IDs of a block that is not used up before the process exits are skipped,
+    never reused; neither are those left when a block gets older than max_age.
+
+    Parameters:
+        block_size - IDs reserved per trip to the database
+        max_age - Seconds a block is used before a fresh one is reserved
+    '''
+
+    def __init__(self, block_size=ID_BLOCK_SIZE, max_age=ID_BLOCK_MAX_AGE):
+        self.block_size = block_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+        self._reserved_at = 0
+        self._ready = False
+
+    def take(self, cursor, count=1):
+        '''
+        Returns count new TransactionIDs
+
+        Reserving a block commits, so call this outside a transaction
+
+        Parameters:
+            cursor - Active MySQL cursor, only used when the current block runs out
+            count - Number of IDs wanted
+
+        Returns:
+            List of TransactionIDs
+        '''
+        with self._lock:
+            if self._limit - self._next < count or time.monotonic() - self._reserved_at > self.max_age:
+                self._reserve(cursor, max(count, self.block_size))
+            ids = list(range(self._next, self._next + count))
+            self._next += count
+            return ids
+
+    def _reserve(self, cursor, size):
+        if not self._ready:
+            cursor.execute(CREATE_SEQUENCE)
+            cursor.execute("INSERT IGNORE INTO CheckoutSequence (Name, NextID) VALUES ('TransactionInfo', 1)")
+            cursor.execute("COMMIT")
+            self._ready = True
+        cursor.execute("START TRANSACTION")
+        try:
+            # Rows inserted without the sequence since the last block (datagen.py, a reload) move it on
+            cursor.execute("""
+                UPDATE CheckoutSequence
+                SET NextID = LAST_INSERT_ID(GREATEST(NextID, (SELECT COALESCE(MAX(TransactionID), 0) + 1
+                                                              FROM TransactionInfo)) + %s)
+                WHERE Name = 'TransactionInfo'
+            """, (size,))
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            limit = cursor.fetchone()[0]
+            cursor.execute("COMMIT")
+        except mysql.connector.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        self._next, self._limit = limit - size, limit
+        self._reserved_at = time.monotonic()
+
+
+TRANSACTION_IDS = TransactionIds()
+
+
+def has_store_column(cursor):
+    '''
+    Returns whether TransactionInfo has the StoreID column (checked once per process)
+    '''
+    global _has_store_column
+    if _has_store_column is None:
+        cursor.execute("SELECT * FROM TransactionInfo LIMIT 0")
+        cursor.fetchall()
+        _has_store_column = any(column[0].lower() == "storeid" for column in cursor.description)
+    return _has_store_column
+
+
+# ------ Checkout ------
+
+def sale_lines(items):
+    '''
+    Validates and merges the items of a sale
+
+    Parameters:
+        items - Dictionary ProductID -> quantity, or iterable of (ProductID, quantity) pairs
+
+    Returns:
+        List of (ProductID, quantity) in ProductID order (raises ValueError for a bad sale)
+    '''
+    pairs = items.items() if isinstance(items, dict) else items
+    merged = {}
+    for product_id, quantity in pairs:
+        product_id, quantity = int(product_id), int(quantity)
+        if quantity <= 0:
+            raise ValueError(f"Quantity of product {product_id} must be positive")
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    if not merged:
+        raise ValueError("A sale needs at least one item")
+    if sum(merged.values()) > MAX_UNITS_PER_SALE:
+        raise ValueError(f"A sale may hold at most {MAX_UNITS_PER_SALE} units")
+    return sorted(merged.items())
+
+
+def record_sale(cursor, transaction_id, store_id, customer_id, items, purchase_date=None, factor=DISCOUNT_FACTOR):
+    '''
+    Records one sale inside the caller's transaction (no commit)
+
+    Raises OutOfStock when the store cannot cover every line; the stock already taken by this
+    sale is part of the transaction, so the caller must roll back (or back to a savepoint)
+
+    Parameters:
+        cursor - Active MySQL cursor
+        transaction_id - New TransactionID (see TransactionIds)
+        store_id - Selling store (only recorded when TransactionInfo has StoreID, see has_store_column)
+        customer_id - Buying customer
+        items - Dictionary ProductID -> quantity, or iterable of (ProductID, quantity) pairs
+        purchase_date - Date of the sale (today when None)
+        factor - Multiplier applied to discounted products
+
+    Returns:
+        Dictionary with transaction_id, subtotal, discount, total, units and points (reward points earned)
+    '''
+    lines = sale_lines(items)
+
+    shortages = []
+    for product_id, quantity in lines:
+        cursor.execute(GUARDED_STOCK_CHANGE, (-quantity, product_id, store_id, -quantity))
+        if cursor.rowcount == 0:
+            shortages.append((product_id, quantity))
+    if shortages:
+        missing = []
+        for product_id, quantity in shortages:
+            cursor.execute(STOCK_OF, (product_id, store_id))
+            row = cursor.fetchone()
+            missing.append((product_id, quantity, row[0] if row else None))
+        raise OutOfStock(store_id, missing)
+
+    prices, discounted = PRICE_CACHE.snapshot(cursor)
+    subtotal = total = Decimal(0)
+    for product_id, quantity in lines:
+        price = prices.get(product_id)
+        if price is None:
+            raise ValueError(f"Product {product_id} has no price")
+        final = apply_discount(price, factor) if product_id in discounted else price
+        subtotal += Decimal(price) * quantity
+        total += Decimal(final) * quantity
+    subtotal, total = subtotal.quantize(CENT), total.quantize(CENT)
+
+    row = (transaction_id, purchase_date or date.today(), total, customer_id)
+    if has_store_column(cursor):
+        cursor.execute(INSERT_TRANSACTION, row + (store_id,))
+    else:
+        cursor.execute(INSERT_TRANSACTION_NO_STORE, row)
+    units = [(transaction_id, product_id) for product_id, quantity in lines for _ in range(quantity)]
+    cursor.execute(involves_insert(len(units)), [value for unit in units for value in unit])
+
+    points = int(total * REWARD_POINTS_PER_DOLLAR)
+    if points > 0:
+        LOOKUP_CACHE.write("member", as_key(customer_id))
+        cursor.execute(ADD_REWARD_POINTS, (points, customer_id))
+        if cursor.rowcount == 0:
+            # Not a member
+            points = 0
+
+    return {"transaction_id": transaction_id, "subtotal": subtotal, "discount": subtotal - total,
+            "total": total, "units": len(units), "points": points}
+
+
+def checkout(cursor, store_id, customer_id, items, purchase_date=None, ids=TRANSACTION_IDS):
+    '''
+    Records one sale in its own transaction and commits it (see record_sale)
+
+    Parameters:
+        cursor - Active MySQL cursor
+        store_id - Selling store
+        customer_id - Buying customer
+        items - Dictionary ProductID -> quantity, or iterable of (ProductID, quantity) pairs
+        purchase_date - Date of the sale (today when None)
+        ids - TransactionIds to take the TransactionID from
+
+    Returns:
+        The receipt dictionary of record_sale (raises OutOfStock, with nothing changed, when short)
+    '''
+    sale_lines(items)
+    transaction_id = ids.take(cursor)[0]
+    # Load the price list (if stale) before the transaction starts, not while it holds row locks
+    PRICE_CACHE.snapshot(cursor)
+
+    cursor.execute("START TRANSACTION")
+    try:
+        receipt = record_sale(cursor, transaction_id, store_id, customer_id, items, purchase_date)
+        cursor.execute("COMMIT")
+        return receipt
+    except (ValueError, mysql.connector.Error):
+        cursor.execute("ROLLBACK")
+        raise
+
+
+# ------ Group commit ------
+
+class GroupCommitter:
+    '''
+    Records checkouts submitted from any number of threads in shared transactions
+
+    Each worker thread takes up to max_batch waiting checkouts (waiting at most max_wait seconds
+    for a batch to fill), records them on one pooled connection and commits once. A checkout that
+    is short of stock or invalid is rolled back to its savepoint and fails alone; a deadlock or
+    lost connection retries the whole batch. A checkout's Future is only resolved after its
+    batch has committed.
+
+    Parameters:
+        pool - ConnectionPool with at least workers connections
+        workers - Worker threads (connections) recording batches
+        max_batch - Most checkouts per transaction
+        max_wait - Seconds a worker waits for more checkouts before committing a partial batch
+        ids - TransactionIds to take the TransactionIDs from
+    '''
+
+    def __init__(self, pool, workers=2, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_MAX_WAIT, ids=TRANSACTION_IDS):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.ids = ids
+        self.stats = {"batches": 0, "checkouts": 0, "retries": 0}
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, store_id, customer_id, items, purchase_date=None):
+        '''
+        Queues a checkout
+
+        Returns:
+            concurrent.futures.Future resolving to the receipt (see record_sale) or raising OutOfStock
+        '''
+        sale_lines(items)
+        future = Future()
+        self._queue.put((future, (store_id, customer_id, items, purchase_date)))
+        return future
+
+    def checkout(self, store_id, customer_id, items, purchase_date=None):
+        '''
+        Queues a checkout and waits until its batch has committed
+
+        Returns:
+            The receipt dictionary of record_sale
+        '''
+        return self.submit(store_id, customer_id, items, purchase_date).result()
+
+    def close(self):
+        '''
+        Records everything already submitted, then stops the workers
+        '''
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Leave the stop signal for this worker's next round
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._commit_batch(batch)
+            except BaseException as e:
+                for future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit_batch(self, batch):
+        with self.pool.session() as cursor:
+            transaction_ids = self.ids.take(cursor, len(batch))
+            PRICE_CACHE.snapshot(cursor)
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            outcomes = []
+            try:
+                with self.pool.session() as cursor:
+                    cursor.execute("START TRANSACTION")
+                    for transaction_id, (_, request) in zip(transaction_ids, batch):
+                        cursor.execute("SAVEPOINT checkout")
+                        try:
+                            outcomes.append((True, record_sale(cursor, transaction_id, *request)))
+                            cursor.execute("RELEASE SAVEPOINT checkout")
+                        except mysql.connector.Error as e:
+                            if e.errno in RETRYABLE_ERRORS:
+                                raise
+                            cursor.execute("ROLLBACK TO SAVEPOINT checkout")
+                            outcomes.append((False, e))
+                        except ValueError as e:
+                            cursor.execute("ROLLBACK TO SAVEPOINT checkout")
+                            outcomes.append((False, e))
+                break
+            except mysql.connector.Error as e:
+                if e.errno in RETRYABLE_ERRORS and attempt < MAX_RETRIES:
+                    self.stats["retries"] += 1
+                    time.sleep(0.05 * 2 ** (attempt - 1))
+                    continue
+                raise
+
+        self.stats["batches"] += 1
+        self.stats["checkouts"] += len(batch)
+        for (future, _), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+def _item(text):
+    product_id, _, quantity = text.partition(":")
+    return int(product_id), int(quantity or 1)
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Record a MuskieCo sale")
+    parser.add_argument("--store", type=int, required=True, help="Selling StoreID")
+    parser.add_argument("--customer", type=int, required=True, help="Buying CustomerID")
+    parser.add_argument("--date", help="Purchase date (YYYY-MM-DD, default today)")
+    parser.add_argument("items", nargs="+", type=_item, help="PRODUCT_ID[:QUANTITY]")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            purchase_date = date.fromisoformat(args.date) if args.date else None
+            receipt = checkout(cursor, args.store, args.customer, args.items, purchase_date)
+        print(f"Transaction {receipt['transaction_id']}: {receipt['units']} unit(s), subtotal ${receipt['subtotal']:.2f}, "
+              f"discount ${receipt['discount']:.2f}, total ${receipt['total']:.2f}, {receipt['points']} reward point(s)")
+    except ValueError as e:
+        print(e)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
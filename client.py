@@ -0,0 +1,170 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to send MuskieCo operations to a running daemon (see daemon.py)
+
+The daemon already holds warm pooled connections, prepared statements and caches, so a call
+costs one round trip on a local Unix socket instead of a fresh interpreter, connect and login.
+This file only imports the standard library modules it needs (no mysql.connector), so the
+client process itself starts quickly.
+
+The operations and their arguments are those of batch.py; the daemon also answers ping,
+stats and shutdown.
+
+This file:
+    1. socket_path: where the daemon listens
+    2. Client: one connection to the daemon; call() runs an operation and returns its result
+    3. Command line interface: one operation from the arguments, or JSONL operations from stdin
+
+Usage:
+    python client.py search_member customer_id=1042
+    python client.py update_inventory product_id=17 store_id=3 quantity=-2
+    python client.py report name=daily_sales start=2024-01-01 end=2024-02-01
+    python client.py - < ops.jsonl
+    python client.py stats
+
+Argument values are read as JSON when they parse (numbers, true, null, lists) and as text otherwise;
+quote text that looks like a number as a JSON string: text='"100"'.
+
+Environment:
+    MUSKIECO_SOCKET - Socket path (default /tmp/muskieco-<uid>.sock)
+'''
+
+import json
+import os
+import socket
+import sys
+
+
+def socket_path():
+    '''
+    Returns the daemon's socket path (MUSKIECO_SOCKET, or one per user in /tmp)
+    '''
+    return os.environ.get("MUSKIECO_SOCKET", f"/tmp/muskieco-{os.getuid()}.sock")
+
+
+class OperationFailed(RuntimeError):
+    '''
+    Raised by Client.call when the daemon reports that the operation failed
+    '''
+
+
+class Client:
+    '''
+    One connection to the daemon; operations on it run one at a time, in order
+
+    Parameters:
+        path - Socket path (socket_path() when None)
+        timeout - Seconds to wait for an answer (None waits as long as the operation takes)
+    '''
+
+    def __init__(self, path=None, timeout=None):
+        self.path = path or socket_path()
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(self.path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, command):
+        '''
+        Sends one command dictionary ({"op": ..., "args": {...}, "id": ...}) and returns the
+        daemon's result dictionary (as written by batch.py: ok, result or error)
+        '''
+        return self.send_line(json.dumps(command))
+
+    def send_line(self, line):
+        '''
+        Sends one JSONL command line as it is (the daemon reports lines it cannot parse) and
+        returns the daemon's result dictionary
+        '''
+        self._file.write(line.rstrip("\n").encode() + b"\n")
+        self._file.flush()
+        answer = self._file.readline()
+        if not answer:
+            raise ConnectionError("The daemon closed the connection")
+        return json.loads(answer)
+
+    def call(self, op, **args):
+        '''
+        Runs one operation and returns its result; raises OperationFailed if it failed
+        '''
+        result = self.send({"op": op, "args": args})
+        if not result["ok"]:
+            raise OperationFailed(result["error"])
+        return result["result"]
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_arguments(words):
+    '''
+    Turns command line words name=value into an args dictionary
+
+    Raises:
+        ValueError - For a word without =
+    '''
+    args = {}
+    for word in words:
+        name, sep, value = word.partition("=")
+        if not sep:
+            raise ValueError(f"Arguments are name=value, got {word!r}")
+        args[name] = parse_value(value)
+    return args
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__.split("Usage:")[1].split("Environment:")[0].rstrip())
+        return 0 if argv else 2
+
+    if argv[0] == "-":
+        lines = (line for line in sys.stdin if line.strip())
+    else:
+        try:
+            lines = [json.dumps({"op": argv[0], "args": parse_arguments(argv[1:])})]
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    try:
+        client = Client()
+    except OSError as e:
+        print(f"No MuskieCo daemon at {socket_path()} ({e.strerror}); start one with: python daemon.py",
+              file=sys.stderr)
+        return 2
+
+    failed = 0
+    with client:
+        for line in lines:
+            try:
+                result = client.send_line(line)
+            except (ConnectionError, socket.timeout) as e:
+                print(f"Lost the daemon at {client.path}: {e}", file=sys.stderr)
+                return 2
+            failed += not result["ok"]
+            print(json.dumps(result))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
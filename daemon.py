@@ -0,0 +1,256 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to keep one long-running MuskieCo process that serves operations
+over a local Unix socket
+
+Every run of main.py or batch.py starts an interpreter, imports mysql.connector, asks for (or
+reads) credentials and logs in before it does any work, and its pooled connections, prepared
+statements and caches are thrown away when it exits. The daemon pays that once: it logs in at
+start-up and keeps the pool, the prepared statements of each connection, the lookup cache and
+the price cache warm for as long as it runs. client.py sends it operations and prints the results.
+
+Protocol: the client writes JSONL command lines, the same as batch.py's
+    {"op": "search_member", "args": {"customer_id": 1042}, "id": "optional"}
+and the daemon answers each with one JSON result line (batch.py's result format) before reading
+the next. Each operation runs in its own transaction, on its own pooled connection; clients are
+served concurrently, one thread per client connection. Besides batch.py's operations the daemon
+answers:
+    ping - Process ID and uptime
+    stats - Request counts, pool, lookup cache and price cache statistics
+    shutdown - Stops the daemon once the operations in progress have finished (the reply is
+               sent before it starts stopping)
+
+This file:
+    1. MuskieDaemon: the threaded Unix socket server and the operations it runs
+    2. Claims the socket (refusing to start twice) and makes it private to the user
+    3. Command line interface to start the daemon
+
+The socket is created readable and writable by its owner only; anyone who can open it can run
+every operation with the daemon's database login.
+
+Usage:
+    python daemon.py
+    python daemon.py --pool-size 8 --socket /run/user/1000/muskieco.sock
+    python daemon.py --snapshot muskieco.duckdb
+    python client.py search_member customer_id=1042
+
+Environment:
+    MUSKIECO_SOCKET - Socket path (default /tmp/muskieco-<uid>.sock, see client.socket_path)
+    MUSKIECO_* - Connection settings (see db_pool.pool_from_env)
+'''
+
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import mysql.connector
+
+from batch import parse_commands, run_batch
+from cache import LOOKUP_CACHE
+from client import socket_path
+from pricing import PRICE_CACHE
+
+log = logging.getLogger("muskieco.daemon")
+
+
+class _ClientHandler(socketserver.StreamRequestHandler):
+    '''
+    Serves one client connection: one result line per command line, in order
+    '''
+
+    def handle(self):
+        for command in parse_commands(self.rfile):
+            result = self.server.run(command)
+            self.wfile.write(json.dumps(result).encode() + b"\n")
+            self.wfile.flush()
+            if result.get("op") == "shutdown" and result["ok"]:
+                # Only now that the reply is out
+                self.server.stop()
+                return
+
+
+class MuskieDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Threaded Unix socket server that runs batch.py operations on one long-lived pool
+
+    Parameters:
+        path - Socket path (must be free; see claim_socket)
+        pool - ConnectionPool (or backends.EmbeddedPool) shared by every client
+    '''
+
+    # server_close() joins the handler threads, so operations in progress finish before exit
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counts = {"clients": 0, "ok": 0, "failed": 0}
+        self._clients = set()
+        self.control = {
+            "ping": self._ping,
+            "stats": self._stats,
+            "shutdown": self._shutdown,
+        }
+        # Created private: the umask applies to the socket file bind() creates
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(path, _ClientHandler)
+        finally:
+            os.umask(old_umask)
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.counts["clients"] += 1
+            self._clients.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._lock:
+            self._clients.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self):
+        '''
+        Stops reading from every client, then waits for the operations in progress to be answered
+        '''
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            # An idle client's handler sees end of input; a busy one still writes its result
+            try:
+                client.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+        super().server_close()
+
+    def run(self, command):
+        '''
+        Runs one parsed command (see batch.parse_commands) and returns its result dictionary
+        '''
+        control = self.control.get(command["op"]) if "error" not in command else None
+        if control is not None:
+            result = {"line": command["line"], "op": command["op"], "ok": True, "result": control()}
+            if command.get("id") is not None:
+                result["id"] = command["id"]
+        else:
+            try:
+                result = next(run_batch(self.pool, [command], group_size=1))
+            except Exception as e:
+                # An unexpected failure ends this operation, not the client's connection or the daemon
+                log.exception("Operation %s failed", command["op"])
+                result = {"line": command["line"], "op": command["op"], "ok": False, "error": f"Internal error: {e}"}
+        with self._lock:
+            self.counts["ok" if result["ok"] else "failed"] += 1
+        return result
+
+    def _ping(self):
+        return {"pid": os.getpid(), "uptime": round(time.time() - self.started, 3)}
+
+    def _stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {
+            **self._ping(),
+            "requests": counts,
+            "pool": dict(getattr(self.pool, "stats", {})),
+            "lookup_cache": dict(LOOKUP_CACHE.stats),
+            "price_cache_loads": PRICE_CACHE.loads,
+        }
+
+    def _shutdown(self):
+        # The handler calls stop() once this reply has been written
+        return {"pid": os.getpid(), "stopping": True}
+
+    def stop(self):
+        '''
+        Stops serve_forever from any thread (shutdown() itself waits for it, so a handler cannot call it)
+        '''
+        threading.Thread(target=self.shutdown).start()
+
+
+def claim_socket(path):
+    '''
+    Makes path free for a new daemon: removes a socket left behind by one that died
+
+    Raises:
+        RuntimeError - When a daemon is still answering on path
+    '''
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    except FileNotFoundError:
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A MuskieCo daemon is already serving {path}")
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+def main(argv=None):
+    from backends import open_pool
+
+    parser = argparse.ArgumentParser(description="Serve MuskieCo operations on a local Unix socket")
+    parser.add_argument("--socket", default=socket_path(), help="Socket path (default %(default)s)")
+    parser.add_argument("--pool-size", type=int, help="Pooled connections (default MUSKIECO_POOL_SIZE)")
+    parser.add_argument("--snapshot", help="Serve a DuckDB or SQLite snapshot (see backends.py) instead of MySQL")
+    args = parser.parse_args(argv)
+
+    # Slow statements are logged to stderr, as in main.py
+    logging.basicConfig(format="%(asctime)s %(name)s %(message)s")
+    log.setLevel(logging.INFO)
+
+    overrides = {"pool_size": args.pool_size} if args.pool_size else {}
+    try:
+        claim_socket(args.socket)
+        pool = open_pool(args.snapshot, **overrides)
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    try:
+        if args.snapshot is None:
+            # Logs in now, so bad credentials stop the daemon instead of its first client
+            pool.warm(pool.pool_size)
+        server = MuskieDaemon(args.socket, pool)
+    except mysql.connector.Error as e:
+        pool.close()
+        print(f"Failed to connect: {e}", file=sys.stderr)
+        return 1
+
+    signal.signal(signal.SIGTERM, _stop)
+    log.info("Serving on %s (pid %d, %d connections)", args.socket, os.getpid(), pool.pool_size)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        pool.close()
+        if LOOKUP_CACHE.stats["hits"] or LOOKUP_CACHE.stats["misses"]:
+            log.info(LOOKUP_CACHE.summary())
+        log.info("Stopped after %d operations", server.counts["ok"] + server.counts["failed"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
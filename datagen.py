@@ -0,0 +1,427 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to create the MuskieCo tables and fill them with realistic synthetic data
+
+This file:
+    1. Holds the DDL of every table the APIs touch (FIXTURE_TABLES), in dependency order
+    2. Generates stores, staff, customers and members, products, stock, discounts, transactions and
+       their line items at a chosen scale (10k to 10M transactions) from a fixed seed, so two runs
+       with the same scale and seed produce the same rows
+    3. Skews the data the way a real chain is skewed: a few stores, products and customers take
+       most of the sales (Zipf-like), weekends sell more, and sales grow over the years
+    4. Records what was generated in FixtureInfo, so benchmark results can say what they ran on
+
+Rows are inserted in multi-row batches, committing per batch, with unique and foreign key checks
+switched off for the session while loading.
+
+Usage:
+    python datagen.py --scale 100k
+    python datagen.py --scale 1m --seed 7 --drop
+    python datagen.py --scale 100k --snapshot fixture.duckdb
+
+Run "python schema.py migrate" afterwards (done automatically unless --no-indexes). With
+--snapshot the data goes into an embedded DuckDB or SQLite file instead (see backends.py), a
+stand-in for the read benchmarks that needs no MySQL server.
+'''
+
+import argparse
+import bisect
+import itertools
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import mysql.connector
+
+# Scale name -> number of transactions; every other table is sized from it (see plan)
+SCALES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+# Rows per INSERT statement / commit
+INSERT_BATCH = 5000
+
+# Exponent of the Zipf-like popularity of stores, products and customers (0 is uniform)
+DEFAULT_SKEW = 1.1
+
+FIXTURE_TABLES = [
+    ("StoreAddress", """
+        CREATE TABLE IF NOT EXISTS StoreAddress (
+            StoreAddr VARCHAR(255) PRIMARY KEY,
+            Phone VARCHAR(32) NOT NULL
+        )
+    """),
+    ("Store", """
+        CREATE TABLE IF NOT EXISTS Store (
+            StoreID INT AUTO_INCREMENT PRIMARY KEY,
+            StoreAddr VARCHAR(255) NOT NULL,
+            FOREIGN KEY (StoreAddr) REFERENCES StoreAddress (StoreAddr)
+        )
+    """),
+    ("StaffEmails", """
+        CREATE TABLE IF NOT EXISTS StaffEmails (
+            Email VARCHAR(255) PRIMARY KEY,
+            StaffIDHasStore INT NULL,
+            StaffName VARCHAR(255) NOT NULL,
+            Age INT NULL,
+            HomeAddr VARCHAR(255) NULL,
+            JobTitle VARCHAR(64) NULL,
+            TimeOfEmployment DATE NULL,
+            NumberOfSignUps INT NOT NULL DEFAULT 0
+        )
+    """),
+    ("StaffInfo", """
+        CREATE TABLE IF NOT EXISTS StaffInfo (
+            StaffID INT PRIMARY KEY,
+            Email VARCHAR(255) NOT NULL,
+            FOREIGN KEY (Email) REFERENCES StaffEmails (Email) ON DELETE CASCADE
+        )
+    """),
+    ("CustomerIDs", """
+        CREATE TABLE IF NOT EXISTS CustomerIDs (
+            CustomerID INT PRIMARY KEY
+        )
+    """),
+    ("CustomerEmail", """
+        CREATE TABLE IF NOT EXISTS CustomerEmail (
+            Email VARCHAR(255) PRIMARY KEY,
+            CustomerName VARCHAR(255) NOT NULL,
+            HomeAddr VARCHAR(255) NULL,
+            ActivateStatus VARCHAR(16) NULL,
+            StaffIDSendsNotice INT NULL,
+            RewardPoints INT NOT NULL DEFAULT 0
+        )
+    """),
+    ("MemberInfo", """
+        CREATE TABLE IF NOT EXISTS MemberInfo (
+            CustomerID INT PRIMARY KEY,
+            Email VARCHAR(255) NOT NULL,
+            FOREIGN KEY (Email) REFERENCES CustomerEmail (Email) ON DELETE CASCADE
+        )
+    """),
+    ("MerchandiseInfo", """
+        CREATE TABLE IF NOT EXISTS MerchandiseInfo (
+            ProductID INT PRIMARY KEY,
+            ProductName VARCHAR(255) NOT NULL,
+            SellPrice DECIMAL(10, 2) NOT NULL
+        )
+    """),
+    ("ProductQuantity", """
+        CREATE TABLE IF NOT EXISTS ProductQuantity (
+            ProductID INT NOT NULL,
+            StoreID INT NOT NULL,
+            InstockQuantity INT NOT NULL,
+            PRIMARY KEY (ProductID, StoreID)
+        )
+    """),
+    ("DiscountInfo", """
+        CREATE TABLE IF NOT EXISTS DiscountInfo (
+            DiscountID INT AUTO_INCREMENT PRIMARY KEY,
+            DiscountDesc VARCHAR(255) NULL,
+            ValidDate DATE NOT NULL,
+            ProductID INT NOT NULL
+        )
+    """),
+    ("TransactionInfo", """
+        CREATE TABLE IF NOT EXISTS TransactionInfo (
+            TransactionID BIGINT PRIMARY KEY,
+            PurchaseDate DATE NOT NULL,
+            TotalPrice DECIMAL(12, 2) NOT NULL,
+            CustomerIDHasATransaction INT NOT NULL,
+            StoreID INT NOT NULL
+        )
+    """),
+    ("Involves", """
+        CREATE TABLE IF NOT EXISTS Involves (
+            TransactionID BIGINT NOT NULL,
+            ProductID INT NOT NULL
+        )
+    """),
+    ("FixtureInfo", """
+        CREATE TABLE IF NOT EXISTS FixtureInfo (
+            Scale VARCHAR(16) NOT NULL,
+            Seed INT NOT NULL,
+            Skew DECIMAL(4, 2) NOT NULL,
+            RowCounts TEXT NOT NULL,
+            GeneratedAt DATETIME NOT NULL
+        )
+    """),
+]
+
+JOB_TITLES = ["Cashier", "Cashier", "Cashier", "Stock Clerk", "Stock Clerk", "Shift Lead", "Store Manager"]
+PRODUCT_WORDS = ["Muskie", "Lure", "Rod", "Reel", "Line", "Net", "Bait", "Tackle", "Hook", "Boat", "Cooler", "Vest"]
+STREETS = ["Main St", "Lake Rd", "Pine Ave", "Shore Dr", "River Rd", "Oak St", "Bay Blvd", "Dock Ln"]
+
+
+def plan(transactions):
+    '''
+    Returns the row count of every generated table for a number of transactions
+    '''
+    return {
+        "stores": max(5, transactions // 20_000),
+        "staff_per_store": 12,
+        "customers": max(100, transactions // 8),
+        "member_share": 0.6,
+        "products": max(200, min(50_000, transactions // 200)),
+        "discount_share": 0.1,
+        "transactions": transactions,
+        "max_items": 6,
+        "years": 3,
+    }
+
+
+class Skewed:
+    '''
+    Draws ranks 0..count-1 with probability proportional to 1 / (rank + 1) ** skew
+    '''
+
+    def __init__(self, rng, count, skew=DEFAULT_SKEW):
+        self._rng = rng
+        self._cumulative = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+        self._total = self._cumulative[-1]
+
+    def draw(self):
+        return bisect.bisect_left(self._cumulative, self._rng.random() * self._total)
+
+
+def create_fixture_tables(cursor, drop=False):
+    '''
+    Creates every fixture table, dropping them first when drop is set
+    '''
+    if drop:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table, _ in reversed(FIXTURE_TABLES):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    for _, statement in FIXTURE_TABLES:
+        cursor.execute(statement)
+
+
+def _insert(cursor, table, columns, rows, counts, progress=None):
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == INSERT_BATCH:
+            cursor.executemany(statement, batch)
+            cursor.execute("COMMIT")
+            counts[table] = counts.get(table, 0) + len(batch)
+            batch = []
+            if progress:
+                progress(table, counts[table])
+    if batch:
+        cursor.executemany(statement, batch)
+        cursor.execute("COMMIT")
+        counts[table] = counts.get(table, 0) + len(batch)
+    if progress:
+        progress(table, counts.get(table, 0))
+
+
+def _address(rng, number):
+    return f"{number} {rng.choice(STREETS)}"
+
+
+def generate(cursor, transactions, seed=1, skew=DEFAULT_SKEW, progress=None, today=None):
+    '''
+    Fills the (empty) fixture tables
+
+    Parameters:
+        cursor - Active MySQL cursor
+        transactions - Number of transactions to generate
+        seed - Random seed; the same seed and size give the same data
+        skew - Popularity skew of stores, products and customers (0 for uniform)
+        progress - Optional function (table, rows so far) called after every batch
+        today - Last possible purchase date (date.today() by default)
+
+    Returns:
+        Dictionary of table -> rows inserted
+    '''
+    rng = random.Random(seed)
+    sizes = plan(transactions)
+    today = today or date.today()
+    counts = {}
+    cursor.execute("SET unique_checks = 0")
+    cursor.execute("SET foreign_key_checks = 0")
+
+    # ------ Stores and staff ------
+    stores = sizes["stores"]
+    store_addrs = [f"{100 + n} {STREETS[n % len(STREETS)]} Store {n + 1}" for n in range(stores)]
+    _insert(cursor, "StoreAddress", ["StoreAddr", "Phone"],
+            ((addr, f"555-{rng.randrange(10000):04}") for addr in store_addrs), counts, progress)
+    _insert(cursor, "Store", ["StoreID", "StoreAddr"],
+            ((n + 1, addr) for n, addr in enumerate(store_addrs)), counts, progress)
+
+    staff_count = stores * sizes["staff_per_store"]
+    staff = [(n + 1, f"staff{n + 1}@muskieco.example") for n in range(staff_count)]
+    _insert(cursor, "StaffEmails",
+            ["Email", "StaffIDHasStore", "StaffName", "Age", "HomeAddr", "JobTitle", "TimeOfEmployment", "NumberOfSignUps"],
+            ((email, (staff_id - 1) % stores + 1, f"Staff {staff_id}", rng.randint(18, 67),
+              _address(rng, rng.randint(1, 9999)), rng.choice(JOB_TITLES),
+              today - timedelta(days=rng.randrange(365 * 10)), int(rng.expovariate(1 / 4)))
+             for staff_id, email in staff), counts, progress)
+    _insert(cursor, "StaffInfo", ["StaffID", "Email"], staff, counts, progress)
+
+    # ------ Customers and members ------
+    customers = sizes["customers"]
+    _insert(cursor, "CustomerIDs", ["CustomerID"], ((n + 1,) for n in range(customers)), counts, progress)
+    member_ids = [n + 1 for n in range(customers) if rng.random() < sizes["member_share"]]
+    _insert(cursor, "CustomerEmail",
+            ["Email", "CustomerName", "HomeAddr", "ActivateStatus", "StaffIDSendsNotice", "RewardPoints"],
+            ((f"member{cid}@example.com", f"Customer {cid}", _address(rng, rng.randint(1, 9999)),
+              "active" if rng.random() < 0.9 else "inactive", rng.randint(1, staff_count),
+              int(rng.paretovariate(1.5) * 10) - 10)
+             for cid in member_ids), counts, progress)
+    _insert(cursor, "MemberInfo", ["CustomerID", "Email"],
+            ((cid, f"member{cid}@example.com") for cid in member_ids), counts, progress)
+
+    # ------ Products, stock and discounts ------
+    products = sizes["products"]
+    prices = [Decimal(str(round(rng.lognormvariate(3, 1), 2))) + Decimal("0.99") for _ in range(products)]
+    _insert(cursor, "MerchandiseInfo", ["ProductID", "ProductName", "SellPrice"],
+            ((n + 1, f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_WORDS)} {n + 1}", prices[n])
+             for n in range(products)), counts, progress)
+    # Every store carries the most popular tenth of the catalogue and a random slice of the rest
+    _insert(cursor, "ProductQuantity", ["ProductID", "StoreID", "InstockQuantity"],
+            ((product_id, store_id, rng.randint(0, 200))
+             for store_id in range(1, stores + 1)
+             for product_id in range(1, products + 1)
+             if product_id <= products // 10 or rng.random() < 0.05), counts, progress)
+    discounted = [product_id for product_id in range(1, products + 1) if rng.random() < sizes["discount_share"]]
+    _insert(cursor, "DiscountInfo", ["DiscountID", "DiscountDesc", "ValidDate", "ProductID"],
+            ((n + 1, f"{rng.choice([5, 10, 15, 20, 25])}% off", today + timedelta(days=rng.randint(-180, 180)),
+              product_id)
+             for n, product_id in enumerate(discounted)),
+            counts, progress)
+
+    # ------ Transactions and line items ------
+    store_pick = Skewed(rng, stores, skew)
+    product_pick = Skewed(rng, products, skew)
+    customer_pick = Skewed(rng, customers, skew)
+    days = 365 * sizes["years"]
+    start = today - timedelta(days=days - 1)
+    # Later days and weekends sell more
+    day_weights = list(itertools.accumulate(
+        (1 + day / days) * (1.5 if (start + timedelta(days=day)).weekday() >= 5 else 1.0) for day in range(days)))
+
+    def transaction_rows():
+        for transaction_id in range(1, transactions + 1):
+            day = bisect.bisect_left(day_weights, rng.random() * day_weights[-1])
+            items = [product_pick.draw() + 1 for _ in range(rng.randint(1, sizes["max_items"]))]
+            yield (transaction_id, start + timedelta(days=day), sum(prices[p - 1] for p in items),
+                   customer_pick.draw() + 1, store_pick.draw() + 1), items
+
+    line_batch = []
+    line_statement = "INSERT INTO Involves (TransactionID, ProductID) VALUES (%s, %s)"
+
+    def with_lines():
+        for row, items in transaction_rows():
+            line_batch.extend((row[0], product_id) for product_id in items)
+            if len(line_batch) >= INSERT_BATCH:
+                cursor.executemany(line_statement, line_batch)
+                counts["Involves"] = counts.get("Involves", 0) + len(line_batch)
+                line_batch.clear()
+            yield row
+
+    _insert(cursor, "TransactionInfo",
+            ["TransactionID", "PurchaseDate", "TotalPrice", "CustomerIDHasATransaction", "StoreID"],
+            with_lines(), counts, progress)
+    if line_batch:
+        cursor.executemany(line_statement, line_batch)
+        counts["Involves"] = counts.get("Involves", 0) + len(line_batch)
+    cursor.execute("COMMIT")
+
+    cursor.execute("SET unique_checks = 1")
+    cursor.execute("SET foreign_key_checks = 1")
+    return counts
+
+
+def record_fixture(cursor, scale, seed, skew, counts):
+    cursor.execute("DELETE FROM FixtureInfo")
+    cursor.execute("INSERT INTO FixtureInfo (Scale, Seed, Skew, RowCounts, GeneratedAt) VALUES (%s, %s, %s, %s, NOW())",
+                   (scale, seed, skew, ", ".join(f"{table}={rows}" for table, rows in counts.items())))
+    cursor.execute("COMMIT")
+
+
+def fixture_info(cursor):
+    '''
+    Returns the FixtureInfo of the database as a dictionary, or None if it was not generated here
+    '''
+    try:
+        cursor.execute("SELECT Scale, Seed, Skew, RowCounts, GeneratedAt FROM FixtureInfo")
+        row = cursor.fetchone()
+    except mysql.connector.Error:
+        return None
+    if row is None:
+        return None
+    return {"scale": row[0], "seed": row[1], "skew": float(row[2]), "rows": row[3], "generated_at": str(row[4])}
+
+
+def _scale(value):
+    if value.lower() in SCALES:
+        return value.lower(), SCALES[value.lower()]
+    return value, int(value)
+
+
+def main(argv=None):
+    from backends import EmbeddedPool, create_indexes
+    from db_pool import pool_from_env
+    from schema import migrate
+
+    parser = argparse.ArgumentParser(description="Create the MuskieCo tables and fill them with synthetic data")
+    parser.add_argument("--scale", default="100k",
+                        help=f"Number of transactions, or one of {', '.join(SCALES)} (default 100k)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skew", type=float, default=DEFAULT_SKEW, help="Popularity skew (0 for uniform)")
+    parser.add_argument("--drop", action="store_true", help="Drop and recreate the tables first")
+    parser.add_argument("--no-indexes", action="store_true", help="Do not run the schema migrations afterwards")
+    parser.add_argument("--snapshot", help="Generate into this DuckDB/SQLite file instead of MySQL (see backends.py)")
+    args = parser.parse_args(argv)
+    scale, transactions = _scale(args.scale)
+
+    last_report = [0.0]
+
+    def progress(table, rows):
+        now = time.perf_counter()
+        if now - last_report[0] >= 2:
+            print(f"  {table}: {rows} rows")
+            last_report[0] = now
+
+    try:
+        pool = EmbeddedPool(args.snapshot) if args.snapshot else pool_from_env(pool_size=1)
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        return 1
+    try:
+        with pool.session() as cursor:
+            create_fixture_tables(cursor, drop=args.drop)
+            cursor.execute("SELECT COUNT(*) FROM TransactionInfo")
+            if cursor.fetchone()[0]:
+                print("TransactionInfo already has rows; pass --drop to regenerate.")
+                return 1
+            started = time.perf_counter()
+            counts = generate(cursor, transactions, args.seed, args.skew, progress)
+            record_fixture(cursor, scale, args.seed, args.skew, counts)
+            for table, rows in counts.items():
+                print(f"{table}: {rows} rows")
+            print(f"Generated in {time.perf_counter() - started:.1f}s")
+            if args.snapshot:
+                if pool.engine == "sqlite":
+                    create_indexes(cursor, [table for table, _ in FIXTURE_TABLES])
+            elif not args.no_indexes:
+                migrate(cursor)
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to manage a pool of MySQL connections for the MuskieCo system
+
+Instead of one connection and one cursor shared by every operation, each API call checks a warm
+connection out of the pool, runs on its own cursor, and hands the connection back when done.
+
+This file:
+    1. Keeps up to pool_size connections open and reuses them between calls
+    2. Health-checks idle connections before handing them out
+    3. Reconnects with exponential backoff when the server drops a connection
+    4. Keeps each connection's prepared statements for as long as the connection lives (see prepared.py)
+'''
+
+import collections
+import getpass
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errorcode
+
+from cache import LOOKUP_CACHE
+from instrumentation import InstrumentedCursor
+from prepared import PREPARE_STATEMENTS, PreparedCursor, close_statements
+
+DEFAULT_POOL_SIZE = 5
+
+# Idle connections older than this (seconds) are pinged before being handed out
+HEALTH_CHECK_INTERVAL = 30
+
+# Errors that mean the connection itself is gone, not just the statement
+CONNECTION_LOST_ERRORS = {
+    errorcode.CR_SERVER_GONE_ERROR,
+    errorcode.CR_SERVER_LOST,
+    errorcode.CR_CONNECTION_ERROR,
+    errorcode.CR_CONN_HOST_ERROR,
+}
+
+# Errors worth retrying the whole transaction for: nothing was wrong with the statements
+RETRYABLE_ERRORS = CONNECTION_LOST_ERRORS | {
+    errorcode.ER_LOCK_DEADLOCK,
+    errorcode.ER_LOCK_WAIT_TIMEOUT,
+}
+
+
+class PoolTimeout(mysql.connector.Error):
+    '''
+    Raised when no connection becomes free within the checkout timeout
+    '''
+
+
+class ConnectionPool:
+    '''
+    A thread-safe pool of mysql.connector connections
+
+    Parameters:
+        pool_size - Maximum number of open connections
+        checkout_timeout - Seconds to wait for a free connection before raising PoolTimeout
+        health_check_interval - Idle seconds after which a connection is pinged before reuse
+        max_retries - Connect attempts before giving up
+        backoff - First retry delay in seconds; doubled after every failed attempt
+        max_backoff - Upper bound for the retry delay
+        instrument - Wrap session cursors in an InstrumentedCursor (see instrumentation.py)
+        prepare - Run the registered API statements as prepared statements (see prepared.py)
+        connect_args - Passed straight to mysql.connector.connect (host, user, password, database, ...)
+    '''
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, checkout_timeout=30,
+                 health_check_interval=HEALTH_CHECK_INTERVAL, max_retries=5,
+                 backoff=0.5, max_backoff=8.0, instrument=True, prepare=PREPARE_STATEMENTS, **connect_args):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.instrument = instrument
+        self.prepare = prepare
+        self.connect_args = connect_args
+
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        # (connection, last_used) pairs; the most recently used connection is reused first
+        self._idle = collections.deque()
+        self._closed = False
+        # id(connection) -> {SQL text: prepared cursor} for every open connection
+        self._prepared = {}
+        self._commit_hooks = []
+        self._rollback_hooks = []
+
+        self.stats = {"connects": 0, "reconnects": 0, "checkouts": 0, "discarded": 0}
+
+    # ------ Connection lifecycle ------
+
+    def _connect(self):
+        '''
+        Opens a new connection, retrying with exponential backoff
+
+        Returns:
+            A new mysql.connector connection
+        '''
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                connection = mysql.connector.connect(**self.connect_args)
+                connection.autocommit = False
+                self.stats["connects"] += 1
+                return connection
+            except mysql.connector.Error as e:
+                # Bad credentials or an unknown database will not fix themselves
+                if e.errno in (errorcode.ER_ACCESS_DENIED_ERROR, errorcode.ER_BAD_DB_ERROR):
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def _healthy(self, connection, last_used):
+        '''
+        Returns True if an idle connection can be handed out again
+        '''
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, connection):
+        self.stats["discarded"] += 1
+        close_statements(self._prepared.pop(id(connection), {}))
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def warm(self, count=1):
+        '''
+        Opens up to count connections ahead of time (also validates the credentials)
+
+        Parameters:
+            count - Number of connections to open
+
+        Returns:
+            None
+        '''
+        count = min(count, self.pool_size)
+        connections = [self.get_connection() for _ in range(count)]
+        for connection in connections:
+            self.release(connection)
+
+    def get_connection(self):
+        '''
+        Checks a connection out of the pool, opening or repairing one if needed
+
+        Returns:
+            A live mysql.connector connection; give it back with release()
+        '''
+        if self._closed:
+            raise mysql.connector.InterfaceError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(f"No free connection after {self.checkout_timeout}s "
+                              f"(pool size {self.pool_size})")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    connection = self._connect()
+                    break
+                connection, last_used = item
+                if self._healthy(connection, last_used):
+                    break
+                self._discard(connection)
+                self.stats["reconnects"] += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        self.stats["checkouts"] += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        '''
+        Returns a connection to the pool
+
+        Parameters:
+            connection - Connection obtained from get_connection()
+            broken - True if the connection was lost and must not be reused
+
+        Returns:
+            None
+        '''
+        # No ping here: a connection that lost the server says so through the error that marks
+        # it broken, and one that dies while idle is caught by the check in get_connection()
+        try:
+            if broken or self._closed:
+                self._discard(connection)
+            else:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        '''
+        Closes every idle connection; connections still checked out are closed on release
+        '''
+        self._closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), collections.deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def on_commit(self, hook):
+        '''
+        Registers a function called with no arguments whenever a session commits
+        '''
+        self._commit_hooks.append(hook)
+
+    def on_rollback(self, hook):
+        '''
+        Registers a function called with no arguments whenever a session is rolled back
+        '''
+        self._rollback_hooks.append(hook)
+
+    # ------ Sessions ------
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager that checks a connection out and always returns it
+        '''
+        connection = self.get_connection()
+        broken = False
+        try:
+            yield connection
+        except mysql.connector.Error as e:
+            broken = e.errno in CONNECTION_LOST_ERRORS
+            raise
+        finally:
+            self.release(connection, broken=broken)
+
+    @contextmanager
+    def session(self):
+        '''
+        Context manager for one API call: yields a fresh unbuffered cursor on a pooled connection
+
+        Commits when the block finishes, rolls back if it raises
+
+        Returns:
+            A MySQL cursor
+        '''
+        with self.connection() as connection:
+            cursor = connection.cursor(buffered=False)
+            if self.prepare:
+                cursor = PreparedCursor(cursor, connection, self._prepared.setdefault(id(connection), {}))
+            if self.instrument:
+                cursor = InstrumentedCursor(cursor)
+            try:
+                yield cursor
+                connection.commit()
+                for hook in self._commit_hooks:
+                    hook()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    pass
+                for hook in self._rollback_hooks:
+                    hook()
+                raise
+            finally:
+                try:
+                    cursor.close()
+                except mysql.connector.Error:
+                    pass
+
+
+def connection_settings(prompt=True):
+    '''
+    Reads the MUSKIECO_* connection settings, prompting for missing credentials
+
+    Environment:
+        MUSKIECO_HOST (default localhost), MUSKIECO_DATABASE (default muskieco),
+        MUSKIECO_USER, MUSKIECO_PASSWORD, MUSKIECO_POOL_SIZE (default 5)
+
+    Parameters:
+        prompt - Ask on the terminal for a username/password that is not set in the environment
+
+    Returns:
+        Dictionary with host, user, password, database and pool_size
+    '''
+    user = os.environ.get("MUSKIECO_USER")
+    password = os.environ.get("MUSKIECO_PASSWORD")
+    if prompt and user is None:
+        user = input("Enter MySQL username: ")
+    if prompt and password is None:
+        password = getpass.getpass("Enter MySQL password: ")
+
+    return {
+        "host": os.environ.get("MUSKIECO_HOST", "localhost"),
+        "user": user,
+        "password": password,
+        "database": os.environ.get("MUSKIECO_DATABASE", "muskieco"),
+        "pool_size": int(os.environ.get("MUSKIECO_POOL_SIZE", DEFAULT_POOL_SIZE)),
+    }
+
+
+def pool_from_env(prompt=True, **overrides):
+    '''
+    Builds a ConnectionPool from MUSKIECO_* environment variables (see connection_settings)
+
+    The pool's sessions keep the shared lookup cache (cache.py) in step with their commits and rollbacks
+
+    Parameters:
+        prompt - Ask on the terminal for a username/password that is not set in the environment
+        overrides - Extra ConnectionPool / connect arguments
+
+    Returns:
+        ConnectionPool
+    '''
+    settings = connection_settings(prompt)
+    settings.update(overrides)
+    pool = ConnectionPool(**settings)
+    LOOKUP_CACHE.attach(pool)
+    return pool
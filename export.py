@@ -0,0 +1,354 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to export report results to files that analytics tools load directly
+
+Rows go straight from the unbuffered cursor to the file in chunks of batch_size (fetchmany), so
+memory stays flat however many rows a report returns.
+
+This file:
+    1. Writes CSV (header row, ISO dates, exact decimals, empty cells for NULL)
+    2. Writes Arrow IPC or Parquet files when pyarrow is installed; column types come from the
+       cursor description (integers, floats, decimals, dates, timestamps, text)
+    3. Exports any report of reports.py, including the billing listings
+
+A file is written under a temporary name and renamed when complete, so a failed export never
+leaves a truncated file behind.
+
+Usage:
+    python export.py daily_sales --start 2024-01-01 --end 2025-01-01 -o daily.parquet
+    python export.py transaction_totals final_prices --format csv --out-dir exports/
+    python export.py --all --snapshot muskieco.duckdb --format parquet
+
+Arrow and Parquet need pyarrow (pip install pyarrow); CSV needs nothing extra.
+'''
+
+import argparse
+import csv
+import os
+import sys
+import time
+from decimal import Context, Decimal
+
+import mysql.connector
+from mysql.connector import FieldType
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from reports import DEFAULT_BUNDLE, REPORTS, get_report
+from streaming import StreamStats, stream_batches
+
+# Rows fetched and written per chunk
+EXPORT_BATCH_SIZE = 10000
+
+# File extension -> format
+EXTENSIONS = {
+    ".csv": "csv",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".parquet": "parquet",
+}
+
+FORMATS = ("csv", "arrow", "parquet")
+
+# Scale of a DECIMAL column the driver does not report and whose first chunk has no values to
+# infer it from
+DEFAULT_DECIMAL_SCALE = 2
+
+
+def export_format(path, fmt=None):
+    '''
+    Returns the export format for path: fmt if given, otherwise guessed from the extension
+    '''
+    if fmt is None:
+        fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise ValueError(f"Cannot tell the format of {path}; use one of {', '.join(EXTENSIONS)} or pass a format")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    if fmt != "csv" and pyarrow is None:
+        raise RuntimeError(f"Writing {fmt} needs pyarrow: pip install pyarrow")
+    return fmt
+
+
+# ------ Column types ------
+
+INTEGER_TYPES = {FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG,
+                 FieldType.LONGLONG, FieldType.YEAR}
+FLOAT_TYPES = {FieldType.FLOAT, FieldType.DOUBLE}
+DECIMAL_TYPES = {FieldType.DECIMAL, FieldType.NEWDECIMAL}
+DATE_TYPES = {FieldType.DATE, FieldType.NEWDATE}
+TIMESTAMP_TYPES = {FieldType.DATETIME, FieldType.TIMESTAMP}
+
+# Arrow decimals hold 38 digits, more than the default decimal context's 28
+_EXACT = Context(prec=38)
+
+
+def decimal_scale(values):
+    '''
+    Returns the largest number of decimal places among the Decimal values (DEFAULT_DECIMAL_SCALE if none)
+    '''
+    exponents = [-value.as_tuple().exponent for value in values if isinstance(value, Decimal)]
+    return max(exponents, default=DEFAULT_DECIMAL_SCALE)
+
+
+def column_scale(column, values):
+    '''
+    Returns the scale of a DECIMAL result column
+
+    The scale in the description (column[5]) is used when the driver reports one; mysql.connector
+    does not, so it is otherwise read from sample values (see decimal_scale). MySQL hands every
+    value of a DECIMAL column over with the column's scale, so one value is enough.
+
+    Parameters:
+        column - Entry of cursor.description
+        values - Sample values of the column
+    '''
+    if len(column) > 5 and isinstance(column[5], int):
+        return column[5]
+    return decimal_scale(values)
+
+
+def arrow_schema(description, columns, first_batch):
+    '''
+    Builds the Arrow schema of a result set
+
+    Parameters:
+        description - cursor.description of the query
+        columns - Column names to use
+        first_batch - First chunk of rows (decimal scales the description lacks are read from it)
+
+    Returns:
+        pyarrow.Schema
+    '''
+    fields = []
+    for index, (name, column) in enumerate(zip(columns, description)):
+        type_code = column[1]
+        if type_code in INTEGER_TYPES:
+            arrow_type = pyarrow.int64()
+        elif type_code in FLOAT_TYPES:
+            arrow_type = pyarrow.float64()
+        elif type_code in DECIMAL_TYPES:
+            arrow_type = pyarrow.decimal128(38, column_scale(column, [row[index] for row in first_batch]))
+        elif type_code in DATE_TYPES:
+            arrow_type = pyarrow.date32()
+        elif type_code in TIMESTAMP_TYPES:
+            arrow_type = pyarrow.timestamp("us")
+        elif type_code == FieldType.TIME:
+            arrow_type = pyarrow.duration("us")
+        else:
+            arrow_type = pyarrow.string()
+        fields.append(pyarrow.field(name, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def fit_decimal(value, field):
+    '''
+    Returns value with exactly the scale of a decimal field
+
+    Parameters:
+        value - Decimal (or int/str) to store
+        field - pyarrow decimal field
+
+    Raises:
+        ValueError - value has more decimal places than the field keeps; money is never rounded to fit
+    '''
+    value = Decimal(value)
+    fitted = value.quantize(Decimal(1).scaleb(-field.type.scale), context=_EXACT)
+    if fitted != value:
+        raise ValueError(f"Column {field.name}: {value} has more than {field.type.scale} decimal places and "
+                         f"would be rounded; CAST the column to a DECIMAL with enough places in the query")
+    return fitted
+
+
+def arrow_batch(schema, rows):
+    '''
+    Converts a chunk of rows to a pyarrow.RecordBatch of schema (see arrow_schema)
+
+    Raises:
+        ValueError - a decimal value does not fit its column's scale (see fit_decimal)
+    '''
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pyarrow.types.is_decimal(field.type):
+            values = [None if v is None else fit_decimal(v, field) for v in values]
+        elif pyarrow.types.is_string(field.type):
+            values = [None if v is None else str(v) for v in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+# ------ Writers ------
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter:
+    '''
+    Arrow IPC or Parquet writer; the schema is fixed when the first chunk arrives
+    '''
+
+    def __init__(self, path, columns, description, fmt):
+        self._path = path
+        self._columns = columns
+        self._description = description
+        self._fmt = fmt
+        self._schema = None
+        self._writer = None
+
+    def _open(self, first_batch):
+        self._schema = arrow_schema(self._description, self._columns, first_batch)
+        if self._fmt == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(self._path, self._schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(self._path, self._schema)
+
+    def write(self, rows):
+        if self._writer is None:
+            self._open(rows)
+        batch = arrow_batch(self._schema, rows)
+        if self._fmt == "parquet":
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+
+    def close(self):
+        if self._writer is None:
+            # No rows: still write a file with the columns and their types
+            self._open([])
+        self._writer.close()
+
+
+def export_query(cursor, query, params, path, fmt=None, columns=None, batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Runs a query and writes its rows to path in chunks of batch_size
+
+    Parameters:
+        cursor - Active MySQL cursor (unbuffered, as handed out by ConnectionPool.session)
+        query - SQL text
+        params - Query parameters
+        path - Output file
+        fmt - "csv", "arrow" or "parquet" (guessed from the extension when None)
+        columns - Column names (the query's own names when None)
+        batch_size - Rows held in memory at once
+
+    Returns:
+        StreamStats for the export
+    '''
+    fmt = export_format(path, fmt)
+    stats = StreamStats()
+    cursor.execute(query, params)
+    columns = list(columns or [column[0] for column in cursor.description])
+
+    partial = path + ".part"
+    if fmt == "csv":
+        writer = _CsvWriter(partial, columns)
+    else:
+        writer = _ArrowWriter(partial, columns, cursor.description, fmt)
+    try:
+        for batch in stream_batches(cursor, batch_size, stats):
+            writer.write(batch)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return stats
+
+
+def export_report(cursor, name, path, fmt=None, refresh=True, batch_size=EXPORT_BATCH_SIZE, **values):
+    '''
+    Runs a report (see reports.py) and writes its rows to path
+
+    Parameters:
+        cursor - Active MySQL cursor
+        name - Report name
+        path - Output file
+        fmt - "csv", "arrow" or "parquet" (guessed from the extension when None)
+        refresh - Bring the sales rollup up to date first (rollup reports only)
+        batch_size - Rows held in memory at once
+        values - Report parameters (product_id, start, end, days, store_id, granularity)
+
+    Returns:
+        StreamStats for the export
+    '''
+    report = get_report(name)
+    query, params = report.prepare(values)
+    if refresh:
+        report.refresh_rollup(cursor, values)
+    return export_query(cursor, query, params, path, fmt, report.columns, batch_size)
+
+
+def main(argv=None):
+    from backends import open_pool
+
+    parser = argparse.ArgumentParser(description="Export MuskieCo reports to CSV, Arrow or Parquet")
+    parser.add_argument("names", nargs="*", help=f"Reports to export ({', '.join(REPORTS)})")
+    parser.add_argument("--all", action="store_true", help=f"Export {', '.join(DEFAULT_BUNDLE)}")
+    parser.add_argument("-o", "--output", help="Output file (one report only)")
+    parser.add_argument("--out-dir", default=".", help="Directory for <report>.<format> files")
+    parser.add_argument("--format", choices=FORMATS, help="Output format (guessed from --output, else csv)")
+    parser.add_argument("--start", help="Start date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="End date (YYYY-MM-DD); excluded by the sales reports")
+    parser.add_argument("--days", type=int, help="Sales reports cover the last DAYS days")
+    parser.add_argument("--store-id", type=int, help="Sales reports for one store only")
+    parser.add_argument("--granularity", choices=["day", "week", "month", "year"], help="Period of the sales report")
+    parser.add_argument("--product-id", help="Product for product_stock")
+    parser.add_argument("--archived", action="store_true",
+                        help="customer_spend also counts transactions moved out by archive.py")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--snapshot", help="Export from this DuckDB/SQLite snapshot instead of MySQL (see backends.py)")
+    args = parser.parse_args(argv)
+
+    names = args.names or (DEFAULT_BUNDLE if args.all else [])
+    if not names:
+        parser.error("name at least one report or pass --all")
+    if args.output and len(names) > 1:
+        parser.error("--output takes one report; use --out-dir for several")
+
+    values = {"start": args.start, "end": args.end, "days": args.days, "store_id": args.store_id,
+              "granularity": args.granularity, "product_id": args.product_id, "archived": args.archived}
+    try:
+        pool = open_pool(args.snapshot, pool_size=1)
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        for name in names:
+            path = args.output or os.path.join(args.out_dir, f"{name}.{args.format or 'csv'}")
+            started = time.perf_counter()
+            with pool.session() as cursor:
+                stats = export_report(cursor, name, path, args.format, batch_size=args.batch_size, **values)
+            print(f"{name}: {stats.rows} rows to {path} in {time.perf_counter() - started:.2f}s")
+    except (ValueError, RuntimeError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to time every statement the MuskieCo APIs send to MySQL
+
+Pooled sessions (db_pool.py) hand out an InstrumentedCursor, which wraps the real cursor and records
+for every statement: its fingerprint (the SQL with literals replaced by ?), its latency including
+the time spent fetching rows, the rows returned or affected, and the API function that issued it.
+
+This file:
+    1. Keeps per-fingerprint and per-API latency histograms (p50/p95/p99) in memory
+    2. Logs statements slower than a threshold to the "muskieco.slow" logger
+    3. Optionally captures the EXPLAIN plan of slow SELECTs
+    4. Formats a summary table (printed when the CLI exits)
+
+Environment:
+    MUSKIECO_SLOW_MS - Slow statement threshold in milliseconds (default 500)
+    MUSKIECO_EXPLAIN_SLOW - Set to 1 to capture EXPLAIN for slow SELECTs
+'''
+
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger("muskieco.slow")
+
+SLOW_THRESHOLD = int(os.environ.get("MUSKIECO_SLOW_MS", 500)) / 1000
+EXPLAIN_SLOW = os.environ.get("MUSKIECO_EXPLAIN_SLOW", "0") == "1"
+
+# Latency samples kept per histogram (reservoir sampling beyond this)
+RESERVOIR_SIZE = 1024
+
+# Modules whose frames are skipped when looking for the calling API function; operations.run
+# and the lookup cache run statements on behalf of the API function that called them
+_PLUMBING_MODULES = {__name__, "streaming", "contextlib", "db_pool", "operations", "cache"}
+
+# Closures an API function hands to the lookup cache; the statement belongs to the function
+# that defined them, further up the stack
+_CLOSURES = {"load", "<lambda>"}
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES = re.compile(r"(\(\?\+?\))(?:\s*,\s*\(\?\+?\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    '''
+    Normalizes a statement so that calls differing only in values share one entry
+
+    Literals and %s placeholders become ?, IN lists and multi-row VALUES collapse, whitespace is squeezed
+    '''
+    text = statement.replace("%s", "?")
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _SPACE.sub(" ", text).strip().rstrip(";").strip()
+    text = _LIST.sub("(?+)", text)
+    text = _VALUES.sub(r"\1+", text)
+    return text
+
+
+class Histogram:
+    '''
+    Count, total, max and a bounded reservoir of latency samples
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = []
+
+    def add(self, seconds, rows):
+        self.count += 1
+        self.total += seconds
+        self.rows += rows
+        self.max = max(self.max, seconds)
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = seconds
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class QueryStats:
+    '''
+    Thread-safe collection of statement timings
+
+    Parameters:
+        slow_threshold - Seconds above which a statement is logged as slow
+        explain_slow - Capture EXPLAIN output for slow SELECT statements
+    '''
+
+    def __init__(self, slow_threshold=SLOW_THRESHOLD, explain_slow=EXPLAIN_SLOW):
+        self.slow_threshold = slow_threshold
+        self.explain_slow = explain_slow
+        self._lock = threading.Lock()
+        self.by_fingerprint = {}
+        self.by_caller = {}
+        self.callers = {}
+        self.explains = {}
+
+    def record(self, statement_fingerprint, caller, seconds, rows):
+        with self._lock:
+            self.by_fingerprint.setdefault(statement_fingerprint, Histogram()).add(seconds, rows)
+            self.by_caller.setdefault(caller, Histogram()).add(seconds, rows)
+            self.callers.setdefault(statement_fingerprint, set()).add(caller)
+
+    def wants_explain(self, statement_fingerprint):
+        with self._lock:
+            return self.explain_slow and statement_fingerprint not in self.explains
+
+    def store_explain(self, statement_fingerprint, plan):
+        with self._lock:
+            self.explains[statement_fingerprint] = plan
+
+    def reset(self):
+        with self._lock:
+            self.by_fingerprint.clear()
+            self.by_caller.clear()
+            self.callers.clear()
+            self.explains.clear()
+
+    def summary(self, limit=20):
+        '''
+        Returns a text table of the statements with the highest total time, then per-API totals
+        '''
+        with self._lock:
+            statements = sorted(self.by_fingerprint.items(), key=lambda item: item[1].total, reverse=True)
+            callers = sorted(self.by_caller.items(), key=lambda item: item[1].total, reverse=True)
+            lines = ["", "--- Query timing summary (ms) ---",
+                     f"{'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'rows':>8}  statement"]
+            for text, h in statements[:limit]:
+                lines.append(f"{h.count:>7} {h.percentile(50) * 1000:>8.1f} {h.percentile(95) * 1000:>8.1f} "
+                             f"{h.percentile(99) * 1000:>8.1f} {h.max * 1000:>8.1f} {h.rows:>8}  "
+                             f"{text[:100]}  [{', '.join(sorted(self.callers[text]))}]")
+            lines.append("")
+            lines.append(f"{'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'total':>9}  API function")
+            for caller, h in callers:
+                lines.append(f"{h.count:>7} {h.percentile(50) * 1000:>8.1f} {h.percentile(95) * 1000:>8.1f} "
+                             f"{h.percentile(99) * 1000:>8.1f} {h.total * 1000:>9.1f}  {caller}")
+            for text, plan in self.explains.items():
+                lines.append("")
+                lines.append(f"EXPLAIN {text[:100]}")
+                lines.extend(f"    {row}" for row in plan)
+        return "\n".join(lines)
+
+
+# Shared by every pooled session in this process
+QUERY_STATS = QueryStats()
+
+
+def _calling_function():
+    # A private _helper counts as the public function of its own module that called it
+    # (apis._keyset_page as apis.search_stores_page); called from elsewhere, it stands for itself
+    frame = sys._getframe(2)
+    helper = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        name = frame.f_code.co_name
+        if module in _PLUMBING_MODULES or name in _CLOSURES:
+            pass
+        elif helper is not None and module != helper[0]:
+            break
+        elif name.startswith("_") and not name.startswith("__"):
+            helper = helper or (module, name)
+        else:
+            return f"{module}.{name}"
+        frame = frame.f_back
+    return f"{helper[0]}.{helper[1]}" if helper else "unknown"
+
+
+class InstrumentedCursor:
+    '''
+    Wraps a MySQL cursor and records every statement it runs in a QueryStats
+
+    A statement's latency covers execute() plus every fetch until the next execute() or close(),
+    so streamed (unbuffered) results are timed in full. Everything else is passed through.
+
+    Parameters:
+        cursor - The real cursor
+        stats - QueryStats to record into (QUERY_STATS by default)
+    '''
+
+    def __init__(self, cursor, stats=None):
+        self._cursor = cursor
+        self._stats = stats or QUERY_STATS
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        statement, params, text, caller, elapsed, fetched = pending
+        rows = fetched if fetched else max(getattr(self._cursor, "rowcount", 0) or 0, 0)
+        self._stats.record(text, caller, elapsed, rows)
+        if elapsed >= self._stats.slow_threshold:
+            logger.warning("Slow statement (%.1f ms, %d rows) from %s: %s", elapsed * 1000, rows, caller, text)
+            if text.upper().startswith("SELECT") and self._stats.wants_explain(text):
+                self._explain(statement, params, text)
+
+    def _explain(self, statement, params, text):
+        try:
+            self._cursor.execute("EXPLAIN " + statement, params)
+            columns = [d[0] for d in self._cursor.description or []]
+            plan = [dict(zip(columns, row)) for row in self._cursor.fetchall()]
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+        self._stats.store_explain(text, plan)
+
+    def execute(self, statement, params=None, *args, **kwargs):
+        self._finish()
+        caller = _calling_function()
+        started = time.perf_counter()
+        try:
+            if params is None:
+                result = self._cursor.execute(statement, *args, **kwargs)
+            else:
+                result = self._cursor.execute(statement, params, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._pending = [statement, params, fingerprint(statement), caller, elapsed, 0]
+        return result
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        rows = getattr(self._cursor, method)(*args)
+        if self._pending is not None:
+            self._pending[4] += time.perf_counter() - started
+            if method == "fetchone":
+                self._pending[5] += 1 if rows is not None else 0
+            else:
+                self._pending[5] += len(rows)
+        return rows
+
+    def fetchone(self):
+        return self._timed_fetch("fetchone")
+
+    def fetchmany(self, size=1):
+        return self._timed_fetch("fetchmany", size)
+
+    def fetchall(self):
+        return self._timed_fetch("fetchall")
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
@@ -0,0 +1,258 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to run table-wide changes as chunked, resumable jobs
+
+A single UPDATE over a whole table holds its row locks and undo until it finishes, which stalls
+everyone else touching that table. A chunked job instead walks the table's key in order, a
+bounded number of rows at a time, and commits after every chunk, so locks are held for one chunk only.
+
+This file:
+    1. Walks a unique key in chunks and runs a step function on each key range in its own transaction
+    2. Records a checkpoint (last key done) in JobCheckpoint inside the same transaction, so an
+       interrupted job resumes exactly where it stopped and never repeats a committed chunk
+    3. Throttles between chunks: a fixed pause, and/or waiting while a replica lags too far behind
+    4. Reports progress and lists or forgets checkpoints from the command line
+
+Usage:
+    python jobs.py status
+    python jobs.py forget reward_run_12
+'''
+
+import argparse
+import sys
+import time
+
+import mysql.connector
+
+# Rows per chunk unless a job asks for another size
+DEFAULT_CHUNK = 1000
+
+# Print progress every this many chunks
+PROGRESS_EVERY = 10
+
+CREATE_CHECKPOINTS = """
+    CREATE TABLE IF NOT EXISTS JobCheckpoint (
+        JobName VARCHAR(128) PRIMARY KEY,
+        LastKey VARCHAR(255) NULL,
+        RowsDone BIGINT NOT NULL DEFAULT 0,
+        Chunks INT NOT NULL DEFAULT 0,
+        Status VARCHAR(16) NOT NULL,
+        UpdatedAt DATETIME NOT NULL
+    )
+"""
+
+_table_ready = False
+
+
+def ensure_checkpoint_table(cursor):
+    '''
+    Creates JobCheckpoint if it does not exist yet (once per process)
+    '''
+    global _table_ready
+    if not _table_ready:
+        cursor.execute(CREATE_CHECKPOINTS)
+        _table_ready = True
+
+
+def key_range(column, low, high):
+    '''
+    Returns (SQL condition, params) selecting column values in (low, high]; no lower bound when low is None
+    '''
+    if low is None:
+        return f"{column} <= %s", (high,)
+    return f"{column} > %s AND {column} <= %s", (low, high)
+
+
+class Throttle:
+    '''
+    Decides how long a job waits between chunks
+
+    Parameters:
+        pause - Seconds to sleep after every chunk
+        max_lag - Most seconds a replica may lag before the job waits for it (None to ignore lag)
+        replica - Cursor on the replica to watch (needed for max_lag)
+        poll - Seconds between lag checks while waiting
+    '''
+
+    def __init__(self, pause=0.0, max_lag=None, replica=None, poll=1.0):
+        self.pause = pause
+        self.max_lag = max_lag
+        self.replica = replica
+        self.poll = poll
+        self.waited = 0.0
+
+    def replica_lag(self):
+        '''
+        Returns the replica's lag in seconds (None if it is not replicating)
+        '''
+        try:
+            self.replica.execute("SHOW REPLICA STATUS")
+        except mysql.connector.Error:
+            # Servers before 8.0.22
+            self.replica.execute("SHOW SLAVE STATUS")
+        row = self.replica.fetchone()
+        if row is None:
+            return None
+        status = dict(zip([column[0] for column in self.replica.description], row))
+        return status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+
+    def wait(self):
+        started = time.perf_counter()
+        if self.pause:
+            time.sleep(self.pause)
+        if self.max_lag is not None and self.replica is not None:
+            while True:
+                lag = self.replica_lag()
+                if lag is None or lag <= self.max_lag:
+                    break
+                time.sleep(self.poll)
+        self.waited += time.perf_counter() - started
+
+
+def _progress(name, chunks, rows, last_key, elapsed):
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"{name}: {chunks} chunk(s), {rows} row(s), up to key {last_key} ({rate:.0f} rows/s)")
+
+
+def run_chunked(cursor, name, table, key, step, chunk=DEFAULT_CHUNK, throttle=None, restart=False,
+                report=_progress):
+    '''
+    Runs step over table in key order, one chunk of at most chunk rows per transaction
+
+    Parameters:
+        cursor - Active MySQL cursor
+        name - Job name; the checkpoint is kept under it
+        table - Table to walk
+        key - Unique, non-null column of table to walk in order
+        step - Function (cursor, low, high) that changes the rows whose key is in (low, high]
+               (low is None for the first chunk, see key_range) and returns how many it changed
+        chunk - Rows of table per chunk
+        throttle - Optional Throttle applied between chunks
+        restart - Ignore an unfinished checkpoint and start from the first key
+        report - Function (name, chunks, rows, last key, seconds) called every PROGRESS_EVERY
+                 chunks and at the end (None for silence)
+
+    Returns:
+        Dictionary with chunks, rows, resumed (True if an unfinished run was continued) and elapsed seconds
+    '''
+    ensure_checkpoint_table(cursor)
+    cursor.execute("SELECT LastKey, RowsDone, Chunks, Status FROM JobCheckpoint WHERE JobName = %s", (name,))
+    checkpoint = cursor.fetchone()
+    if checkpoint and checkpoint[3] == "running" and not restart:
+        last_key, rows, chunks, _ = checkpoint
+        resumed = True
+    else:
+        last_key, rows, chunks, resumed = None, 0, 0, False
+        cursor.execute("""
+            REPLACE INTO JobCheckpoint (JobName, LastKey, RowsDone, Chunks, Status, UpdatedAt)
+            VALUES (%s, NULL, 0, 0, 'running', NOW())
+        """, (name,))
+        cursor.execute("COMMIT")
+
+    started = time.perf_counter()
+    while True:
+        # The chunk ends at the chunk-th key after the checkpoint, or at the last key
+        after, params = ("", ()) if last_key is None else (f"WHERE {key} > %s", (last_key,))
+        cursor.execute(f"SELECT {key} FROM {table} {after} ORDER BY {key} LIMIT 1 OFFSET %s",
+                       params + (chunk - 1,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(f"SELECT MAX({key}) FROM {table} {after}", params)
+            row = cursor.fetchone()
+        high = row[0] if row else None
+        if high is None:
+            break
+
+        cursor.execute("START TRANSACTION")
+        try:
+            changed = step(cursor, last_key, high)
+            cursor.execute("""
+                UPDATE JobCheckpoint SET LastKey = %s, RowsDone = RowsDone + %s, Chunks = Chunks + 1,
+                                         UpdatedAt = NOW()
+                WHERE JobName = %s
+            """, (str(high), changed, name))
+            cursor.execute("COMMIT")
+        except mysql.connector.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        last_key, rows, chunks = high, rows + changed, chunks + 1
+
+        if report and chunks % PROGRESS_EVERY == 0:
+            report(name, chunks, rows, last_key, time.perf_counter() - started)
+        if throttle is not None:
+            throttle.wait()
+
+    cursor.execute("UPDATE JobCheckpoint SET Status = 'done', UpdatedAt = NOW() WHERE JobName = %s", (name,))
+    cursor.execute("COMMIT")
+    elapsed = time.perf_counter() - started
+    if report:
+        report(name, chunks, rows, last_key, elapsed)
+    return {"chunks": chunks, "rows": rows, "resumed": resumed, "elapsed": elapsed}
+
+
+def throttle_from_args(args):
+    '''
+    Builds the Throttle for the --pause, --max-lag and --replica-host options (see add_throttle_options)
+
+    Returns:
+        (Throttle, replica connection or None); the caller closes the connection
+    '''
+    replica = None
+    if args.max_lag is not None:
+        if not args.replica_host:
+            raise ValueError("--max-lag needs --replica-host")
+        from db_pool import connection_settings
+        settings = connection_settings(prompt=False)
+        replica = mysql.connector.connect(host=args.replica_host, user=settings["user"],
+                                          password=settings["password"], database=settings["database"])
+    return Throttle(args.pause, args.max_lag, replica.cursor() if replica else None), replica
+
+
+def add_throttle_options(parser, restart=True):
+    '''
+    Adds --chunk, --pause, --max-lag, --replica-host and (unless restart is False) --restart
+    '''
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="Rows per chunk")
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep after every chunk")
+    parser.add_argument("--max-lag", type=float, help="Wait while the replica lags more than this many seconds")
+    parser.add_argument("--replica-host", help="Replica to watch for --max-lag")
+    if restart:
+        parser.add_argument("--restart", action="store_true", help="Ignore an unfinished checkpoint")
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Inspect MuskieCo chunked job checkpoints")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="List job checkpoints")
+    forget = commands.add_parser("forget", help="Delete a checkpoint so the job starts over")
+    forget.add_argument("name")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            ensure_checkpoint_table(cursor)
+            if args.command == "forget":
+                cursor.execute("DELETE FROM JobCheckpoint WHERE JobName = %s", (args.name,))
+                print(f"Forgot {args.name}." if cursor.rowcount else f"No checkpoint named {args.name}.")
+            else:
+                cursor.execute("SELECT JobName, Status, Chunks, RowsDone, LastKey, UpdatedAt "
+                               "FROM JobCheckpoint ORDER BY UpdatedAt DESC")
+                rows = cursor.fetchall()
+                for name, status, chunks, done, last_key, updated in rows:
+                    print(f"{name}: {status}, {chunks} chunk(s), {done} row(s), last key {last_key}, at {updated}")
+                if not rows:
+                    print("No jobs recorded.")
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
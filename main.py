@@ -9,9 +9,14 @@ This file:
     3. Supports inventory updates and basic reporting features
 '''
 
+import logging
+
 import mysql.connector
-import getpass
 
+from db_pool import pool_from_env
+from cache import LOOKUP_CACHE
+from instrumentation import QUERY_STATS
+from bulk_inventory import bulk_inventory_import
 from apis import (
     enter_store, search_store, update_store, delete_store,
     enter_member, search_member, update_member, delete_member,
@@ -24,17 +29,29 @@ from apis import (
 
 
 
-def command_line_ui(cursor):
+def command_line_ui(pool):
     
     '''
     This function displays the command-line interface for MuskieCo system and handles user interaction
     
     Parameters:
-        cursor - A cursor object that is used to execute MySQL queries
+        pool - ConnectionPool; every operation checks out its own connection and cursor from it
     
     Returns:
         None
     '''
+
+    def run(operation):
+        '''
+        Runs one API function on a pooled connection, committing when it finishes
+        
+        A lost connection is reported and replaced on the next call instead of ending the session
+        '''
+        try:
+            with pool.session() as cursor:
+                operation(cursor)
+        except mysql.connector.Error as e:
+            print(f"Database error: {e}")
     
     print("Welcome to MuskieCo.\n")
 
@@ -77,13 +94,13 @@ def command_line_ui(cursor):
                 print("4. Delete")
                 op = input("Operation: ").strip()
                 if op == "1":
-                    enter(cursor)
+                    run(enter)
                 elif op == "2":
-                    search(cursor)
+                    run(search)
                 elif op == "3":
-                    update(cursor)
+                    run(update)
                 elif op == "4":
-                    delete(cursor)
+                    run(delete)
                 else:
                     print("Invalid choice.")
 
@@ -99,37 +116,50 @@ def command_line_ui(cursor):
                 print("Invalid category.")
 
         elif task_choice == "2":
-            update_inventory(cursor)
+            print("\n1. Update a single product")
+            print("2. Bulk import deltas from a CSV/JSONL file")
+            inventory_choice = input("Enter the number corresponding to your choice: ").strip()
+            if inventory_choice == "1":
+                run(update_inventory)
+            elif inventory_choice == "2":
+                # Bulk import checks out one pooled connection per chunk itself
+                bulk_inventory_import(pool)
+            else:
+                print("Invalid choice.")
 
         elif task_choice == "3":
             print("\nWhich billing and transaction operation would you like to perform?")
             print("1. Generate reward notices for members")
             print("2. Generate rewards checks for employees")
             print("3. Calculate the total price of a transaction")
-            print("4. Reset customer rewards")
-            print("5. Reset signups staff obtained.")
+            print("4. Issue member reward notices and reset the points paid")
+            print("5. Issue staff reward checks and reset the signups paid")
             print("6. Generate final prices.")
             operation = input("Enter the number corresponding to your choice: ").strip()
 
             if operation == "1":
-                view_customer_rewards(cursor)
+                run(view_customer_rewards)
             elif operation == "2":
-                view_staff_signups(cursor)
+                run(view_staff_signups)
             elif operation == "3":
-                view_product_prices(cursor)
+                run(view_product_prices)
             elif operation == "4":
-                reset_customer_rewards(cursor)
+                run(reset_customer_rewards)
             elif operation == "5":
-                reset_staff_signups(cursor)
+                run(reset_staff_signups)
             elif operation == "6":
-                view_final_prices(cursor)
+                run(view_final_prices)
             else:
                 print("Invalid choice.")
 
         elif task_choice == "4":
-            generate_report(cursor)
+            run(lambda cursor: generate_report(cursor, pool))
 
         elif task_choice == "5":
+            if QUERY_STATS.by_fingerprint:
+                print(QUERY_STATS.summary())
+            if LOOKUP_CACHE.stats["hits"] or LOOKUP_CACHE.stats["misses"]:
+                print(LOOKUP_CACHE.summary())
             print("Exiting the system. Goodbye!")
             break
 
@@ -141,31 +171,30 @@ def main():
     '''
     Main function of the MuskieCo CLI system
     
-    Prompts for MySQL login credentials, establishes a connection, and launches the command-line UI
+    Prompts for MySQL login credentials (unless set in MUSKIECO_* environment variables),
+    creates the connection pool, and launches the command-line UI
     
     Returns:
         None
     '''
     
     print("MySQL Database Login\n")
-    user = input("Enter MySQL username: ")
-    password = getpass.getpass("Enter MySQL password: ")
+    pool = pool_from_env()
 
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user=user,
-            password=password,
-            database="muskieco"
-        )
-        cursor = connection.cursor()
-        command_line_ui(cursor)
-        connection.commit()
-        cursor.close()
-        connection.close()
-
+        # Open one connection up front so bad credentials are reported immediately
+        pool.warm()
     except mysql.connector.Error as err:
         print(f"Failed to connect: {err}")
+        return
+
+    # Slow statements are logged to stderr
+    logging.basicConfig(format="%(asctime)s %(name)s %(message)s")
+
+    try:
+        command_line_ui(pool)
+    finally:
+        pool.close()
 
 
 if __name__ == "__main__":
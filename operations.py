@@ -0,0 +1,259 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to hold the logic of the API operations once, for both drivers
+
+An operation here is a generator: it yields the statements it needs (built with one, rows or
+write), is sent back each statement's result, and returns the operation's result. It does no
+I/O itself, so apis.py runs it on a mysql.connector cursor with run() and async_apis.py on an
+aiomysql cursor with arun(); the branching, the lookup cache invalidation and the reading of
+rows are the same code on both paths, only the driver differs.
+
+This file:
+    1. Statement steps and the two drivers, run (blocking) and arun (asyncio)
+    2. Store, member, staff and discount writes, and the discount lookup
+    3. Inventory increments
+
+Lookups served from the lookup cache (find_store, find_member, find_staff) stay in apis.py and
+async_apis.py, because the cache calls their loader itself.
+'''
+
+from cache import LOOKUP_CACHE, as_key
+from queries import (
+    NEWEST_STORE_AT_ADDRESS, INSERT_STORE_ADDRESS, INSERT_STORE, STORE_ADDRESS_OF, STORE_BY_ID,
+    ADDRESS_EXISTS, PHONE_AT_ADDRESS, MOVE_STORE, STORES_AT_ADDRESS, DELETE_ADDRESS, UPDATE_PHONE,
+    DELETE_STORE, INSERT_CUSTOMER_EMAIL, INSERT_MEMBER, MEMBER_EMAIL_OF, UPDATE_MEMBER,
+    DELETE_MEMBER_BY_ID, DELETE_MEMBER_BY_EMAIL, DELETE_CUSTOMER_EMAIL, INSERT_STAFF_EMAIL,
+    INSERT_STAFF, UPDATE_STAFF, DELETE_STAFF_BY_ID, DELETE_STAFF_BY_EMAIL, DELETE_STAFF_EMAIL,
+    INSERT_DISCOUNT, DISCOUNTS_OF, UPDATE_DISCOUNT, DELETE_DISCOUNT, GUARDED_STOCK_CHANGE,
+    STOCK_UPSERT, STOCK_OF, STOCK_OF_FOR_UPDATE
+)
+
+# What a step hands back: the first row, all rows, or the affected row count
+ONE = "one"
+ALL = "all"
+COUNT = "count"
+
+
+# ------ Steps and drivers ------
+
+def one(query, params=()):
+    '''
+    Step whose result is the first row (or None)
+    '''
+    return ONE, query, params
+
+
+def rows(query, params=()):
+    '''
+    Step whose result is the list of all rows
+    '''
+    return ALL, query, params
+
+
+def write(query, params=()):
+    '''
+    Step whose result is the number of rows affected
+    '''
+    return COUNT, query, params
+
+
+def run(cursor, operation):
+    '''
+    Runs an operation on a blocking (mysql.connector style) cursor and returns its result
+    '''
+    result = None
+    while True:
+        try:
+            kind, query, params = operation.send(result)
+        except StopIteration as done:
+            return done.value
+        cursor.execute(query, params)
+        if kind == ONE:
+            result = cursor.fetchone()
+        elif kind == ALL:
+            result = list(cursor.fetchall())
+        else:
+            result = cursor.rowcount
+
+
+async def arun(cursor, operation):
+    '''
+    Runs an operation on an aiomysql cursor and returns its result
+    '''
+    result = None
+    while True:
+        try:
+            kind, query, params = operation.send(result)
+        except StopIteration as done:
+            return done.value
+        await cursor.execute(query, params)
+        if kind == ONE:
+            result = await cursor.fetchone()
+        elif kind == ALL:
+            result = list(await cursor.fetchall())
+        else:
+            result = cursor.rowcount
+
+
+# ------ Store ------
+
+def _invalidate_store(store_id):
+    key = as_key(store_id)
+    if key is None:
+        LOOKUP_CACHE.write_all("store")
+    else:
+        LOOKUP_CACHE.write("store", key)
+
+
+def add_store(store_addr, phone):
+    LOOKUP_CACHE.write("store")
+    yield write(INSERT_STORE_ADDRESS, (store_addr, phone))
+    yield write(INSERT_STORE, (store_addr,))
+    return (yield one(NEWEST_STORE_AT_ADDRESS, (store_addr,)))
+
+
+def change_store(store_id, new_addr=None, new_phone=None):
+    _invalidate_store(store_id)
+    result = yield one(STORE_ADDRESS_OF, (store_id,))
+    if not result:
+        return "not_found", None
+    current_addr = result[0]
+
+    address_changed = new_addr and new_addr != current_addr
+    phone_changed = bool(new_phone)
+
+    if address_changed:
+        if (yield one(ADDRESS_EXISTS, (new_addr,))):
+            return "address_exists", None
+
+        if not phone_changed:
+            phone_row = yield one(PHONE_AT_ADDRESS, (current_addr,))
+            new_phone = phone_row[0] if phone_row else "000-000-0000"
+
+        yield write(INSERT_STORE_ADDRESS, (new_addr, new_phone))
+        yield write(MOVE_STORE, (new_addr, store_id))
+        status = "address_updated"
+
+        if (yield one(STORES_AT_ADDRESS, (current_addr,)))[0] == 0:
+            yield write(DELETE_ADDRESS, (current_addr,))
+            status = "address_updated_old_removed"
+
+    elif phone_changed:
+        # The phone belongs to the address, which other stores may share
+        LOOKUP_CACHE.write_all("store")
+        yield write(UPDATE_PHONE, (new_phone, current_addr))
+        status = "phone_updated"
+    else:
+        return "unchanged", None
+
+    return status, (yield one(STORE_BY_ID, (store_id,)))
+
+
+def remove_store(store_id):
+    _invalidate_store(store_id)
+    result = yield one(STORE_ADDRESS_OF, (store_id,))
+    if not result:
+        return False
+    yield write(DELETE_STORE, (store_id,))
+    yield write(DELETE_ADDRESS, (result[0],))
+    return True
+
+
+# ------ Member ------
+
+def add_member(customer_id, email, home_addr, active, reward_points, staff_id):
+    LOOKUP_CACHE.write("member", as_key(customer_id), email)
+    yield write(INSERT_CUSTOMER_EMAIL, (email, email.split("@")[0], home_addr, active, staff_id, reward_points))
+    yield write(INSERT_MEMBER, (customer_id, email))
+
+
+def change_member(customer_id, home_addr, active, reward_points, staff_id):
+    '''
+    Returns the member's email, or None if no member has that CustomerID
+    '''
+    LOOKUP_CACHE.write("member", as_key(customer_id))
+    result = yield one(MEMBER_EMAIL_OF, (customer_id,))
+    if not result:
+        return None
+    email = result[0]
+    yield write(UPDATE_MEMBER, (home_addr, active, staff_id, reward_points, email))
+    return email
+
+
+def remove_member(customer_id=None, email=None):
+    LOOKUP_CACHE.write("member", as_key(customer_id), email)
+    if customer_id is not None:
+        return (yield write(DELETE_MEMBER_BY_ID, (int(customer_id),)))
+    deleted = yield write(DELETE_MEMBER_BY_EMAIL, (email,))
+    yield write(DELETE_CUSTOMER_EMAIL, (email,))
+    return deleted
+
+
+# ------ Staff ------
+
+def add_staff(staff_id, name, age, home_addr, job_title, email, employed_on, signups):
+    LOOKUP_CACHE.write("staff", as_key(staff_id), email)
+    yield write(INSERT_STAFF_EMAIL, (staff_id, name, age, home_addr, job_title, email, employed_on, signups))
+    yield write(INSERT_STAFF, (staff_id, email))
+
+
+def change_staff(email, staff_id, name, age, home_addr, job_title, employed_on, signups):
+    LOOKUP_CACHE.write("staff", alias=email)
+    return (yield write(UPDATE_STAFF, (staff_id, name, age, home_addr, job_title, employed_on, signups, email)))
+
+
+def remove_staff(staff_id=None, email=None):
+    LOOKUP_CACHE.write("staff", as_key(staff_id), email)
+    if staff_id is not None:
+        return (yield write(DELETE_STAFF_BY_ID, (int(staff_id),)))
+    deleted = yield write(DELETE_STAFF_BY_EMAIL, (email,))
+    yield write(DELETE_STAFF_EMAIL, (email,))
+    return deleted
+
+
+# ------ Discount ------
+
+# The writers leave dropping the cached price list to the driver's module, which knows when
+# its transaction ends
+
+def add_discount(product_id, description, valid_date):
+    yield write(INSERT_DISCOUNT, (description, valid_date, product_id))
+
+
+def find_discount(product_id):
+    '''
+    Returns the first DiscountInfo row for a product, or None
+    '''
+    found = yield rows(DISCOUNTS_OF, (product_id,))
+    return found[0] if found else None
+
+
+def change_discount(product_id, description, valid_date):
+    return (yield write(UPDATE_DISCOUNT, (description, valid_date, product_id)))
+
+
+def remove_discount(product_id):
+    return (yield write(DELETE_DISCOUNT, (product_id,)))
+
+
+# ------ Inventory ------
+
+def increment_inventory(product_id, store_id, quantity, non_negative=False):
+    if non_negative and quantity < 0:
+        # The guard is part of the UPDATE, so the check and the write are one atomic step
+        if (yield write(GUARDED_STOCK_CHANGE, (quantity, product_id, store_id, quantity))) == 0:
+            return "refused", None
+        status = "updated"
+    else:
+        # Whether the row exists is read, not inferred from the upsert's rowcount, which depends
+        # on the driver (CLIENT_FOUND_ROWS) and the engine; the lock keeps the answer true
+        existing = yield one(STOCK_OF_FOR_UPDATE, (product_id, store_id))
+        changed = yield write(STOCK_UPSERT, (product_id, store_id, quantity))
+        if existing is not None:
+            return "updated", existing[0] + quantity
+        # 2 only when another session created the row after the read above
+        status = "updated" if changed == 2 else "inserted"
+
+    # Our own write holds the row lock, so this reads exactly the value we produced
+    return status, (yield one(STOCK_OF, (product_id, store_id)))[0]
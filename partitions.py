@@ -0,0 +1,317 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to keep TransactionInfo split into monthly partitions on PurchaseDate
+
+Date-bounded reads of TransactionInfo (the customer spend report, the sales report on the
+transactions source, previews of archive.py) walk an index that grows with all of history.
+Partitioned by RANGE COLUMNS(PurchaseDate), one partition per calendar month, MySQL prunes
+such a read to the partitions of the months it covers, so a one-month report reads one
+month's B-tree however long the history is.
+
+Pruning needs the range written as plain comparisons on the bare column (PurchaseDate >= start
+AND PurchaseDate < end), which is how rollups.sales_query and the customer spend report
+build it; wrapping the column in a function (YEAR(PurchaseDate) = ...) reads every partition.
+
+This file:
+    1. Converts TransactionInfo to monthly partitions (from its first month through a few
+       months ahead, plus a catch-all partition for later dates)
+    2. Pre-creates future partitions by splitting the catch-all, so new months never pile up in it
+    3. Lists the partitions with their row estimates
+    4. Checks with EXPLAIN that a one-month sales and customer spend report each read one
+       partition, and that no TransactionID appears twice
+
+MySQL requires the partitioning column in every unique key, so converting changes the primary
+key of TransactionInfo to (TransactionID, PurchaseDate). From then on MySQL no longer keeps
+TransactionIDs unique: two rows with the same ID and different dates are both accepted. Keeping
+them unique becomes the application's job. checkout.py hands IDs out from its sequence, and
+anything else that writes TransactionInfo (datagen.py, bulk loads) must never reuse an ID. A
+table that already has a duplicate ID is not converted, and "check" reports any duplicate that
+appears later.
+
+Partitioned InnoDB tables cannot have foreign keys, so a TransactionInfo that has (or is
+referenced by) one is refused. Converting copies the table once and blocks writes while it
+runs. Adding future partitions splits the catch-all, which is instant while it is still empty;
+run "maintain" daily (cron) so it stays that way.
+
+Usage:
+    python partitions.py convert
+    python partitions.py maintain --months 3
+    python partitions.py list
+    python partitions.py check --month 2024-05
+'''
+
+import argparse
+import sys
+from datetime import date
+
+import mysql.connector
+
+from reports import get_report
+from rollups import parse_date, sales_query
+
+TABLE = "TransactionInfo"
+COLUMN = "PurchaseDate"
+
+# Months after the current one that always have their own partition
+FUTURE_MONTHS = 3
+
+# Catch-all for dates past the last monthly partition
+CATCH_ALL = "pfuture"
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    '''
+    Returns the name of the partition holding month (pYYYYMM)
+    '''
+    return f"p{month:%Y%m}"
+
+
+def _monthly(months):
+    return [f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month).isoformat()}')"
+            for month in months]
+
+
+def _months(first, last):
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def list_partitions(cursor):
+    '''
+    Returns the partitions of TransactionInfo in order
+
+    Returns:
+        List of (name, upper bound as written by MySQL, estimated rows); empty when the table
+        is not partitioned
+    '''
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (TABLE,))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def duplicate_ids(cursor, limit=20):
+    '''
+    Returns TransactionIDs that more than one TransactionInfo row has
+
+    Parameters:
+        cursor - Active MySQL cursor
+        limit - Most IDs to return
+
+    Returns:
+        List of (TransactionID, number of rows), empty when every ID is unique
+    '''
+    cursor.execute(f"""
+        SELECT TransactionID, COUNT(*) FROM {TABLE}
+        GROUP BY TransactionID HAVING COUNT(*) > 1
+        ORDER BY TransactionID LIMIT %s
+    """, (limit,))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def _describe_duplicates(duplicates):
+    return ", ".join(f"{transaction_id} ({rows} rows)" for transaction_id, rows in duplicates)
+
+
+def _blockers(cursor):
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME, TABLE_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+          AND (TABLE_NAME = %s OR REFERENCED_TABLE_NAME = %s)
+    """, (TABLE, TABLE))
+    blockers = [f"foreign key {name} on {table}" for name, table in cursor.fetchall()]
+    cursor.execute("""
+        SELECT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0 AND INDEX_NAME <> 'PRIMARY'
+        GROUP BY INDEX_NAME
+        HAVING SUM(COLUMN_NAME = %s) = 0
+    """, (TABLE, COLUMN))
+    blockers.extend(f"unique index {name} without {COLUMN}" for (name,) in cursor.fetchall())
+    return sorted(set(blockers))
+
+
+def convert_to_partitions(cursor, months_ahead=FUTURE_MONTHS):
+    '''
+    Partitions TransactionInfo by month of PurchaseDate (no-op apart from adding future
+    partitions when it already is)
+
+    The primary key becomes (TransactionID, PurchaseDate), so MySQL stops enforcing that
+    TransactionIDs are unique; the application must (see the top of this file)
+
+    Parameters:
+        cursor - Active MySQL cursor
+        months_ahead - Months after the current one to create partitions for
+
+    Returns:
+        List of partition names created
+
+    Raises:
+        ValueError - When a foreign key or a unique index keeps the table from being partitioned,
+                     or a TransactionID already appears more than once
+    '''
+    if list_partitions(cursor):
+        return add_future_partitions(cursor, months_ahead)
+    blockers = _blockers(cursor)
+    if blockers:
+        raise ValueError(f"Cannot partition {TABLE}: {', '.join(blockers)}")
+    duplicates = duplicate_ids(cursor)
+    if duplicates:
+        raise ValueError(f"Cannot partition {TABLE}: TransactionIDs appear more than once, and the new "
+                         f"primary key would let them stay that way: {_describe_duplicates(duplicates)}")
+
+    cursor.execute(f"SELECT MIN({COLUMN}) FROM {TABLE}")
+    first = parse_date(cursor.fetchone()[0] or date.today(), COLUMN)
+    last = month_start(date.today())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    months = _months(first, last)
+    definitions = _monthly(months) + [f"PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE)"]
+    cursor.execute(f"""
+        ALTER TABLE {TABLE}
+        DROP PRIMARY KEY, ADD PRIMARY KEY (TransactionID, {COLUMN}),
+        PARTITION BY RANGE COLUMNS({COLUMN}) ({", ".join(definitions)})
+    """)
+    return [partition_name(month) for month in months] + [CATCH_ALL]
+
+
+def add_future_partitions(cursor, months_ahead=FUTURE_MONTHS):
+    '''
+    Makes sure every month up to months_ahead after the current one has its own partition, by
+    splitting them off the catch-all partition
+
+    Returns:
+        List of partition names created (empty when they all exist)
+
+    Raises:
+        ValueError - When TransactionInfo is not partitioned by month yet (run convert first)
+    '''
+    existing = list_partitions(cursor)
+    if not existing or existing[-1][0] != CATCH_ALL:
+        raise ValueError(f"{TABLE} is not partitioned by month; run: python partitions.py convert")
+    bounded = [bound for name, bound, _ in existing if name != CATCH_ALL]
+    # Bounds read back like '2024-06-01' (quoted)
+    covered_until = parse_date(bounded[-1].strip("'"), "partition bound") if bounded else month_start(date.today())
+
+    target = month_start(date.today())
+    for _ in range(months_ahead):
+        target = next_month(target)
+    months = _months(covered_until, target)
+    if not months:
+        return []
+    definitions = _monthly(months) + [f"PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE)"]
+    cursor.execute(f"ALTER TABLE {TABLE} REORGANIZE PARTITION {CATCH_ALL} INTO ({', '.join(definitions)})")
+    return [partition_name(month) for month in months]
+
+
+def partitions_read(cursor, query, params):
+    '''
+    Returns the TransactionInfo partitions EXPLAIN says query reads (None if it names none,
+    e.g. when the table is not partitioned)
+    '''
+    cursor.execute("EXPLAIN " + query, params)
+    columns = [d[0] for d in cursor.description]
+    read = set()
+    found = False
+    for row in cursor.fetchall():
+        plan = dict(zip(columns, row))
+        if plan.get("partitions"):
+            found = True
+            read.update(plan["partitions"].split(","))
+    return sorted(read) if found else None
+
+
+def check_pruning(cursor, month):
+    '''
+    EXPLAINs a one-month sales report (on the transactions source) and customer spend report
+
+    Parameters:
+        cursor - Active MySQL cursor
+        month - Any day of the month to report on
+
+    Returns:
+        List of (report, partitions read or None, ok); ok is True when exactly one partition is read
+    '''
+    first = month_start(month)
+    following = next_month(first)
+    last = date.fromordinal(following.toordinal() - 1)
+    cases = [
+        ("sales (transactions)", *sales_query("day", first, following, source="transactions")),
+        ("customer_spend", *get_report("customer_spend").prepare({"start": first, "end": last})),
+    ]
+    results = []
+    for label, query, params in cases:
+        read = partitions_read(cursor, query, params)
+        results.append((label, read, read == [partition_name(first)]))
+    return results
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Monthly RANGE partitions for MuskieCo TransactionInfo")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in [("convert", "Partition TransactionInfo by month (copies the table once)"),
+                            ("maintain", "Create the partitions of the coming months")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--months", type=int, default=FUTURE_MONTHS,
+                             help="Months ahead to keep partitions for (default %(default)s)")
+    commands.add_parser("list", help="List the partitions with row estimates")
+    check = commands.add_parser("check", help="EXPLAIN one-month reports and confirm they read one partition "
+                                               "and that TransactionIDs are unique")
+    check.add_argument("--month", default=date.today().strftime("%Y-%m"), help="YYYY-MM (default this month)")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            if args.command in ("convert", "maintain"):
+                action = convert_to_partitions if args.command == "convert" else add_future_partitions
+                created = action(cursor, args.months)
+                print(f"Created partitions: {', '.join(created)}" if created else "Partitions are up to date.")
+            elif args.command == "list":
+                partitions = list_partitions(cursor)
+                for name, bound, rows in partitions:
+                    print(f"{name}: before {bound}, ~{rows} rows")
+                if not partitions:
+                    print(f"{TABLE} is not partitioned.")
+            else:
+                month = parse_date(f"{args.month}-01", "month")
+                results = check_pruning(cursor, month)
+                for label, read, ok in results:
+                    print(f"{label}: reads {', '.join(read) if read else 'no partitions'} "
+                          f"({'pruned to one' if ok else 'NOT pruned to ' + partition_name(month)})")
+                duplicates = duplicate_ids(cursor)
+                if duplicates:
+                    print(f"Duplicate TransactionIDs: {_describe_duplicates(duplicates)}")
+                else:
+                    print("TransactionIDs are unique.")
+                return 0 if all(ok for _, _, ok in results) and not duplicates else 1
+    except ValueError as e:
+        print(e)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to run the fixed API statements as server-side prepared statements
+
+Every statement registered in queries.REGISTRY is prepared once per pooled connection (with the
+connector's prepared cursor) and from then on only its parameters are sent, so MySQL does not
+parse and plan the same text again on every call. Everything else (reports, keyset pages,
+ad-hoc SQL) runs on the session's ordinary cursor as before.
+
+This file:
+    1. PreparedCursor: the session cursor used by db_pool.py; routes registered statements to the
+       connection's prepared cursors and everything else to the plain cursor
+    2. Keeps one prepared cursor per statement per connection for the connection's lifetime
+
+Prepared results are read in full right after execute (they are point lookups and single-row
+writes), so they never leave unread rows on the connection.
+
+Environment:
+    MUSKIECO_PREPARED - Set to 0 to send every statement as plain text
+'''
+
+import os
+
+import mysql.connector
+
+from queries import REGISTRY
+
+PREPARE_STATEMENTS = os.environ.get("MUSKIECO_PREPARED", "1") != "0"
+
+_STATEMENTS = frozenset(REGISTRY.values())
+
+
+class PreparedCursor:
+    '''
+    Session cursor that executes registered statements as prepared statements
+
+    Parameters:
+        cursor - The connection's plain (unbuffered) cursor
+        connection - The pooled connection
+        statements - Dictionary SQL text -> prepared cursor kept for this connection
+    '''
+
+    def __init__(self, cursor, connection, statements):
+        self._cursor = cursor
+        self._connection = connection
+        self._statements = statements
+        # Prepared cursor of the last statement and its rows, or None when the plain cursor ran it
+        self._active = None
+        self._rows = []
+
+    def __getattr__(self, name):
+        return getattr(self._active if self._active is not None else self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def execute(self, statement, params=None, *args, **kwargs):
+        if statement not in _STATEMENTS:
+            self._active, self._rows = None, []
+            if params is None:
+                return self._cursor.execute(statement, *args, **kwargs)
+            return self._cursor.execute(statement, params, *args, **kwargs)
+
+        # A streamed result still pending on the plain cursor would block the connection
+        if getattr(self._connection, "unread_result", False):
+            self._cursor.fetchall()
+        prepared = self._statements.get(statement)
+        if prepared is None:
+            prepared = self._connection.cursor(prepared=True)
+            self._statements[statement] = prepared
+        prepared.execute(statement, params or ())
+        self._rows = list(prepared.fetchall()) if prepared.with_rows else []
+        self._active = prepared
+
+    def fetchone(self):
+        if self._active is None:
+            return self._cursor.fetchone()
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size=1):
+        if self._active is None:
+            return self._cursor.fetchmany(size)
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        if self._active is None:
+            return self._cursor.fetchall()
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        self._active, self._rows = None, []
+        return self._cursor.close()
+
+
+def close_statements(statements):
+    '''
+    Closes the prepared cursors of a connection (deallocating its statements on the server)
+    '''
+    for prepared in statements.values():
+        try:
+            prepared.close()
+        except mysql.connector.Error:
+            pass
+    statements.clear()
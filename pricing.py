@@ -0,0 +1,226 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to compute MuskieCo selling prices in one place
+
+This file:
+    1. Builds the single-pass final price query (one LEFT JOIN against currently valid discounts)
+    2. Computes per-transaction subtotal, discount and total with one GROUP BY query per batch of IDs
+    3. Keeps product sell prices and the set of discounted products in an in-process cache,
+       so repeated price lookups do not go back to MySQL
+
+A discount applies while its ValidDate is today or later. A product with several valid
+discount rows is still discounted once.
+'''
+
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from operations import rows, run
+
+# Multiplier applied to the sell price of a product with a valid discount
+DISCOUNT_FACTOR = 0.9
+
+# Seconds a cached price list stays fresh
+PRICE_CACHE_TTL = 300
+
+# Products with at least one discount valid today; DISTINCT keeps one row per product
+ACTIVE_DISCOUNTS = """
+    SELECT DISTINCT ProductID FROM DiscountInfo WHERE ValidDate >= CURDATE()
+"""
+
+FINAL_PRICES = f"""
+    SELECT I.TransactionID, I.ProductID,
+           MI.SellPrice * CASE WHEN D.ProductID IS NULL THEN 1 ELSE %s END AS FinalPrice
+    FROM Involves I
+    JOIN MerchandiseInfo MI ON I.ProductID = MI.ProductID
+    LEFT JOIN ({ACTIVE_DISCOUNTS}) D ON I.ProductID = D.ProductID
+"""
+
+# Largest number of TransactionIDs sent in one IN (...) list
+MAX_IDS_PER_QUERY = 1000
+
+
+class PriceCache:
+    '''
+    In-process cache of MerchandiseInfo sell prices and currently discounted products
+
+    The whole price list is loaded with two queries and reused until it is older than ttl
+    seconds, the date changes (discount validity is per day), or invalidate() is called.
+
+    Parameters:
+        ttl - Seconds before the cached price list is reloaded
+    '''
+
+    def __init__(self, ttl=PRICE_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._prices = None
+        self._discounted = None
+        self._loaded_at = 0.0
+        self._loaded_on = None
+        # Bumped by invalidate(); a load that raced with an invalidation is not kept
+        self._generation = 0
+        self.loads = 0
+
+    def invalidate(self):
+        '''
+        Drops the cached price list; the next lookup reloads it
+        '''
+        with self._lock:
+            self._generation += 1
+            self._prices = None
+            self._discounted = None
+
+    def _fresh(self):
+        return (self._prices is not None
+                and time.monotonic() - self._loaded_at < self.ttl
+                and self._loaded_on == date.today())
+
+    def snapshot(self, cursor):
+        '''
+        Returns the cached price list, loading it first if it is missing or stale
+
+        Call this before streaming rows on the same cursor: a reload needs the cursor free
+
+        Parameters:
+            cursor - Active MySQL cursor, only used when the cache needs reloading
+
+        Returns:
+            Tuple (dictionary of ProductID -> SellPrice, set of discounted ProductIDs)
+        '''
+        with self._lock:
+            if self._fresh():
+                return self._prices, self._discounted
+            generation = self._generation
+
+        cursor.execute("SELECT ProductID, SellPrice FROM MerchandiseInfo")
+        prices = dict(cursor.fetchall())
+        cursor.execute(ACTIVE_DISCOUNTS)
+        discounted = {row[0] for row in cursor.fetchall()}
+
+        with self._lock:
+            self.loads += 1
+            if generation == self._generation:
+                self._prices = prices
+                self._discounted = discounted
+                self._loaded_at = time.monotonic()
+                self._loaded_on = date.today()
+        return prices, discounted
+
+    def sell_price(self, cursor, product_id):
+        '''
+        Returns the sell price of a product (None if unknown)
+
+        Parameters:
+            cursor - Active MySQL cursor, only used when the cache needs reloading
+            product_id - Product ID
+        '''
+        prices, _ = self.snapshot(cursor)
+        return prices.get(product_id)
+
+    def is_discounted(self, cursor, product_id):
+        '''
+        Returns True if the product has a discount valid today
+        '''
+        _, discounted = self.snapshot(cursor)
+        return product_id in discounted
+
+    def final_price(self, cursor, product_id, factor=DISCOUNT_FACTOR):
+        '''
+        Returns the price of a product after any valid discount (None if unknown)
+
+        Parameters:
+            cursor - Active MySQL cursor, only used when the cache needs reloading
+            product_id - Product ID
+            factor - Multiplier applied when the product is discounted
+        '''
+        prices, discounted = self.snapshot(cursor)
+        price = prices.get(product_id)
+        if price is None:
+            return None
+        return apply_discount(price, factor) if product_id in discounted else price
+
+
+def apply_discount(price, factor=DISCOUNT_FACTOR):
+    '''
+    Multiplies a price by the discount factor, keeping DECIMAL prices exact
+    '''
+    if isinstance(price, Decimal):
+        return price * Decimal(str(factor))
+    return price * factor
+
+
+# Subtotal and discount per transaction; {where} narrows the transactions. The 0.00 keeps a
+# discount-free sum decimal on SQLite, which adds integer zeros up to an integer
+_TOTALS = f"""
+    SELECT I.TransactionID,
+           SUM(MI.SellPrice) AS Subtotal,
+           SUM(CASE WHEN D.ProductID IS NULL THEN 0.00 ELSE MI.SellPrice * (1 - %s) END) AS Discount
+    FROM Involves I
+    JOIN MerchandiseInfo MI ON I.ProductID = MI.ProductID
+    LEFT JOIN ({ACTIVE_DISCOUNTS}) D ON I.ProductID = D.ProductID
+    {{where}}
+    GROUP BY I.TransactionID
+"""
+
+# Every transaction's subtotal, discount and total; the only parameter is the discount factor
+TRANSACTION_TOTALS = f"""
+    SELECT TransactionID, Subtotal, Discount, Subtotal - Discount AS Total
+    FROM ({_TOTALS.format(where="")}) T
+    ORDER BY TransactionID
+"""
+
+
+def totals_query(count):
+    '''
+    Returns the aggregated totals query for count TransactionIDs
+
+    Parameters are the discount factor followed by the IDs; rows are (TransactionID, Subtotal, Discount)
+    '''
+    placeholders = ", ".join(["%s"] * count)
+    return _TOTALS.format(where=f"WHERE I.TransactionID IN ({placeholders})")
+
+
+def id_batches(transaction_ids):
+    '''
+    Splits transaction IDs (duplicates removed) into lists of at most MAX_IDS_PER_QUERY
+    '''
+    ids = list(dict.fromkeys(transaction_ids))
+    return [ids[start:start + MAX_IDS_PER_QUERY] for start in range(0, len(ids), MAX_IDS_PER_QUERY)]
+
+
+def transaction_totals(cursor, transaction_ids, factor=DISCOUNT_FACTOR):
+    '''
+    Computes subtotal, discount and final total for one or many transactions
+
+    Each batch of up to MAX_IDS_PER_QUERY IDs is answered by a single aggregated query that
+    only touches the Involves rows of those transactions (an index on Involves.TransactionID
+    keeps this a range lookup)
+
+    Parameters:
+        cursor - Active MySQL cursor
+        transaction_ids - Iterable of TransactionIDs
+        factor - Multiplier applied to discounted products
+
+    Returns:
+        Dictionary of TransactionID -> (subtotal, discount, total); unknown IDs are left out
+    '''
+    return run(cursor, totals_of(transaction_ids, factor))
+
+
+def totals_of(transaction_ids, factor=DISCOUNT_FACTOR):
+    '''
+    The transaction_totals operation as statement steps (see operations.py), shared with async_apis.py
+    '''
+    totals = {}
+    for batch in id_batches(transaction_ids):
+        for transaction_id, subtotal, discount in (yield rows(totals_query(len(batch)), (factor, *batch))):
+            totals[transaction_id] = (subtotal, discount, subtotal - discount)
+    return totals
+
+
+# Shared by every API call in this process
+PRICE_CACHE = PriceCache()
@@ -0,0 +1,191 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to hold the SQL text of the MuskieCo API operations in one place
+
+The blocking API functions (apis.py) and the asyncio ones (async_apis.py) run exactly these
+statements, so a query is only ever written, fixed or tuned here. Both drivers
+(mysql.connector and aiomysql) use %s placeholders.
+
+This file:
+    1. Statements for stores, members, staff, discounts, inventory and checkout
+    2. REGISTRY of those statements by name; pooled sessions run them as server-side prepared
+       statements (see prepared.py)
+    3. Builders for the queries whose shape depends on their arguments (store filter, keyset pages,
+       multi-row line item inserts)
+'''
+
+# ------ Store ------
+
+STORE_SELECT = """SELECT Store.StoreID, Store.StoreAddr, StoreAddress.Phone
+               FROM Store JOIN StoreAddress ON Store.StoreAddr = StoreAddress.StoreAddr"""
+
+STORE_BY_ID = STORE_SELECT + " WHERE Store.StoreID = %s"
+NEWEST_STORE_AT_ADDRESS = STORE_SELECT + " WHERE Store.StoreAddr = %s ORDER BY StoreID DESC LIMIT 1"
+INSERT_STORE_ADDRESS = "INSERT INTO StoreAddress (StoreAddr, Phone) VALUES (%s, %s)"
+INSERT_STORE = "INSERT INTO Store (StoreAddr) VALUES (%s)"
+STORE_ADDRESS_OF = "SELECT StoreAddr FROM Store WHERE StoreID = %s"
+ADDRESS_EXISTS = "SELECT 1 FROM StoreAddress WHERE StoreAddr = %s"
+PHONE_AT_ADDRESS = "SELECT Phone FROM StoreAddress WHERE StoreAddr = %s"
+MOVE_STORE = "UPDATE Store SET StoreAddr = %s WHERE StoreID = %s"
+STORES_AT_ADDRESS = "SELECT COUNT(*) FROM Store WHERE StoreAddr = %s"
+DELETE_ADDRESS = "DELETE FROM StoreAddress WHERE StoreAddr = %s"
+UPDATE_PHONE = "UPDATE StoreAddress SET Phone = %s WHERE StoreAddr = %s"
+DELETE_STORE = "DELETE FROM Store WHERE StoreID = %s"
+
+# ------ Member ------
+
+MEMBER_SELECT = """SELECT CustomerID, Email, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints
+               FROM CustomerEmail JOIN MemberInfo USING(Email)"""
+
+MEMBER_BY_ID = MEMBER_SELECT + " WHERE CustomerID = %s"
+MEMBER_BY_EMAIL = MEMBER_SELECT + " WHERE Email = %s"
+INSERT_CUSTOMER_EMAIL = """INSERT INTO CustomerEmail (Email, CustomerName, HomeAddr, ActivateStatus, StaffIDSendsNotice, RewardPoints)
+                           VALUES (%s, %s, %s, %s, %s, %s)"""
+INSERT_MEMBER = "INSERT INTO MemberInfo (CustomerID, Email) VALUES (%s, %s)"
+MEMBER_EMAIL_OF = "SELECT Email FROM MemberInfo WHERE CustomerID = %s"
+UPDATE_MEMBER = """UPDATE CustomerEmail
+                   SET HomeAddr = %s, ActivateStatus = %s, StaffIDSendsNotice = %s, RewardPoints = %s
+                   WHERE Email = %s"""
+DELETE_MEMBER_BY_ID = "DELETE FROM MemberInfo WHERE CustomerID = %s"
+DELETE_MEMBER_BY_EMAIL = "DELETE FROM MemberInfo WHERE Email = %s"
+DELETE_CUSTOMER_EMAIL = "DELETE FROM CustomerEmail WHERE Email = %s"
+
+# ------ Staff ------
+
+STAFF_SELECT = """SELECT StaffID, StaffIDHasStore, StaffName, Age, HomeAddr,
+               JobTitle, Email, TimeOfEmployment, NumberOfSignUps
+               FROM StaffEmails JOIN StaffInfo USING(Email)"""
+
+STAFF_BY_ID = STAFF_SELECT + " WHERE StaffID = %s"
+STAFF_BY_EMAIL = STAFF_SELECT + " WHERE Email = %s"
+INSERT_STAFF_EMAIL = """INSERT INTO StaffEmails (StaffIDHasStore, StaffName, Age, HomeAddr,
+                        JobTitle, Email, TimeOfEmployment, NumberOfSignUps)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+INSERT_STAFF = "INSERT INTO StaffInfo (StaffID, Email) VALUES (%s, %s)"
+UPDATE_STAFF = """UPDATE StaffEmails
+                  SET StaffIDHasStore=%s, StaffName=%s, Age=%s, HomeAddr=%s,
+                  JobTitle=%s, TimeOfEmployment=%s, NumberOfSignUps=%s
+                  WHERE Email=%s"""
+DELETE_STAFF_BY_ID = "DELETE FROM StaffInfo WHERE StaffID = %s"
+DELETE_STAFF_BY_EMAIL = "DELETE FROM StaffInfo WHERE Email = %s"
+DELETE_STAFF_EMAIL = "DELETE FROM StaffEmails WHERE Email = %s"
+
+# ------ Discount ------
+
+INSERT_DISCOUNT = "INSERT INTO DiscountInfo (DiscountDesc, ValidDate, ProductID) VALUES (%s, %s, %s)"
+DISCOUNTS_OF = "SELECT * FROM DiscountInfo WHERE ProductID = %s"
+UPDATE_DISCOUNT = "UPDATE DiscountInfo SET DiscountDesc = %s, ValidDate = %s WHERE ProductID = %s"
+DELETE_DISCOUNT = "DELETE FROM DiscountInfo WHERE ProductID = %s"
+
+# ------ Inventory ------
+
+# The guard is part of the UPDATE, so the check and the write are one atomic step
+GUARDED_STOCK_CHANGE = """UPDATE ProductQuantity SET InstockQuantity = InstockQuantity + %s
+                          WHERE ProductID = %s AND StoreID = %s AND InstockQuantity + %s >= 0"""
+STOCK_UPSERT = """INSERT INTO ProductQuantity (ProductID, StoreID, InstockQuantity) VALUES (%s, %s, %s)
+                  ON DUPLICATE KEY UPDATE InstockQuantity = InstockQuantity + VALUES(InstockQuantity)"""
+STOCK_OF = "SELECT InstockQuantity FROM ProductQuantity WHERE ProductID = %s AND StoreID = %s"
+STOCK_OF_FOR_UPDATE = STOCK_OF + " FOR UPDATE"
+
+# ------ Checkout ------
+
+INSERT_TRANSACTION = """INSERT INTO TransactionInfo (TransactionID, PurchaseDate, TotalPrice, CustomerIDHasATransaction, StoreID)
+                        VALUES (%s, %s, %s, %s, %s)"""
+# For databases whose TransactionInfo has no StoreID column (the original schema)
+INSERT_TRANSACTION_NO_STORE = """INSERT INTO TransactionInfo (TransactionID, PurchaseDate, TotalPrice, CustomerIDHasATransaction)
+                                 VALUES (%s, %s, %s, %s)"""
+ADD_REWARD_POINTS = """UPDATE CustomerEmail JOIN MemberInfo USING(Email)
+                       SET RewardPoints = RewardPoints + %s WHERE CustomerID = %s"""
+
+
+# ------ Registry ------
+
+# Name -> SQL of every fixed statement above (the *_SELECT fragments take no parameters and are not run alone)
+REGISTRY = {name: value for name, value in list(globals().items())
+            if name.isupper() and isinstance(value, str) and "%s" in value}
+
+
+# ------ Builders ------
+
+# Most rows a keyset page may ask for
+MAX_PAGE_SIZE = 500
+
+
+def store_filter_query(store_id=None, store_addr=None):
+    '''
+    Returns (SQL, params) for the stores matching a StoreID and/or exact address (all when both are empty)
+    '''
+    query = STORE_SELECT + " WHERE 1=1"
+    params = []
+    if store_id:
+        query += " AND Store.StoreID = %s"
+        params.append(store_id)
+    if store_addr:
+        query += " AND Store.StoreAddr = %s"
+        params.append(store_addr)
+    return query, tuple(params)
+
+
+def like_pattern(text, match):
+    '''
+    Returns a LIKE pattern matching text literally at the start ("prefix") or anywhere ("contains")
+    '''
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if match == "prefix":
+        return escaped + "%"
+    if match == "contains":
+        return "%" + escaped + "%"
+    raise ValueError("match must be 'prefix' or 'contains'")
+
+
+def keyset_query(select, key, columns, text, match, after, page_size):
+    '''
+    Builds one page of a keyset (seek) paginated search
+
+    The page starts right after the key of the previous page's last row, so the server seeks
+    straight to it through the primary key instead of counting past skipped rows as OFFSET would;
+    page 1000 costs the same as page 1.
+
+    Parameters:
+        select - SELECT ... FROM ... whose first column is key
+        key - Primary key column the pages are ordered by
+        columns - Columns matched against text
+        text - Search text (None or empty to list everything)
+        match - "prefix" or "contains"
+        after - Key of the last row of the previous page, None for the first page
+        page_size - Rows per page (1 to MAX_PAGE_SIZE)
+
+    Returns:
+        (SQL, params); the page is full, and another may follow, when it has page_size rows
+    '''
+    page_size = int(page_size)
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    conditions, params = [], []
+    if after is not None:
+        conditions.append(f"{key} > %s")
+        params.append(after)
+    if text:
+        pattern = like_pattern(text, match)
+        conditions.append("(" + " OR ".join(f"{column} LIKE %s" for column in columns) + ")")
+        params.extend([pattern] * len(columns))
+    query = select
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {key} LIMIT %s"
+    params.append(page_size)
+    return query, tuple(params)
+
+
+# Keyset search definitions: select, key, matched columns
+STORE_SEARCH = (STORE_SELECT, "Store.StoreID", ["Store.StoreAddr"])
+MEMBER_SEARCH = (MEMBER_SELECT, "CustomerID", ["CustomerName", "Email", "HomeAddr"])
+STAFF_SEARCH = (STAFF_SELECT, "StaffID", ["StaffName", "Email", "HomeAddr"])
+
+
+def involves_insert(count):
+    '''
+    Returns the INSERT of count Involves rows in one statement; parameters are (TransactionID, ProductID) pairs
+    '''
+    return "INSERT INTO Involves (TransactionID, ProductID) VALUES " + ", ".join(["(%s, %s)"] * count)
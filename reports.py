@@ -0,0 +1,398 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to define the MuskieCo business reports in one place
+
+Each report has a name, the SQL it runs, the parameters it needs and how a row is printed.
+generate_report in apis.py (interactive) and the batch runner (batch.py) both run reports from here,
+and export.py writes any of them to CSV, Arrow or Parquet. The billing listings (final prices,
+transaction totals) are reports too, so they can be exported and bundled the same way.
+
+Independent reports can also be run together as a bundle: each report gets its own pooled
+connection on a worker thread, so the bundle takes about as long as its slowest report.
+
+Usage:
+    python reports.py --all --start 2024-01-01 --end 2024-12-31
+    python reports.py daily_sales store_inventory --json bundle.json
+    python reports.py sales --granularity week --days 90 --store-id 3
+    python reports.py --all --snapshot muskieco.duckdb
+    python reports.py customer_spend --start 2020-01-01 --end 2024-12-31 --archived
+'''
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import mysql.connector
+
+from pricing import DISCOUNT_FACTOR, FINAL_PRICES, TRANSACTION_TOTALS
+from rollups import parse_date, refresh_sales_rollups, sales_query
+from streaming import print_query, stream_query, STREAM_BATCH_SIZE
+
+
+class Report:
+    '''
+    One report definition
+
+    Attributes:
+        name - Identifier used by the batch runner
+        title - Menu title
+        query - SQL text, or a function taking the parameters by name and returning (SQL, params)
+        params - Names of the parameters the query needs, in placeholder order
+        options - Names of optional parameters (passed to a query function, None when not given)
+        columns - Result column names
+        formatter - Function turning a row into a printable line
+        uses_rollup - True if the report reads the sales rollup (refreshed before running)
+    '''
+
+    def __init__(self, name, title, query, columns, formatter, params=(), options=(), uses_rollup=False):
+        self.name = name
+        self.title = title
+        self.query = query
+        self.columns = columns
+        self.formatter = formatter
+        self.params = params
+        self.options = options
+        self.uses_rollup = uses_rollup
+
+    def bind(self, values):
+        '''
+        Returns the query parameters in placeholder order
+
+        Parameters:
+            values - Dictionary of parameter name -> value
+
+        Returns:
+            Tuple of parameters (raises ValueError if one is missing)
+        '''
+        missing = [p for p in self.params if values.get(p) in (None, "")]
+        if missing:
+            raise ValueError(f"Report {self.name} needs: {', '.join(missing)}")
+        return tuple(values[p] for p in self.params)
+
+    def prepare(self, values):
+        '''
+        Returns the SQL and parameters to run for the given values
+
+        Parameters:
+            values - Dictionary of parameter name -> value; empty strings count as not given
+
+        Returns:
+            (SQL, params)
+        '''
+        params = self.bind(values)
+        if callable(self.query):
+            names = list(self.params) + list(self.options)
+            return self.query(**{name: values.get(name) if values.get(name) != "" else None for name in names})
+        return self.query, params
+
+    def refresh_rollup(self, cursor, values):
+        '''
+        Brings the rollup this report reads up to date (no-op for other reports)
+        '''
+        if self.uses_rollup:
+            refresh_sales_rollups(cursor, per_store=values.get("store_id") not in (None, ""))
+
+
+REPORTS = {}
+
+
+def _register(report):
+    REPORTS[report.name] = report
+
+
+# Optional parameters of the sales reports: half-open range [start, end), last N days, one store
+SALES_OPTIONS = ("start", "end", "days", "store_id")
+
+
+def _fixed_sales(granularity):
+    def query(start=None, end=None, days=None, store_id=None):
+        return sales_query(granularity, start, end, store_id, days, labels=True)
+    return query
+
+
+_register(Report(
+    "daily_sales", "Daily Sales", _fixed_sales("day"), ["Date", "TotalSales"],
+    lambda row: f"Date: {row[0]}, Sales: ${row[1]:.2f}",
+    options=SALES_OPTIONS, uses_rollup=True,
+))
+
+_register(Report(
+    "monthly_sales", "Monthly Sales", _fixed_sales("month"), ["Year", "Month", "TotalSales"],
+    lambda row: f"{row[0]}-{row[1]:02}: ${row[2]:.2f}",
+    options=SALES_OPTIONS, uses_rollup=True,
+))
+
+_register(Report(
+    "yearly_sales", "Yearly Sales", _fixed_sales("year"), ["Year", "TotalSales"],
+    lambda row: f"{row[0]}: ${row[1]:.2f}",
+    options=SALES_OPTIONS, uses_rollup=True,
+))
+
+_register(Report(
+    "sales", "Sales by Period",
+    lambda granularity=None, **values: sales_query(granularity or "day", **values),
+    ["PeriodStart", "TotalSales", "TransactionCount"],
+    lambda row: f"{row[0]}: ${row[1]:.2f} ({row[2]} transactions)",
+    options=SALES_OPTIONS + ("granularity",), uses_rollup=True,
+))
+
+_register(Report(
+    "store_inventory", "Store Inventory Report", """
+        SELECT S.StoreID, S.StoreAddr, PQ.ProductID, MI.ProductName, PQ.InstockQuantity
+        FROM Store S
+        INNER JOIN ProductQuantity PQ ON S.StoreID = PQ.StoreID
+        INNER JOIN MerchandiseInfo MI ON PQ.ProductID = MI.ProductID
+        ORDER BY S.StoreID, MI.ProductName
+    """, ["StoreID", "StoreAddr", "ProductID", "ProductName", "InstockQuantity"],
+    lambda row: f"StoreID: {row[0]}, Addr: {row[1]}, ProductID: {row[2]}, Name: {row[3]}, InStock: {row[4]}",
+))
+
+_register(Report(
+    "product_stock", "Stock by Product ID", """
+        SELECT PQ.ProductID, MI.ProductName, S.StoreID, S.StoreAddr, PQ.InstockQuantity
+        FROM ProductQuantity PQ
+        INNER JOIN MerchandiseInfo MI ON PQ.ProductID = MI.ProductID
+        INNER JOIN Store S ON PQ.StoreID = S.StoreID
+        WHERE MI.ProductID = %s
+    """, ["ProductID", "ProductName", "StoreID", "StoreAddr", "InstockQuantity"],
+    lambda row: f"ProductID: {row[0]}, Name: {row[1]}, StoreID: {row[2]}, Addr: {row[3]}, InStock: {row[4]}",
+    params=("product_id",),
+))
+
+CUSTOMER_SPEND = """
+    SELECT C.CustomerID, CE.CustomerName, SUM(T.TotalPrice) AS TotalSpent
+    FROM CustomerIDs C
+    INNER JOIN TransactionInfo T ON C.CustomerID = T.CustomerIDHasATransaction
+    INNER JOIN MemberInfo M ON C.CustomerID = M.CustomerID
+    INNER JOIN CustomerEmail CE ON M.Email = CE.Email
+    WHERE T.PurchaseDate >= %s AND T.PurchaseDate < %s
+    GROUP BY C.CustomerID, CE.CustomerName
+    ORDER BY TotalSpent DESC
+"""
+
+# The same report over live transactions plus the per-day spend archive.py kept of moved ones
+CUSTOMER_SPEND_ARCHIVED = """
+    SELECT C.CustomerID, CE.CustomerName, SUM(S.Spent) AS TotalSpent
+    FROM CustomerIDs C
+    INNER JOIN (
+        SELECT CustomerIDHasATransaction AS CustomerID, TotalPrice AS Spent
+        FROM TransactionInfo WHERE PurchaseDate >= %s AND PurchaseDate < %s
+        UNION ALL
+        SELECT CustomerID, TotalSpent FROM ArchivedCustomerSpend WHERE SpendDate >= %s AND SpendDate < %s
+    ) S ON C.CustomerID = S.CustomerID
+    INNER JOIN MemberInfo M ON C.CustomerID = M.CustomerID
+    INNER JOIN CustomerEmail CE ON M.Email = CE.Email
+    GROUP BY C.CustomerID, CE.CustomerName
+    ORDER BY TotalSpent DESC
+"""
+
+
+def _customer_spend(start=None, end=None, archived=None):
+    # end is included; compared as the half-open range [start, end + 1 day) on the bare column,
+    # so MySQL can prune a partitioned TransactionInfo (see partitions.py) to the range's months
+    start = parse_date(start, "start")
+    after = parse_date(end, "end") + timedelta(days=1)
+    if archived:
+        return CUSTOMER_SPEND_ARCHIVED, (start, after, start, after)
+    return CUSTOMER_SPEND, (start, after)
+
+
+_register(Report(
+    "customer_spend", "Customer Spend in Date Range", _customer_spend,
+    ["CustomerID", "CustomerName", "TotalSpent"],
+    lambda row: f"CustomerID: {row[0]}, Name: {row[1]}, Total Spent: ${row[2]:.2f}",
+    params=("start", "end"), options=("archived",),
+))
+
+# ------ Billing listings ------
+
+_register(Report(
+    "final_prices", "Final Prices", lambda: (FINAL_PRICES, (DISCOUNT_FACTOR,)),
+    ["TransactionID", "ProductID", "FinalPrice"],
+    lambda row: f"TransactionID: {row[0]}, ProductID: {row[1]}, Final Price: ${row[2]:.2f}",
+))
+
+_register(Report(
+    "transaction_totals", "Transaction Totals", lambda: (TRANSACTION_TOTALS, (DISCOUNT_FACTOR,)),
+    ["TransactionID", "Subtotal", "Discount", "Total"],
+    lambda row: f"TransactionID: {row[0]}, Subtotal: ${row[1]:.2f}, Discount: ${row[2]:.2f}, Total: ${row[3]:.2f}",
+))
+
+
+def get_report(name):
+    if name not in REPORTS:
+        raise ValueError(f"Unknown report {name!r}; choose from {', '.join(REPORTS)}")
+    return REPORTS[name]
+
+
+def stream_report(cursor, name, refresh=True, batch_size=STREAM_BATCH_SIZE, stats=None, **values):
+    '''
+    Runs a report and streams its rows
+
+    Parameters:
+        cursor - Active MySQL cursor
+        name - Report name (key of REPORTS)
+        refresh - Bring the sales rollup up to date first (rollup reports only)
+        batch_size - Rows fetched per round trip
+        stats - Optional StreamStats
+        values - Report parameters (product_id, start, end, days, store_id, granularity, archived)
+
+    Returns:
+        Generator of row tuples
+    '''
+    report = get_report(name)
+    query, params = report.prepare(values)
+    if refresh:
+        report.refresh_rollup(cursor, values)
+    return stream_query(cursor, query, params, batch_size, stats)
+
+
+def print_report(cursor, name, **values):
+    '''
+    Runs a report and prints its rows as they arrive
+
+    Returns:
+        StreamStats for the listing
+    '''
+    report = get_report(name)
+    query, params = report.prepare(values)
+    # Sales reports read the daily rollup; bring it up to date with the newest transactions first
+    report.refresh_rollup(cursor, values)
+    return print_query(cursor, query, params, formatter=report.formatter)
+
+
+# ------ Report bundles ------
+
+# Reports run by "all": the morning set, everything except the single-product lookup
+DEFAULT_BUNDLE = ["daily_sales", "monthly_sales", "yearly_sales", "store_inventory", "customer_spend"]
+
+
+def _run_one(pool, name, values):
+    started = time.perf_counter()
+    try:
+        with pool.session() as cursor:
+            rows = list(stream_report(cursor, name, refresh=False, **values))
+        return {"rows": rows, "elapsed": time.perf_counter() - started, "error": None}
+    except (mysql.connector.Error, ValueError) as e:
+        return {"rows": [], "elapsed": time.perf_counter() - started, "error": str(e)}
+
+
+def run_report_bundle(pool, names=None, workers=None, overrides=None, **values):
+    '''
+    Runs several reports concurrently, one pooled connection per worker thread
+
+    The sales rollup is refreshed once up front instead of once per sales report
+
+    Parameters:
+        pool - ConnectionPool
+        names - Report names (DEFAULT_BUNDLE when None)
+        workers - Worker threads (defaults to one per report, capped at the pool size)
+        overrides - Dictionary report name -> parameters that replace the shared ones for that
+                    report (e.g. a customer_spend range next to the sales reports' range)
+        values - Report parameters shared by the bundle (product_id, start, end, days, store_id)
+
+    Returns:
+        Dictionary with "reports" (name -> columns, rows, elapsed, error, in the requested
+        order) and "elapsed" (wall time of the whole bundle)
+    '''
+    names = list(names or DEFAULT_BUNDLE)
+    reports = [get_report(name) for name in names]
+    values_of = {name: {**values, **(overrides or {}).get(name, {})} for name in names}
+    workers = workers or min(len(names), pool.pool_size)
+
+    started = time.perf_counter()
+    rollup = next((report for report in reports if report.uses_rollup), None)
+    if rollup is not None:
+        with pool.session() as cursor:
+            rollup.refresh_rollup(cursor, values_of[rollup.name])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(_run_one, pool, name, values_of[name]) for name in names}
+        results = {}
+        for report in reports:
+            result = futures[report.name].result()
+            result["columns"] = report.columns
+            results[report.name] = result
+
+    return {"reports": results, "elapsed": time.perf_counter() - started}
+
+
+def print_bundle(bundle):
+    '''
+    Prints every report of a bundle followed by its timing
+    '''
+    for name, result in bundle["reports"].items():
+        report = REPORTS[name]
+        print(f"\n--- {report.title} ---")
+        if result["error"]:
+            print(f"Failed: {result['error']}")
+        for row in result["rows"]:
+            print(report.formatter(row))
+        print(f"-- {len(result['rows'])} rows in {result['elapsed'] * 1000:.1f} ms")
+
+    slowest = max((r["elapsed"] for r in bundle["reports"].values()), default=0.0)
+    serial = sum(r["elapsed"] for r in bundle["reports"].values())
+    print(f"\nBundle finished in {bundle['elapsed'] * 1000:.1f} ms "
+          f"(slowest report {slowest * 1000:.1f} ms, sum of reports {serial * 1000:.1f} ms)")
+
+
+def _json_value(value):
+    return value if isinstance(value, (int, float, str, type(None))) else str(value)
+
+
+def main(argv=None):
+    from backends import open_pool
+
+    parser = argparse.ArgumentParser(description="Run MuskieCo reports concurrently as one bundle")
+    parser.add_argument("names", nargs="*", help=f"Reports to run ({', '.join(REPORTS)})")
+    parser.add_argument("--all", action="store_true", help=f"Run {', '.join(DEFAULT_BUNDLE)}")
+    parser.add_argument("--start", help="Start date (YYYY-MM-DD); sales reports start here, customer_spend too")
+    parser.add_argument("--end", help="End date (YYYY-MM-DD); excluded by the sales reports, included by customer_spend")
+    parser.add_argument("--days", type=int, help="Sales reports cover the last DAYS days (overrides --start)")
+    parser.add_argument("--store-id", type=int, help="Sales reports for one store only")
+    parser.add_argument("--granularity", choices=["day", "week", "month", "year"], help="Period of the sales report")
+    parser.add_argument("--product-id", help="Product for product_stock")
+    parser.add_argument("--archived", action="store_true",
+                        help="customer_spend also counts transactions moved out by archive.py")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--json", help="Write the bundle to this JSON file instead of printing it")
+    parser.add_argument("--snapshot", help="Run on this DuckDB/SQLite snapshot instead of MySQL (see backends.py)")
+    args = parser.parse_args(argv)
+    if not args.names and not args.all:
+        parser.error("name at least one report or pass --all")
+
+    names = args.names or DEFAULT_BUNDLE
+    try:
+        pool = open_pool(args.snapshot, pool_size=args.workers or len(names))
+    except (ValueError, RuntimeError) as e:
+        print(e)
+        return 1
+    try:
+        bundle = run_report_bundle(pool, names, args.workers, start=args.start, end=args.end,
+                                   days=args.days, store_id=args.store_id, granularity=args.granularity,
+                                   product_id=args.product_id, archived=args.archived)
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "elapsed": bundle["elapsed"],
+                "reports": {name: {"columns": r["columns"], "elapsed": r["elapsed"], "error": r["error"],
+                                   "rows": [[_json_value(v) for v in row] for row in r["rows"]]}
+                            for name, r in bundle["reports"].items()},
+            }, f, indent=2)
+    else:
+        print_bundle(bundle)
+    return 1 if any(r["error"] for r in bundle["reports"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to pay out member reward points and staff sign-up bonuses in runs
+
+A run walks the member or staff table by Email as a chunked job (see jobs.py). Each chunk is
+one short transaction that:
+    1. Writes one RewardPayout row per qualifying member (reward notice) or staff member (check)
+       of the chunk with a single INSERT ... SELECT, the amount priced by the RewardRate table
+    2. Subtracts exactly the units it paid from the same rows with a single UPDATE ... JOIN
+When every chunk is done the run's totals are recorded in RewardRun.
+
+The INSERT ... SELECT locks the rows it pays, so points or sign-ups added meanwhile wait for
+the chunk and are then added on top of the reduced balance; nothing is paid twice or lost,
+unlike listing everything and then resetting the whole table. An interrupted run is resumed
+by the next run of the same kind.
+
+RewardRate holds tiers per kind: a row with MinUnits m pays RatePerUnit for every unit of a
+balance of at least m (up to the next tier). Balances below the lowest tier are not paid.
+
+This file:
+    1. Creates RewardRate (seeded with the old fixed rates), RewardRun and RewardPayout
+    2. Previews payouts, runs them, and prints a run's notices or checks
+    3. Command line interface for rates, previews and runs
+
+Usage:
+    python rewards.py preview member
+    python rewards.py run staff
+    python rewards.py show 12
+    python rewards.py rates --set staff 10 7.50
+'''
+
+import argparse
+import sys
+from decimal import Decimal
+
+import mysql.connector
+
+from cache import LOOKUP_CACHE
+from jobs import DEFAULT_CHUNK, add_throttle_options, key_range, run_chunked, throttle_from_args
+from streaming import print_query
+
+# Kind -> (table, name column, balance column, extra condition on the table's rows S)
+KINDS = {
+    "member": ("CustomerEmail", "CustomerName", "RewardPoints",
+               "EXISTS (SELECT 1 FROM MemberInfo M WHERE M.Email = S.Email)"),
+    "staff": ("StaffEmails", "StaffName", "NumberOfSignUps", "1=1"),
+}
+
+# Rates created with the tables: a reward point is worth one cent, a sign-up pays $5
+DEFAULT_RATES = [
+    ("member", 1, Decimal("0.01")),
+    ("staff", 1, Decimal("5.00")),
+]
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS RewardRate (
+        Kind VARCHAR(16) NOT NULL,
+        MinUnits INT NOT NULL,
+        RatePerUnit DECIMAL(10, 2) NOT NULL,
+        PRIMARY KEY (Kind, MinUnits)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS RewardRun (
+        RunID BIGINT AUTO_INCREMENT PRIMARY KEY,
+        Kind VARCHAR(16) NOT NULL,
+        StartedAt DATETIME NOT NULL,
+        Payees INT NOT NULL DEFAULT 0,
+        TotalUnits BIGINT NOT NULL DEFAULT 0,
+        TotalAmount DECIMAL(15, 2) NOT NULL DEFAULT 0,
+        FinishedAt DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS RewardPayout (
+        RunID BIGINT NOT NULL,
+        Email VARCHAR(255) NOT NULL,
+        PayeeName VARCHAR(255) NULL,
+        Units INT NOT NULL,
+        Amount DECIMAL(12, 2) NOT NULL,
+        PRIMARY KEY (RunID, Email)
+    )
+    """,
+]
+
+# The tiers of one kind with the start of the next tier, so each balance joins exactly one tier
+RATE_TIERS = """
+    SELECT MinUnits, LEAD(MinUnits) OVER (ORDER BY MinUnits) AS NextMin, RatePerUnit
+    FROM RewardRate WHERE Kind = %s
+"""
+
+_tables_ready = False
+
+
+def ensure_reward_tables(cursor):
+    '''
+    Creates the reward tables and default rates if they do not exist yet (once per process)
+    '''
+    global _tables_ready
+    if _tables_ready:
+        return
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+    cursor.execute("SELECT COUNT(*) FROM RewardRate")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany("INSERT IGNORE INTO RewardRate (Kind, MinUnits, RatePerUnit) VALUES (%s, %s, %s)",
+                           DEFAULT_RATES)
+    cursor.execute("COMMIT")
+    _tables_ready = True
+
+
+def payout_query(kind, condition="1=1"):
+    '''
+    Returns the query listing what a run of kind would pay
+
+    Parameters:
+        kind - "member" or "staff"
+        condition - Extra SQL condition on the paid rows S
+
+    Returns:
+        SQL whose first parameter is kind (then those of condition); rows are (Email, name, units, amount)
+    '''
+    if kind not in KINDS:
+        raise ValueError(f"Unknown reward kind {kind!r}; choose from {', '.join(KINDS)}")
+    table, name, units, kind_condition = KINDS[kind]
+    return f"""
+        SELECT S.Email, S.{name}, S.{units}, ROUND(S.{units} * R.RatePerUnit, 2)
+        FROM {table} S
+        JOIN ({RATE_TIERS}) R ON S.{units} >= R.MinUnits AND (R.NextMin IS NULL OR S.{units} < R.NextMin)
+        WHERE S.{units} > 0 AND {kind_condition} AND {condition}
+    """
+
+
+def _open_run(cursor, kind):
+    cursor.execute("SELECT RunID FROM RewardRun WHERE Kind = %s AND FinishedAt IS NULL ORDER BY RunID DESC LIMIT 1",
+                   (kind,))
+    row = cursor.fetchone()
+    if row:
+        return row[0]
+    cursor.execute("INSERT INTO RewardRun (Kind, StartedAt) VALUES (%s, NOW())", (kind,))
+    run_id = cursor.lastrowid
+    cursor.execute("COMMIT")
+    return run_id
+
+
+def run_rewards(cursor, kind, chunk=DEFAULT_CHUNK, throttle=None):
+    '''
+    Pays every qualifying member or staff member and takes the paid units off their balance,
+    one committed chunk of rows at a time; continues the last run of kind if it was interrupted
+
+    Parameters:
+        cursor - Active MySQL cursor
+        kind - "member" (reward notices) or "staff" (sign-up checks)
+        chunk - Rows per chunk transaction
+        throttle - Optional jobs.Throttle applied between chunks
+
+    Returns:
+        Dictionary with run_id, payees, units, amount and resumed
+    '''
+    payout_query(kind)
+    table, _, units, _ = KINDS[kind]
+    ensure_reward_tables(cursor)
+    run_id = _open_run(cursor, kind)
+
+    def pay(cursor, low, high):
+        condition, params = key_range("S.Email", low, high)
+        cursor.execute(f"INSERT INTO RewardPayout (RunID, Email, PayeeName, Units, Amount) "
+                       f"SELECT %s, P.* FROM ({payout_query(kind, condition)}) P", (run_id, kind, *params))
+        paid = cursor.rowcount
+        cursor.execute(f"""
+            UPDATE {table} S JOIN RewardPayout P ON P.RunID = %s AND P.Email = S.Email
+            SET S.{units} = S.{units} - P.Units
+            WHERE {condition}
+        """, (run_id, *params))
+        return paid
+
+    LOOKUP_CACHE.write_all(kind)
+    job = run_chunked(cursor, f"reward_run_{run_id}", table, "Email", pay, chunk, throttle)
+
+    cursor.execute("""
+        UPDATE RewardRun R
+        JOIN (SELECT COUNT(*) AS Payees, COALESCE(SUM(Units), 0) AS TotalUnits,
+                     COALESCE(SUM(Amount), 0) AS TotalAmount
+              FROM RewardPayout WHERE RunID = %s) T
+        SET R.Payees = T.Payees, R.TotalUnits = T.TotalUnits, R.TotalAmount = T.TotalAmount,
+            R.FinishedAt = NOW()
+        WHERE R.RunID = %s
+    """, (run_id, run_id))
+    cursor.execute("SELECT Payees, TotalUnits, TotalAmount FROM RewardRun WHERE RunID = %s", (run_id,))
+    payees, total_units, amount = cursor.fetchone()
+    cursor.execute("COMMIT")
+    return {"run_id": run_id, "payees": payees, "units": total_units, "amount": amount, "resumed": job["resumed"]}
+
+
+def print_preview(cursor, kind):
+    '''
+    Prints what a run of kind would pay right now, without changing anything
+    '''
+    ensure_reward_tables(cursor)
+    label = "Reward Points" if kind == "member" else "Sign-ups"
+    print_query(cursor, payout_query(kind) + " ORDER BY S.Email", (kind,),
+                formatter=lambda row: f"Name: {row[1]}, Email: {row[0]}, {label}: {row[2]}, Reward: ${row[3]:.2f}",
+                empty_message="No one qualifies for a reward.")
+
+
+def print_run(cursor, run_id):
+    '''
+    Prints the notices or checks of one run
+    '''
+    ensure_reward_tables(cursor)
+    print_query(cursor, """
+        SELECT Email, PayeeName, Units, Amount FROM RewardPayout WHERE RunID = %s ORDER BY Email
+    """, (run_id,), formatter=lambda row: f"Pay to: {row[1]}, Email: {row[0]}, Units: {row[2]}, Amount: ${row[3]:.2f}",
+        empty_message=f"Run {run_id} paid no one.")
+
+
+def set_rate(cursor, kind, min_units, rate):
+    '''
+    Adds or changes the tier of kind starting at min_units
+    '''
+    if kind not in KINDS:
+        raise ValueError(f"Unknown reward kind {kind!r}; choose from {', '.join(KINDS)}")
+    ensure_reward_tables(cursor)
+    cursor.execute("""
+        INSERT INTO RewardRate (Kind, MinUnits, RatePerUnit) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE RatePerUnit = VALUES(RatePerUnit)
+    """, (kind, min_units, rate))
+
+
+def print_summary(summary, kind):
+    what = "reward notices" if kind == "member" else "checks"
+    resumed = " (resumed)" if summary.get("resumed") else ""
+    print(f"Run {summary['run_id']}{resumed}: {summary['payees']} {what}, {summary['units']} units, "
+          f"${summary['amount']:.2f} in total.")
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Pay MuskieCo member rewards and staff sign-up bonuses")
+    commands = parser.add_subparsers(dest="command", required=True)
+    preview = commands.add_parser("preview", help="List what a run would pay")
+    preview.add_argument("kind", choices=list(KINDS))
+    run = commands.add_parser("run", help="Pay and take the paid units off the balances")
+    run.add_argument("kind", choices=list(KINDS))
+    # A run is always continued, never restarted: its paid rows already had their balance reduced
+    add_throttle_options(run, restart=False)
+    show = commands.add_parser("show", help="List the notices or checks of a run")
+    show.add_argument("run_id", type=int)
+    rates = commands.add_parser("rates", help="List the rate tiers, or change one")
+    rates.add_argument("--set", nargs=3, metavar=("KIND", "MIN_UNITS", "RATE"))
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            if args.command == "preview":
+                print_preview(cursor, args.kind)
+            elif args.command == "run":
+                throttle, replica = throttle_from_args(args)
+                try:
+                    summary = run_rewards(cursor, args.kind, args.chunk, throttle)
+                finally:
+                    if replica is not None:
+                        replica.close()
+                print_summary(summary, args.kind)
+                print(f"Print them with: python rewards.py show {summary['run_id']}")
+            elif args.command == "show":
+                print_run(cursor, args.run_id)
+            else:
+                if args.set:
+                    kind, min_units, rate = args.set
+                    set_rate(cursor, kind, int(min_units), Decimal(rate))
+                ensure_reward_tables(cursor)
+                print_query(cursor, "SELECT Kind, MinUnits, RatePerUnit FROM RewardRate ORDER BY Kind, MinUnits",
+                            formatter=lambda row: f"{row[0]}: from {row[1]} units, ${row[2]:.2f} per unit")
+    except ValueError as e:
+        print(e)
+        return 1
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
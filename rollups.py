@@ -0,0 +1,477 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to maintain pre-aggregated sales tables for the sales reports
+
+The daily, monthly and yearly sales reports used to scan and group all of TransactionInfo on
+every call. They now read DailySalesRollup, which holds one row per day and is kept current by an
+incremental refresh that only aggregates transactions newer than a stored watermark
+(the highest TransactionID already rolled up). Monthly and yearly totals are summed from the
+daily rows, so report cost depends on the number of days, not the number of transactions.
+
+TransactionIDs do not commit in order: checkout.py hands out blocks of them per process and
+per group commit, so a lower ID can commit after a higher one has been rolled up. Every
+TransactionID at or below the watermark that was missing when its chunk was rolled up is
+recorded as a gap (RollupGap), and each refresh first rolls up the gap rows that have appeared
+since. A gap still empty after GAP_RETENTION_HOURS is dropped: checkout.py never keeps a block
+of IDs longer than ID_BLOCK_MAX_AGE, so by then its IDs were skipped, not delayed.
+
+This file:
+    1. Creates the rollup tables (DailySalesRollup, optional DailyStoreSalesRollup, RollupWatermark,
+       RollupGap)
+    2. Refreshes them incrementally in bounded TransactionID chunks, catching late commits up
+    3. Verifies them against a full recompute, and rebuilds them from scratch when needed
+    4. Builds the sales report queries, with half-open date ranges, a store filter and a granularity
+
+Rows changed or deleted in TransactionInfo after being rolled up are not picked up by a refresh;
+run verify to detect that and rebuild to repair it. Transactions moved to TransactionArchive by
+archive.py are not deletions: verify and rebuild count them.
+
+Usage:
+    python rollups.py refresh [--per-store]
+    python rollups.py verify [--per-store]
+    python rollups.py rebuild [--per-store]
+'''
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+# Highest number of TransactionIDs aggregated per refresh transaction
+REFRESH_CHUNK = 100000
+
+# Hours a gap of missing TransactionIDs is watched for late commits (see checkout.ID_BLOCK_MAX_AGE)
+GAP_RETENTION_HOURS = 24
+
+# Most late TransactionIDs rolled up per statement
+GAP_BATCH = 1000
+
+# Column of TransactionInfo that holds the store a sale was made at (per-store rollup only)
+STORE_COLUMN = "StoreID"
+
+DAILY = "daily_sales"
+DAILY_STORE = "daily_store_sales"
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS DailySalesRollup (
+        SalesDate DATE PRIMARY KEY,
+        TotalSales DECIMAL(15, 2) NOT NULL,
+        TransactionCount INT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS DailyStoreSalesRollup (
+        SalesDate DATE NOT NULL,
+        StoreID INT NOT NULL,
+        TotalSales DECIMAL(15, 2) NOT NULL,
+        TransactionCount INT NOT NULL,
+        PRIMARY KEY (SalesDate, StoreID),
+        KEY (StoreID, SalesDate)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS RollupWatermark (
+        RollupName VARCHAR(64) PRIMARY KEY,
+        LastTransactionID BIGINT NOT NULL,
+        RefreshedAt DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS RollupGap (
+        RollupName VARCHAR(64) NOT NULL,
+        LowID BIGINT NOT NULL,
+        HighID BIGINT NOT NULL,
+        FoundAt DATETIME NOT NULL,
+        PRIMARY KEY (RollupName, LowID)
+    )
+    """,
+]
+
+# Excludes the TransactionIDs of a rollup's open gaps (rows committed after their chunk was rolled up)
+NOT_IN_GAP = """NOT EXISTS (SELECT 1 FROM RollupGap G
+                            WHERE G.RollupName = %s AND TransactionID BETWEEN G.LowID AND G.HighID)"""
+
+# Per rollup: target table, grouping columns in TransactionInfo, matching rollup columns
+ROLLUPS = {
+    DAILY: ("DailySalesRollup", ["PurchaseDate"], ["SalesDate"]),
+    DAILY_STORE: ("DailyStoreSalesRollup", ["PurchaseDate", STORE_COLUMN], ["SalesDate", "StoreID"]),
+}
+
+_tables_ready = False
+
+
+def ensure_rollup_tables(cursor):
+    '''
+    Creates the rollup tables if they do not exist yet (once per process)
+    '''
+    global _tables_ready
+    if _tables_ready:
+        return
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+    _tables_ready = True
+
+
+def _rollup_names(per_store):
+    return [DAILY, DAILY_STORE] if per_store else [DAILY]
+
+
+def _missing(low, ids):
+    '''
+    Returns the (first, last) ranges of IDs after low, up to the last of ids (sorted), that are not in ids
+    '''
+    ranges = []
+    previous = low
+    for transaction_id in ids:
+        if transaction_id > previous + 1:
+            ranges.append((previous + 1, transaction_id - 1))
+        previous = transaction_id
+    return ranges
+
+
+def _aggregate(table, source_cols, target_cols, where):
+    return f"""
+        INSERT INTO {table} ({", ".join(target_cols)}, TotalSales, TransactionCount)
+        SELECT {", ".join(source_cols)}, SUM(TotalPrice), COUNT(*)
+        FROM TransactionInfo
+        WHERE {where}
+        GROUP BY {", ".join(source_cols)}
+        ON DUPLICATE KEY UPDATE TotalSales = TotalSales + VALUES(TotalSales),
+                                TransactionCount = TransactionCount + VALUES(TransactionCount)
+    """
+
+
+def _lock_watermark(cursor, name):
+    cursor.execute("INSERT IGNORE INTO RollupWatermark (RollupName, LastTransactionID) VALUES (%s, 0)", (name,))
+    # Locking the watermark row serializes concurrent refreshers of the same rollup
+    cursor.execute("SELECT LastTransactionID FROM RollupWatermark WHERE RollupName = %s FOR UPDATE", (name,))
+    return cursor.fetchone()[0]
+
+
+def _fill_gaps(cursor, name):
+    '''
+    Rolls up the rows that appeared in the rollup's gaps and shrinks the gaps around them (no commit)
+
+    Returns:
+        Number of late transactions rolled up
+    '''
+    table, source_cols, target_cols = ROLLUPS[name]
+    cursor.execute("DELETE FROM RollupGap WHERE RollupName = %s AND FoundAt < %s",
+                   (name, datetime.now() - timedelta(hours=GAP_RETENTION_HOURS)))
+    cursor.execute("""
+        SELECT G.LowID, G.HighID, G.FoundAt, T.TransactionID
+        FROM RollupGap G JOIN TransactionInfo T ON T.TransactionID BETWEEN G.LowID AND G.HighID
+        WHERE G.RollupName = %s
+        ORDER BY T.TransactionID
+    """, (name,))
+    gaps = {}
+    for low_id, high_id, found_at, transaction_id in cursor.fetchall():
+        gaps.setdefault((low_id, high_id, found_at), []).append(transaction_id)
+    late = [transaction_id for ids in gaps.values() for transaction_id in ids]
+
+    for i in range(0, len(late), GAP_BATCH):
+        batch = late[i:i + GAP_BATCH]
+        cursor.execute(_aggregate(table, source_cols, target_cols,
+                                  f"TransactionID IN ({', '.join(['%s'] * len(batch))})"), batch)
+    for (low_id, high_id, found_at), ids in gaps.items():
+        cursor.execute("DELETE FROM RollupGap WHERE RollupName = %s AND LowID = %s", (name, low_id))
+        for first, last in _missing(low_id - 1, ids + [high_id + 1]):
+            cursor.execute("INSERT INTO RollupGap (RollupName, LowID, HighID, FoundAt) VALUES (%s, %s, %s, %s)",
+                           (name, first, last, found_at))
+    return len(late)
+
+
+def _refresh_one(cursor, name, chunk):
+    table, source_cols, target_cols = ROLLUPS[name]
+    applied = 0
+
+    cursor.execute("START TRANSACTION")
+    try:
+        _lock_watermark(cursor, name)
+        _fill_gaps(cursor, name)
+        cursor.execute("COMMIT")
+    except mysql.connector.Error:
+        cursor.execute("ROLLBACK")
+        raise
+
+    while True:
+        cursor.execute("START TRANSACTION")
+        try:
+            low = _lock_watermark(cursor, name)
+            cursor.execute("SELECT TransactionID FROM TransactionInfo WHERE TransactionID > %s AND TransactionID <= %s "
+                           "ORDER BY TransactionID", (low, low + chunk))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                # Nothing in this chunk of IDs; skip ahead to the next recorded one, if any
+                cursor.execute("SELECT MIN(TransactionID) FROM TransactionInfo WHERE TransactionID > %s",
+                               (low + chunk,))
+                following = cursor.fetchone()[0]
+                if following is None:
+                    cursor.execute("COMMIT")
+                    return applied
+                ids = [following]
+            high = ids[-1]
+
+            # Recorded before the insert below, which leaves the gaps out: a row committing in
+            # between is then rolled up by a later refresh, never twice
+            for first, last in _missing(low, ids):
+                cursor.execute("INSERT INTO RollupGap (RollupName, LowID, HighID, FoundAt) VALUES (%s, %s, %s, NOW())",
+                               (name, first, last))
+            cursor.execute(_aggregate(table, source_cols, target_cols,
+                                      f"TransactionID > %s AND TransactionID <= %s AND {NOT_IN_GAP}"),
+                           (low, high, name))
+            cursor.execute("UPDATE RollupWatermark SET LastTransactionID = %s, RefreshedAt = NOW() "
+                           "WHERE RollupName = %s", (high, name))
+            cursor.execute("COMMIT")
+        except mysql.connector.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        applied += 1
+
+
+def refresh_sales_rollups(cursor, per_store=False, chunk=REFRESH_CHUNK):
+    '''
+    Rolls up every transaction newer than the stored watermark, and the late ones that have
+    appeared in its gaps
+
+    Work is split into transactions covering at most chunk TransactionIDs, so the first
+    refresh over a long history does not hold one huge transaction open
+
+    Parameters:
+        cursor - Active MySQL cursor
+        per_store - Also refresh DailyStoreSalesRollup
+        chunk - TransactionIDs per refresh transaction
+
+    Returns:
+        Number of chunks applied
+    '''
+    ensure_rollup_tables(cursor)
+    return sum(_refresh_one(cursor, name, chunk) for name in _rollup_names(per_store))
+
+
+def rebuild_sales_rollups(cursor, per_store=False):
+    '''
+    Empties the rollups and recomputes them from all of TransactionInfo (and TransactionArchive,
+    see archive.py)
+
+    Parameters:
+        cursor - Active MySQL cursor
+        per_store - Also rebuild DailyStoreSalesRollup
+
+    Returns:
+        Number of chunks applied
+    '''
+    from archive import archive_exists
+
+    ensure_rollup_tables(cursor)
+    archived = archive_exists(cursor)
+    for name in _rollup_names(per_store):
+        table, source_cols, target_cols = ROLLUPS[name]
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute("DELETE FROM RollupWatermark WHERE RollupName = %s", (name,))
+        cursor.execute("DELETE FROM RollupGap WHERE RollupName = %s", (name,))
+        if archived:
+            # Archived transactions left TransactionInfo, so the refresh below would not see them
+            cursor.execute(f"""
+                INSERT INTO {table} ({", ".join(target_cols)}, TotalSales, TransactionCount)
+                SELECT {", ".join(source_cols)}, SUM(TotalPrice), COUNT(*)
+                FROM TransactionArchive
+                GROUP BY {", ".join(source_cols)}
+            """)
+        cursor.execute("COMMIT")
+    return refresh_sales_rollups(cursor, per_store)
+
+
+def verify_sales_rollups(cursor, per_store=False):
+    '''
+    Compares the rollups with a full recompute over the transactions they claim to cover, live
+    and archived (see archive.py): those at or below the watermark and outside its gaps
+
+    The rollup (one row per day) is loaded into memory and the recompute is streamed against it
+
+    Parameters:
+        cursor - Active MySQL cursor
+        per_store - Also verify DailyStoreSalesRollup
+
+    Returns:
+        List of (rollup name, key, rollup (total, count), recomputed (total, count)) mismatches
+    '''
+    from archive import archive_exists, archived_transactions_source
+
+    ensure_rollup_tables(cursor)
+    archived = archive_exists(cursor)
+    mismatches = []
+    for name in _rollup_names(per_store):
+        table, source_cols, target_cols = ROLLUPS[name]
+        cursor.execute("SELECT LastTransactionID FROM RollupWatermark WHERE RollupName = %s", (name,))
+        row = cursor.fetchone()
+        watermark = row[0] if row else 0
+        width = len(target_cols)
+
+        cursor.execute(f"SELECT {', '.join(target_cols)}, TotalSales, TransactionCount FROM {table} "
+                       f"ORDER BY {', '.join(target_cols)}")
+        rolled = {tuple(r[:width]): (r[width], r[width + 1]) for r in cursor.fetchall()}
+
+        source = (archived_transactions_source(cursor, source_cols + ["TotalPrice", "TransactionID"]) if archived
+                  else "TransactionInfo")
+        cursor.execute(f"""
+            SELECT {", ".join(source_cols)}, SUM(TotalPrice), COUNT(*)
+            FROM {source}
+            WHERE TransactionID <= %s AND {NOT_IN_GAP}
+            GROUP BY {", ".join(source_cols)}
+        """, (watermark, name))
+        while True:
+            batch = cursor.fetchmany(1000)
+            if not batch:
+                break
+            for r in batch:
+                key = tuple(r[:width])
+                expected = (r[width], r[width + 1])
+                actual = rolled.pop(key, None)
+                if actual != expected:
+                    mismatches.append((name, key, actual, expected))
+        mismatches.extend((name, key, actual, None) for key, actual in rolled.items())
+    return mismatches
+
+
+# ------ Report queries ------
+
+# Sources the sales queries can read: (table, per-store table, date column, sales, transaction count)
+SALES_SOURCES = {
+    "rollup": ("DailySalesRollup", "DailyStoreSalesRollup", "SalesDate",
+               "SUM(TotalSales)", "SUM(TransactionCount)"),
+    "transactions": ("TransactionInfo", "TransactionInfo", "PurchaseDate", "SUM(TotalPrice)", "COUNT(*)"),
+}
+
+# Granularity -> first day of the period a date falls in ({day} is the date column as a DATE);
+# plain function calls only, so the embedded engines of backends.py can supply the same functions
+PERIOD_START = {
+    "day": "{day}",
+    "week": "SUBDATE({day}, WEEKDAY({day}))",
+    "month": "SUBDATE({day}, DAYOFMONTH({day}) - 1)",
+    "year": "MAKEDATE(YEAR({day}), 1)",
+}
+
+# Granularity -> period columns of the fixed daily/monthly/yearly reports
+PERIOD_LABELS = {
+    "day": "{day}",
+    "week": "SUBDATE({day}, WEEKDAY({day}))",
+    "month": "YEAR({day}), MONTH({day})",
+    "year": "YEAR({day})",
+}
+
+
+def parse_date(value, name):
+    '''
+    Returns value (a date or YYYY-MM-DD text) as a date, None for None; ValueError names the parameter
+    '''
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD), got {value!r}")
+
+
+def sales_query(granularity="day", start=None, end=None, store_id=None, days=None,
+                source="rollup", labels=False, table=None):
+    '''
+    Builds a sales-by-period query restricted to a date range
+
+    The range is the half-open interval [start, end), written as plain comparisons on the date
+    column so the primary key of the rollup (or an index on TransactionInfo.PurchaseDate) can
+    limit the read to the rows inside the range. Never wrap the date column in a function in
+    the WHERE clause; that forces a scan of all history.
+
+    Parameters:
+        granularity - day, week, month or year
+        start - First date included (date or YYYY-MM-DD), None for no lower bound
+        end - First date excluded, None for no upper bound
+        store_id - Only this store (reads DailyStoreSalesRollup for the rollup source)
+        days - Shortcut for the last days days including today; overrides start
+        source - "rollup" (default) or "transactions" to aggregate TransactionInfo directly
+        labels - Label periods like the fixed reports (Date / Year, Month / Year) instead of
+                 by the first day of the period, and leave out the transaction count
+        table - Read this table instead of the source's own (benchmarks)
+
+    Returns:
+        (SQL, params)
+    '''
+    if granularity not in PERIOD_START:
+        raise ValueError(f"granularity must be one of {', '.join(PERIOD_START)}")
+    if source not in SALES_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SALES_SOURCES)}")
+    if days is not None:
+        days = int(days)
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        start = date.today() - timedelta(days=days - 1)
+    start = parse_date(start, "start")
+    end = parse_date(end, "end")
+
+    all_stores, one_store, column, sales, count = SALES_SOURCES[source]
+    table = table or (one_store if store_id is not None else all_stores)
+    # SalesDate is already a DATE; grouping on the bare column lets the rollup's primary key supply the order
+    day = column if source == "rollup" else f"DATE({column})"
+    period = (PERIOD_LABELS if labels else PERIOD_START)[granularity].format(day=day)
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} < %s")
+        params.append(end)
+    if store_id is not None:
+        conditions.append(f"{STORE_COLUMN if source == 'transactions' else 'StoreID'} = %s")
+        params.append(int(store_id))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    totals = f"{sales} AS TotalSales" if labels else f"{sales} AS TotalSales, {count} AS TransactionCount"
+
+    query = f"""
+        SELECT {period}, {totals}
+        FROM {table}
+        {where}
+        GROUP BY {period}
+        ORDER BY {period}
+    """
+    return query, tuple(params)
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="Maintain the MuskieCo sales rollup tables")
+    parser.add_argument("command", choices=["refresh", "verify", "rebuild"])
+    parser.add_argument("--per-store", action="store_true",
+                        help=f"Include DailyStoreSalesRollup (needs TransactionInfo.{STORE_COLUMN})")
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            if args.command == "refresh":
+                print(f"Applied {refresh_sales_rollups(cursor, args.per_store)} chunk(s).")
+            elif args.command == "rebuild":
+                print(f"Rebuilt from {rebuild_sales_rollups(cursor, args.per_store)} chunk(s).")
+            else:
+                mismatches = verify_sales_rollups(cursor, args.per_store)
+                for name, key, actual, expected in mismatches[:50]:
+                    print(f"{name} {key}: rollup {actual}, recomputed {expected}")
+                if mismatches:
+                    print(f"{len(mismatches)} mismatching row(s); run 'python rollups.py rebuild' to repair.")
+                    return 1
+                print("Rollups match a full recompute.")
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
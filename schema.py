@@ -0,0 +1,292 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to create and check the indexes behind every lookup the MuskieCo APIs make
+
+This file:
+    1. Holds versioned, idempotent migrations; applied versions are recorded in SchemaMigrations
+    2. Only creates an index when no existing index (primary key included) already starts with
+       the same columns, so running a migration twice, or against a database that already has
+       the index under another name, changes nothing
+    3. Runs EXPLAIN on every query the APIs issue and flags full table scans, full index scans,
+       filesorts and temporary tables
+
+Usage:
+    python schema.py migrate
+    python schema.py status
+    python schema.py advise
+'''
+
+import argparse
+import sys
+
+import mysql.connector
+
+
+class Index:
+    '''
+    An index a query path needs
+
+    Parameters:
+        table - Table name
+        name - Index name used when it has to be created
+        columns - Indexed columns, in order
+        unique - Create a UNIQUE index
+        reason - The API access path the index serves
+    '''
+
+    def __init__(self, table, name, columns, unique=False, reason=""):
+        self.table = table
+        self.name = name
+        self.columns = columns
+        self.unique = unique
+        self.reason = reason
+
+
+# (version, description, indexes); never edit an applied migration, add a new one instead
+MIGRATIONS = [
+    (1, "Indexes for the API access paths", [
+        Index("MemberInfo", "idx_memberinfo_email", ["Email"],
+              reason="CustomerEmail JOIN MemberInfo USING(Email), member delete by email"),
+        Index("CustomerEmail", "idx_customeremail_email", ["Email"], unique=True,
+              reason="member lookups and updates by email"),
+        Index("StaffInfo", "idx_staffinfo_email", ["Email"],
+              reason="StaffEmails JOIN StaffInfo USING(Email), staff delete by email"),
+        Index("StaffEmails", "idx_staffemails_email", ["Email"], unique=True,
+              reason="staff updates by email"),
+        Index("Store", "idx_store_storeaddr", ["StoreAddr"],
+              reason="store search by address, Store JOIN StoreAddress"),
+        Index("ProductQuantity", "uq_productquantity_product_store", ["ProductID", "StoreID"], unique=True,
+              reason="inventory upserts (ON DUPLICATE KEY) and stock by product"),
+        Index("ProductQuantity", "idx_productquantity_store", ["StoreID"],
+              reason="store inventory report"),
+        Index("DiscountInfo", "idx_discountinfo_product_validdate", ["ProductID", "ValidDate"],
+              reason="discount lookups by product, currently valid discounts"),
+        Index("TransactionInfo", "idx_transactioninfo_purchasedate", ["PurchaseDate"],
+              reason="sales reports by date"),
+        Index("TransactionInfo", "idx_transactioninfo_customer_date", ["CustomerIDHasATransaction", "PurchaseDate"],
+              reason="customer spend report"),
+        Index("Involves", "idx_involves_transaction_product", ["TransactionID", "ProductID"],
+              reason="transaction totals by TransactionID"),
+        Index("Involves", "idx_involves_product", ["ProductID"],
+              reason="pricing joins by ProductID"),
+    ]),
+]
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS SchemaMigrations (
+        Version INT PRIMARY KEY,
+        Description VARCHAR(255) NOT NULL,
+        AppliedAt DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+# ------ Migrations ------
+
+def existing_indexes(cursor, table):
+    '''
+    Returns the indexes of a table in the current database
+
+    Returns:
+        Dictionary of index name -> (list of columns in order, unique flag)
+    '''
+    cursor.execute("""
+        SELECT INDEX_NAME, COLUMN_NAME, NON_UNIQUE
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY INDEX_NAME, SEQ_IN_INDEX
+    """, (table,))
+    indexes = {}
+    for name, column, non_unique in cursor.fetchall():
+        columns, _ = indexes.get(name, ([], not non_unique))
+        columns.append(column)
+        indexes[name] = (columns, not non_unique)
+    return indexes
+
+
+def covering_index(cursor, index):
+    '''
+    Returns the name of an existing index that already serves index (same leading columns,
+    and unique on exactly those columns when uniqueness is required), or None
+    '''
+    wanted = [c.lower() for c in index.columns]
+    for name, (columns, unique) in existing_indexes(cursor, index.table).items():
+        columns = [c.lower() for c in columns]
+        if index.unique:
+            if unique and columns == wanted:
+                return name
+        elif columns[:len(wanted)] == wanted:
+            return name
+    return None
+
+
+def ensure_index(cursor, index):
+    '''
+    Creates index unless an equivalent one exists
+
+    Returns:
+        True if an index was created
+    '''
+    if covering_index(cursor, index):
+        return False
+    kind = "UNIQUE INDEX" if index.unique else "INDEX"
+    cursor.execute(f"CREATE {kind} {index.name} ON {index.table} ({', '.join(index.columns)})")
+    return True
+
+
+def applied_versions(cursor):
+    cursor.execute(CREATE_MIGRATIONS_TABLE)
+    cursor.execute("SELECT Version FROM SchemaMigrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def migrate(cursor, report=print):
+    '''
+    Applies every migration not yet recorded in SchemaMigrations
+
+    Parameters:
+        cursor - Active MySQL cursor
+        report - Function called with one line per index (None to stay quiet)
+
+    Returns:
+        List of versions applied
+    '''
+    done = applied_versions(cursor)
+    applied = []
+    for version, description, indexes in MIGRATIONS:
+        if version in done:
+            continue
+        for index in indexes:
+            created = ensure_index(cursor, index)
+            if report:
+                state = "created" if created else f"exists as {covering_index(cursor, index)}"
+                report(f"  v{version} {index.table}({', '.join(index.columns)}): {state}")
+        cursor.execute("INSERT INTO SchemaMigrations (Version, Description) VALUES (%s, %s)",
+                       (version, description))
+        cursor.execute("COMMIT")
+        applied.append(version)
+    return applied
+
+
+# ------ Advisor ------
+
+def api_queries():
+    '''
+    Returns every query the APIs issue, with sample parameters for EXPLAIN
+
+    Returns:
+        List of (label, SQL, params)
+    '''
+    import queries
+    from pricing import ACTIVE_DISCOUNTS, DISCOUNT_FACTOR, totals_query
+    from reports import REPORTS
+    from rewards import payout_query
+
+    sample = {"product_id": 1, "start": "2024-01-01", "end": "2024-02-01"}
+    email = "a@example.com"
+    address = "1 Main St"
+    catalog = [
+        ("search_store (by id)", queries.STORE_BY_ID, (1,)),
+        ("search_store (by address)", queries.store_filter_query(store_addr=address)[0], (address,)),
+        ("search_store (page)", *queries.keyset_query(*queries.STORE_SEARCH, "1 Ma", "prefix", 100, 20)),
+        ("update_store", queries.STORE_ADDRESS_OF, (1,)),
+        ("update_store (address in use)", queries.STORES_AT_ADDRESS, (address,)),
+        ("search_member (by id)", queries.MEMBER_BY_ID, (1,)),
+        ("search_member (by email)", queries.MEMBER_BY_EMAIL, (email,)),
+        ("search_member (page)", *queries.keyset_query(*queries.MEMBER_SEARCH, "a@ex", "prefix", 100, 20)),
+        ("update_member", queries.MEMBER_EMAIL_OF, (1,)),
+        ("delete_member (by email)", queries.DELETE_MEMBER_BY_EMAIL, (email,)),
+        ("search_staff (by id)", queries.STAFF_BY_ID, (1,)),
+        ("search_staff (by email)", queries.STAFF_BY_EMAIL, (email,)),
+        ("delete_staff (by email)", queries.DELETE_STAFF_BY_EMAIL, (email,)),
+        ("search_discount", queries.DISCOUNTS_OF, (1,)),
+        ("update_inventory", queries.STOCK_OF, (1, 1)),
+        ("active discounts", ACTIVE_DISCOUNTS, ()),
+        ("transaction totals", totals_query(2), (DISCOUNT_FACTOR, 1, 2)),
+        ("view_customer_rewards", payout_query("member"), ("member",)),
+        ("view_staff_signups", payout_query("staff"), ("staff",)),
+    ]
+    for report in REPORTS.values():
+        query, params = report.prepare(sample)
+        catalog.append((f"report {report.name}", query, params))
+    return catalog
+
+
+def _flags(row):
+    flags = []
+    access = (row.get("type") or "").upper()
+    extra = row.get("Extra") or ""
+    if access == "ALL":
+        flags.append("full table scan")
+    elif access == "INDEX":
+        flags.append("full index scan")
+    if "filesort" in extra:
+        flags.append("filesort")
+    if "temporary" in extra:
+        flags.append("temporary table")
+    return flags
+
+
+def advise(cursor, queries=None):
+    '''
+    Runs EXPLAIN on every API query and collects the problems
+
+    Parameters:
+        cursor - Active MySQL cursor
+        queries - List of (label, SQL, params); api_queries() by default
+
+    Returns:
+        List of (label, table, rows estimate, list of flags, key used); queries whose plan
+        looks fine are left out. A failing EXPLAIN is reported with table None.
+    '''
+    findings = []
+    for label, query, params in queries or api_queries():
+        try:
+            cursor.execute("EXPLAIN " + query, params)
+            columns = [d[0] for d in cursor.description]
+            plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        except mysql.connector.Error as e:
+            findings.append((label, None, None, [f"EXPLAIN failed: {e.msg}"], None))
+            continue
+        for row in plan:
+            flags = _flags(row)
+            if flags:
+                findings.append((label, row.get("table"), row.get("rows"), flags, row.get("key")))
+    return findings
+
+
+def main(argv=None):
+    from db_pool import pool_from_env
+
+    parser = argparse.ArgumentParser(description="MuskieCo schema migrations and index advisor")
+    parser.add_argument("command", choices=["migrate", "status", "advise"])
+    args = parser.parse_args(argv)
+
+    pool = pool_from_env(pool_size=1)
+    try:
+        with pool.session() as cursor:
+            if args.command == "migrate":
+                applied = migrate(cursor)
+                print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+            elif args.command == "status":
+                done = applied_versions(cursor)
+                for version, description, _ in MIGRATIONS:
+                    print(f"v{version} {'applied' if version in done else 'pending'}: {description}")
+            else:
+                findings = advise(cursor)
+                for label, table, rows, flags, key in findings:
+                    print(f"{label}: {table} ~{rows} rows, {', '.join(flags)} (key: {key})")
+                if not findings:
+                    print("No full scans or filesorts in the API queries.")
+                return 1 if findings else 0
+    except mysql.connector.Error as e:
+        print(f"Database error: {e}")
+        return 1
+    finally:
+        pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+'''
+Authors: Carter Lange, Julian-Brito Hanley, Lance Silliman, Evan Gunnulfusen
+
+The purpose of this file is to stream query results out of MySQL in bounded batches
+
+Instead of calling cursor.fetchall() and holding the whole result set in memory, rows are pulled
+from an unbuffered (server-side) cursor with fetchmany() and handed to the caller as they arrive,
+so memory stays flat no matter how large TransactionInfo or Involves grow.
+'''
+
+import time
+
+# Number of rows pulled from the server per fetchmany() call
+STREAM_BATCH_SIZE = 500
+
+# Print time-to-first-row and throughput after each streamed listing
+SHOW_STREAM_STATS = True
+
+
+class StreamStats:
+    '''
+    Timing information collected while streaming a result set
+
+    Attributes:
+        started - perf_counter() value when the query was sent
+        first_row_at - perf_counter() value when the first row arrived (None if no rows)
+        finished_at - perf_counter() value when the last batch was read
+        rows - Number of rows streamed
+    '''
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.first_row_at = None
+        self.finished_at = None
+        self.rows = 0
+
+    @property
+    def time_to_first_row(self):
+        if self.first_row_at is None:
+            return None
+        return self.first_row_at - self.started
+
+    @property
+    def elapsed(self):
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        '''
+        Returns a one-line, human readable summary of the stream
+        '''
+        if self.rows == 0:
+            return f"-- 0 rows in {self.elapsed * 1000:.1f} ms"
+        return (f"-- {self.rows} rows, first row after {self.time_to_first_row * 1000:.1f} ms, "
+                f"{self.rows_per_second:.0f} rows/s")
+
+
+def stream_batches(cursor, batch_size=STREAM_BATCH_SIZE, stats=None):
+    '''
+    Yields the rows of the last executed query as lists of at most batch_size rows
+
+    If the consumer stops early, the remaining rows are drained (without being kept) so the
+    unbuffered cursor can be reused for the next statement
+
+    Parameters:
+        cursor - Cursor that has just executed a SELECT
+        batch_size - Maximum number of rows held in memory at once
+        stats - Optional StreamStats that is updated as rows arrive
+
+    Returns:
+        Generator of lists of row tuples
+    '''
+    done = False
+    try:
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                done = True
+                break
+            if stats is not None:
+                if stats.first_row_at is None:
+                    stats.first_row_at = time.perf_counter()
+                stats.rows += len(batch)
+            yield batch
+    finally:
+        if not done:
+            while cursor.fetchmany(batch_size):
+                pass
+        if stats is not None:
+            stats.finished_at = time.perf_counter()
+
+
+def stream_rows(cursor, batch_size=STREAM_BATCH_SIZE, stats=None):
+    '''
+    Yields the rows of the last executed query one at a time, fetched in batches of at most batch_size
+
+    Parameters:
+        cursor - Cursor that has just executed a SELECT
+        batch_size - Maximum number of rows held in memory at once
+        stats - Optional StreamStats that is updated as rows arrive
+
+    Returns:
+        Generator of row tuples
+    '''
+    batches = stream_batches(cursor, batch_size, stats)
+    try:
+        for batch in batches:
+            yield from batch
+    finally:
+        batches.close()
+
+
+def stream_query(cursor, query, params=None, batch_size=STREAM_BATCH_SIZE, stats=None):
+    '''
+    Executes a query and streams its rows
+
+    Parameters:
+        cursor - Active MySQL cursor
+        query - SQL text
+        params - Optional query parameters
+        batch_size - Maximum number of rows held in memory at once
+        stats - Optional StreamStats; its start time is reset to just before the execute
+
+    Returns:
+        Generator of row tuples
+    '''
+    if stats is not None:
+        stats.started = time.perf_counter()
+    if params is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query, params)
+    return stream_rows(cursor, batch_size, stats)
+
+
+def print_query(cursor, query, params=None, formatter=str, empty_message=None,
+                batch_size=STREAM_BATCH_SIZE):
+    '''
+    Executes a query and prints each row as soon as its batch arrives
+
+    Parameters:
+        cursor - Active MySQL cursor
+        query - SQL text
+        params - Optional query parameters
+        formatter - Function turning a row tuple into the line to print
+        empty_message - Printed when the query returns no rows (None prints nothing)
+        batch_size - Maximum number of rows held in memory at once
+
+    Returns:
+        StreamStats for the listing
+    '''
+    stats = StreamStats()
+    for row in stream_query(cursor, query, params, batch_size, stats):
+        print(formatter(row))
+
+    if stats.rows == 0 and empty_message:
+        print(empty_message)
+    elif SHOW_STREAM_STATS:
+        print(stats.summary())
+    return stats